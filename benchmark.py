@@ -0,0 +1,256 @@
+"""
+Benchmarks each stage of a rescheduling cycle against the local stand-in server.
+
+Stages: driver startup, login, appointment page, one Selenium date poll, one HTTP
+sign in, one HTTP date poll, direct booking and the datepicker booking fallback.
+Every stage is run repeatedly and reported as p50/p95/p99 latency, CPU time and
+peak RSS (of this process and the browsers it starts). Results are written as JSON
+so two versions can be compared with --compare.
+
+Usage:
+    python benchmark.py [--iterations 5] [--polls 20] [--no-browser]
+                        [--output benchmark_results.json] [--compare old.json]
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import threading
+import subprocess
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from settings import watcher
+from stand_in_server import StandInServer
+
+SAMPLE_INTERVAL = 0.05
+
+
+def percentile(values: list, fraction: float) -> float:
+    """
+    Linear interpolation percentile, e.g. percentile(values, 0.95).
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def process_tree():
+    root = psutil.Process()
+    return [root] + root.children(recursive=True)
+
+
+def tree_cpu_time() -> float:
+    """
+    Returns:
+    - float: CPU seconds used by this process and, with psutil, its running children.
+    """
+    if psutil is None:
+        return time.process_time()
+    total = 0.0
+    for process in process_tree():
+        try:
+            times = process.cpu_times()
+            total += times.user + times.system
+        except psutil.Error:
+            continue
+    return total
+
+
+def tree_rss() -> int:
+    """
+    Returns:
+    - int: Resident memory in bytes of this process and, with psutil, its children.
+    """
+    if psutil is not None:
+        total = 0
+        for process in process_tree():
+            try:
+                total += process.memory_info().rss
+            except psutil.Error:
+                continue
+        return total
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class StageRecorder:
+    """
+    Collects wall time, CPU time and peak RSS samples per stage.
+    """
+
+    def __init__(self):
+        self.samples = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        peak = [tree_rss()]
+        done = threading.Event()
+
+        def sample():
+            while not done.wait(SAMPLE_INTERVAL):
+                peak[0] = max(peak[0], tree_rss())
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        cpu_start = tree_cpu_time()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            cpu = tree_cpu_time() - cpu_start
+            done.set()
+            sampler.join()
+            peak[0] = max(peak[0], tree_rss())
+            self.samples.setdefault(name, []).append(
+                {"seconds": elapsed, "cpu_seconds": cpu, "peak_rss": peak[0]}
+            )
+
+    def summary(self) -> dict:
+        result = {}
+        for name, samples in self.samples.items():
+            seconds = [s["seconds"] for s in samples]
+            cpu = [s["cpu_seconds"] for s in samples]
+            result[name] = {
+                "runs": len(samples),
+                "p50": percentile(seconds, 0.50),
+                "p95": percentile(seconds, 0.95),
+                "p99": percentile(seconds, 0.99),
+                "mean": sum(seconds) / len(seconds),
+                "cpu_seconds_mean": sum(cpu) / len(cpu),
+                "peak_rss_mb": max(s["peak_rss"] for s in samples) / (1024 * 1024),
+            }
+        return result
+
+
+def bench_scenario(polls: int) -> dict:
+    start = date.today() + timedelta(days=30)
+    dates = [(start + timedelta(days=i)).isoformat() for i in range(max(polls, 50) * 4)]
+    return {"facilities": {"94": {"dates": dates, "times": ["08:00", "08:15", "09:30"]}}}
+
+
+def run_http_stages(recorder: StageRecorder, iterations: int, polls: int) -> None:
+    from http_session import AisSession
+    from direct_booking import direct_reschedule
+    from request_tracker import RequestTracker
+
+    for _ in range(iterations):
+        session = AisSession()
+        with recorder.stage("http_login"):
+            session.login()
+        tracker = RequestTracker(polls + 1, 3600)
+        for _ in range(polls):
+            with recorder.stage("http_poll"):
+                dates = session.get_available_dates(tracker)
+        with recorder.stage("direct_booking"):
+            direct_reschedule(session.http, session.appointment_url, date.fromisoformat(dates[0]))
+        session.close()
+
+
+def run_browser_stages(recorder: StageRecorder, iterations: int, polls: int) -> None:
+    import reschedule
+    from legacy_rescheduler import legacy_reschedule
+    from request_tracker import RequestTracker
+
+    for _ in range(iterations):
+        with recorder.stage("driver_startup"):
+            driver = reschedule.get_chrome_driver()
+        try:
+            with recorder.stage("login"):
+                reschedule.login(driver)
+            with recorder.stage("appointment_page"):
+                reschedule.get_appointment_page(driver)
+            http_session = reschedule.create_driver_http_session(driver)
+            tracker = RequestTracker(polls + 1, 3600)
+            for _ in range(polls):
+                with recorder.stage("poll"):
+                    reschedule.get_available_dates(driver, tracker, http_session)
+            http_session.close()
+            with recorder.stage("legacy_reschedule"):
+                legacy_reschedule(driver)
+        finally:
+            reschedule.quit_driver(driver)
+
+
+def git_version() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(results: dict, baseline: dict | None = None) -> None:
+    print(f"{'stage':<20}{'runs':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'cpu':>9}{'rss MB':>9}")
+    for name, stats in results["stages"].items():
+        line = (
+            f"{name:<20}{stats['runs']:>6}{stats['p50']:>9.3f}{stats['p95']:>9.3f}"
+            f"{stats['p99']:>9.3f}{stats['cpu_seconds_mean']:>9.3f}{stats['peak_rss_mb']:>9.1f}"
+        )
+        old = (baseline or {}).get("stages", {}).get(name)
+        if old and old["p50"]:
+            line += f"  p50 {100 * (stats['p50'] - old['p50']) / old['p50']:+.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rescheduler stages against the stand-in server")
+    parser.add_argument("--iterations", type=int, default=5, help="sessions per stage group")
+    parser.add_argument("--polls", type=int, default=20, help="date polls per session")
+    parser.add_argument("--no-browser", action="store_true", help="skip the Selenium stages")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="previous results file to compare against")
+    args = parser.parse_args()
+
+    server = StandInServer(scenario=bench_scenario(args.polls)).start()
+    # Points the URLs at the stand-in server without touching settings.json
+    watcher.override(dict(server.settings_overrides(), HEADLESS_MODE=True, DETACH=False, TEST_MODE=False, RATE_LIMITS_ENABLED=False))
+
+    recorder = StageRecorder()
+    try:
+        run_http_stages(recorder, args.iterations, args.polls)
+        if not args.no_browser:
+            run_browser_stages(recorder, args.iterations, args.polls)
+    finally:
+        server.stop()
+
+    results = {
+        "version": git_version(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "psutil": psutil is not None,
+        "iterations": args.iterations,
+        "polls": args.polls,
+        "stages": recorder.summary(),
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=4)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Keeps the appointment form ready to submit while the poller waits.
+
+Booking used to start from nothing once a slot was found: load the appointment
+page, read its authenticity_token, then ask for times and submit. BookingStandby
+loads the page while polling instead, and re-validates it every
+STANDBY_REFRESH_INTERVAL seconds, so a detected slot only needs the times
+request and the submit. A form older than STANDBY_MAX_AGE, or one the site
+rejects, is loaded again at booking time like before.
+
+The booking_standby_age_seconds gauge shows how old the primed form is, and
+detect_to_submit_seconds the time from detecting a slot to submitting it.
+
+The poller may refresh the form on one thread while a booking runs on another
+(runtime.py), so both go through a lock: a refresh never swaps the form or token
+out from under a booking, and is skipped while one is in progress.
+"""
+import time
+import threading
+from datetime import date
+
+import requests
+
+from direct_booking import DirectBookingError, InvalidTokenError, direct_reschedule, parse_authenticity_token
+from metrics import metrics
+from request_tracker import rate_limiter
+from settings import get_settings
+
+
+class BookingStandby:
+    """
+    The primed appointment form of one signed in session.
+    """
+
+    def __init__(self):
+        self.http_session = None
+        self.appointment_url = None
+        self.authenticity_token = None
+        self.validated_at = None
+        self.lock = threading.Lock()
+
+    def attach(self, http_session: requests.Session, appointment_url: str) -> None:
+        """
+        Follows the session the poller books with; a new session drops the primed form.
+        """
+        with self.lock:
+            if http_session is not self.http_session or appointment_url != self.appointment_url:
+                self.http_session = http_session
+                self.appointment_url = appointment_url
+                self.invalidate()
+
+    def invalidate(self) -> None:
+        self.authenticity_token = None
+        self.validated_at = None
+
+    def age(self) -> float | None:
+        """
+        Returns:
+        - float | None: Seconds since the form was last validated, None if it is not primed.
+        """
+        return time.monotonic() - self.validated_at if self.validated_at is not None else None
+
+    def refresh_if_due(self) -> None:
+        """
+        Loads the appointment form when it is not primed or due for re-validation.
+        Failures are only reported; booking then loads the form itself. Skipped while
+        a booking is in progress.
+        """
+        settings = get_settings()
+        if not settings.booking_standby or self.http_session is None:
+            return
+        if not self.lock.acquire(blocking=False):
+            # A booking is in progress and uses the form as it is
+            return
+        try:
+            age = self.age()
+            if age is not None and age < settings.standby_refresh_interval:
+                metrics.gauge("booking_standby_age_seconds", round(age, 1))
+                return
+            try:
+                with rate_limiter.request("booking"):
+                    page = self.http_session.get(self.appointment_url, timeout=settings.timeout)
+                    page.raise_for_status()
+                    self.authenticity_token = parse_authenticity_token(page.text)
+            except (requests.RequestException, DirectBookingError) as e:
+                print("Unable to prime the appointment form: ", e)
+                metrics.incr("booking_standby_refreshes_total", outcome="failed")
+                self.invalidate()
+                return
+            self.validated_at = time.monotonic()
+        finally:
+            self.lock.release()
+        metrics.incr("booking_standby_refreshes_total", outcome="ok")
+        metrics.gauge("booking_standby_age_seconds", 0)
+
+    def token(self) -> str | None:
+        """
+        Returns:
+        - str | None: The primed authenticity_token if it is fresh enough to submit with.
+        """
+        age = self.age()
+        if age is None or age > get_settings().standby_max_age:
+            return None
+        return self.authenticity_token
+
+    def book(self, slot_date: date, facility_id: str | None = None, detected_at: float | None = None) -> bool:
+        """
+        Books a date with the primed form, or with a freshly loaded one if there is none.
+
+        Parameters:
+        - slot_date (date): The date that was found by polling.
+        - facility_id (str | None): The facility the date was found at, the polled one by default.
+        - detected_at (float | None): time.monotonic() when the slot was detected.
+
+        Returns:
+        - bool: As direct_reschedule.
+
+        Raises:
+        - DirectBookingError, requests.RequestException: As direct_reschedule.
+        """
+        with self.lock:
+            token = self.token()
+            metrics.incr("booking_standby_used_total", primed="yes" if token else "no")
+            try:
+                return direct_reschedule(
+                    self.http_session, self.appointment_url, slot_date, facility_id, token, detected_at
+                )
+            except InvalidTokenError as e:
+                if token is None:
+                    raise
+                # The site no longer takes the primed token: load the form once more and retry
+                print("Primed appointment form was rejected, reloading it: ", e)
+                self.invalidate()
+                return direct_reschedule(
+                    self.http_session, self.appointment_url, slot_date, facility_id, None, detected_at
+                )
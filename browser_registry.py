@@ -0,0 +1,119 @@
+"""
+Registry of the browsers started by the rescheduler, read by supervisor.py.
+
+get_chrome_driver() records the chromedriver process, the Chrome processes under
+it and the pid of the worker that owns them; quit_driver() removes the entry. A
+browser still listed after its worker died, or one that stopped answering, is
+what the supervisor reclaims. Chrome pids are only known with psutil installed.
+
+Workers and the supervisor update the file concurrently; each update holds an
+exclusive lock on a .lock file next to it. Without fcntl (Windows) updates are
+not locked.
+"""
+import os
+import json
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from settings import get_settings
+
+
+def read_registry(path: str | None = None) -> dict:
+    """
+    Returns:
+    - dict: chromedriver pid (as a string) to its entry, empty if nothing is registered.
+    """
+    try:
+        with open(path or get_settings().browser_registry_file, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_registry(entries: dict, path: str | None = None) -> None:
+    path = path or get_settings().browser_registry_file
+    # Written to a temporary file first so a reader never sees half a file
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as f:
+        json.dump(entries, f, indent=4)
+    os.replace(temporary, path)
+
+
+@contextmanager
+def registry_lock(path: str | None = None):
+    """
+    Holds the registry lock, so read-modify-write updates of two processes cannot
+    interleave and drop each other's entries.
+    """
+    path = path or get_settings().browser_registry_file
+    if fcntl is None:
+        yield
+        return
+    with open(f"{path}.lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def register_browser(driver) -> None:
+    """
+    Records a newly started browser.
+
+    Parameters:
+    - driver (WebDriver): The driver returned by webdriver.Chrome().
+    """
+    try:
+        driver_pid = driver.service.process.pid
+        service_url = driver.service.service_url
+    except AttributeError:
+        return
+    browser_pids = []
+    if psutil is not None:
+        try:
+            browser_pids = [child.pid for child in psutil.Process(driver_pid).children(recursive=True)]
+        except psutil.Error:
+            pass
+    with registry_lock():
+        entries = read_registry()
+        entries[str(driver_pid)] = {
+            "owner": os.getpid(),
+            "started_at": time.time(),
+            "service_url": service_url,
+            "browser_pids": browser_pids,
+        }
+        write_registry(entries)
+
+
+def unregister_browser(driver) -> None:
+    """
+    Forgets a browser that was quit.
+
+    Parameters:
+    - driver (WebDriver): A driver passed to register_browser() earlier.
+    """
+    try:
+        driver_pid = driver.service.process.pid
+    except AttributeError:
+        return
+    remove_entries([driver_pid])
+
+
+def remove_entries(driver_pids: list) -> None:
+    with registry_lock():
+        entries = read_registry()
+        if any(str(pid) in entries for pid in driver_pids):
+            for pid in driver_pids:
+                entries.pop(str(pid), None)
+            write_registry(entries)
@@ -0,0 +1,102 @@
+"""
+Change detection and lazy parsing for the days JSON endpoint.
+
+Almost every poll returns the same list as the one before, yet each used to be
+decoded with response.json(), converted with strptime() and printed in full.
+DaysParser remembers the last response of a session instead:
+
+- the ETag it came with is sent back as If-None-Match, so a server that supports
+  conditional requests answers 304 with no body;
+- otherwise a body with the same hash as the last one is not parsed again;
+- a changed body is scanned for its ISO dates without decoding the JSON, and only
+  the date that decides whether to book is turned into a date object.
+
+A changed body is still scanned to the end rather than up to the first date inside
+the window: the history records every date that appears or disappears, so it needs
+the whole list. That scan only runs when the body changed, and sorting the list,
+which the site already sends in order, is a single pass.
+
+Dates are returned as ISO strings, which sort and compare like the dates they
+stand for; first_acceptable_date() picks the one to book.
+"""
+import re
+import hashlib
+from datetime import date
+
+from settings import Settings
+
+DATE_PATTERN = re.compile(rb'"date"\s*:\s*"(\d{4}-\d{2}-\d{2})"')
+
+
+class DaysParseError(ValueError):
+    """Raised when a days response is not a JSON list of dates."""
+
+
+def first_acceptable_date(dates: list, settings: Settings) -> date | None:
+    """
+    Finds the earliest acceptable date, stopping at the first date past the window.
+
+    Parameters:
+    - dates (list): ISO dates in ascending order, as returned by DaysParser.parse().
+    - settings (Settings): Supplies the acceptable window.
+
+    Returns:
+    - date | None: The date to book, or None if no date is acceptable.
+    """
+    earliest = settings.earliest_acceptable_date.isoformat() if settings.earliest_acceptable_date else ""
+    latest = settings.latest_acceptable_date.isoformat()
+    for value in dates:
+        if value > latest:
+            return None
+        if value >= earliest:
+            return date.fromisoformat(value)
+    return None
+
+
+class DaysParser:
+    """
+    Remembers the last days response of one session.
+    """
+
+    def __init__(self):
+        self.etag = None
+        self.digest = None
+        self.dates = None
+
+    def request_headers(self) -> dict:
+        """
+        Returns:
+        - dict: If-None-Match for the last ETag, empty before the first response.
+        """
+        return {"If-None-Match": self.etag} if self.etag and self.dates is not None else {}
+
+    def parse(self, status_code: int, body: bytes, etag: str | None = None) -> tuple[list, bool]:
+        """
+        Reads a 200 or 304 days response.
+
+        Parameters:
+        - status_code (int): 304 reuses the last dates.
+        - body (bytes): Raw response body.
+        - etag (str | None): The ETag header of the response, if any.
+
+        Returns:
+        - tuple[list, bool]: The ISO dates in ascending order, and whether they changed
+          since the last response.
+
+        Raises:
+        - DaysParseError: If the body is not a complete JSON list, e.g. an HTML error
+          page or a truncated response.
+        """
+        if status_code == 304 and self.dates is not None:
+            return self.dates, False
+        digest = hashlib.blake2b(body, digest_size=16).digest()
+        if digest == self.digest:
+            self.etag = etag or self.etag
+            return self.dates, False
+        if not body.lstrip().startswith(b"["):
+            raise DaysParseError("Days response is not a JSON list")
+        if not body.rstrip().endswith(b"]"):
+            raise DaysParseError("Days response is truncated")
+        dates = sorted(value.decode("ascii") for value in DATE_PATTERN.findall(body))
+        self.etag, self.digest, self.dates = etag, digest, dates
+        return dates, True
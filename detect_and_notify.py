@@ -1,34 +1,29 @@
+from __future__ import annotations
+
 import re
-import requests
-import json
+import argparse
 from datetime import datetime
 from time import sleep
+from typing import TYPE_CHECKING
+
+from history import get_history
+from http_session import AisSession
+from metrics import metrics
+from notifier import Notifier
+from payment_parser import parse_payment_date, parse_payment_page
+from profiling import enable as enable_profiling, profiled, write_reports
+from request_tracker import rate_limiter
+from reschedule import get_session_driver, login, release_session_driver
+from settings import get_settings
+from status_channel import status
+
+if TYPE_CHECKING:
+    from selenium.webdriver.chrome.webdriver import WebDriver
 
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.webdriver import WebDriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
-from webdriver_manager.chrome import ChromeDriverManager
-
-from request_tracker import RequestTracker
-from reschedule import get_chrome_driver, login
-
-# Load settings from settings.json
-def load_settings():
-    with open('settings.json', 'r') as f:
-        return json.load(f)
-
-settings = load_settings()
-EARLIEST_ACCEPTABLE_DATE = settings.get("EARLIEST_ACCEPTABLE_DATE")
-LATEST_ACCEPTABLE_DATE = settings.get("LATEST_ACCEPTABLE_DATE")
-NEW_SESSION_AFTER_FAILURES = int(settings.get("NEW_SESSION_AFTER_FAILURES", 5))
-NEW_SESSION_DELAY = int(settings.get("NEW_SESSION_DELAY", 120))
-TIMEOUT = int(settings.get("TIMEOUT", 10))
-PAYMENT_PAGE_URL = settings.get("PAYMENT_PAGE_URL")
-FAIL_RETRY_DELAY = int(settings.get("FAIL_RETRY_DELAY", 30))
+# Delivers notifications in the background, started on the first detected slot
+notifier = Notifier()
 
+@profiled("get_payment_page")
 def get_dates_from_payment_page(driver: WebDriver) -> tuple[list, list]:
     """
     Navigate to the payment page and retrieve available appointment dates and locations.
@@ -41,51 +36,72 @@ def get_dates_from_payment_page(driver: WebDriver) -> tuple[list, list]:
                - loc_str_array: List of locations
                - date_str_array: List of corresponding appointment dates
     """
-    
-    timeout = TIMEOUT
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    settings = get_settings()
+    timeout = settings.timeout
     continue_button = WebDriverWait(driver, timeout).until(
         EC.element_to_be_clickable((By.LINK_TEXT, "Continue"))
     )
     continue_button.click()
     current_url = driver.current_url
     url_id = re.search(r"/(\d+)", current_url).group(1)
-    payment_url = PAYMENT_PAGE_URL.format(id=url_id)
+    payment_url = settings.payment_page_url.format(id=url_id)
+    rate_limiter.acquire("payment")
     driver.get(payment_url)
 
-    content_table = WebDriverWait(driver, timeout).until(
+    WebDriverWait(driver, timeout).until(
         EC.visibility_of_element_located((By.CLASS_NAME, "for-layout"))
     )
-    text_elements = content_table.find_elements(By.TAG_NAME, "td")
-    loc_str_array = [e.text for i, e in enumerate(text_elements) if i % 2 == 0]
-    date_str_array = [e.text for i, e in enumerate(text_elements) if i % 2 == 1]
+    # One page_source fetch instead of a WebDriver round-trip per table cell
+    return split_locations_and_dates(parse_payment_page(driver.page_source))
+
+
+def split_locations_and_dates(pairs: list[tuple[str, str]]) -> tuple[list, list]:
+    """
+    Splits (location, date) pairs into the two lists detect_and_notify takes.
+    """
+    loc_str_array = [loc for loc, _ in pairs]
+    date_str_array = [date for _, date in pairs]
     return loc_str_array, date_str_array
 
-def detect_and_notify(loc_str_array: list, date_str_array: list) -> bool:
+def detect_and_notify(loc_str_array: list, date_str_array: list, notify=None) -> bool:
     """
     Detect available appointment slots and notify if they fall within the acceptable date range.
     
     Args:
         loc_str_array (list): List of locations.
         date_str_array (list): List of corresponding appointment dates.
+        notify (callable, optional): Called with (location, ISO date) for each acceptable
+            slot instead of the background notifier.
     
     Returns:
         bool: True if an acceptable slot is detected, False otherwise.
     """
 
-    earliest_acceptable_date = datetime.strptime(EARLIEST_ACCEPTABLE_DATE, "%Y-%m-%d").date()
-    latest_acceptable_date = datetime.strptime(LATEST_ACCEPTABLE_DATE, "%Y-%m-%d").date()
-
+    settings = get_settings()
+    history = get_history()
     detected = False
     for loc_str, date_str in zip(loc_str_array, date_str_array):
-        if date_str == "No Appointments Available":
+        date = parse_payment_date(date_str)
+        if date is None:
+            if history is not None:
+                history.record(loc_str, [], source="payment")
             continue
-        date = datetime.strptime(date_str, "%d %B, %Y").date()
+        if history is not None:
+            history.record(loc_str, [date], source="payment")
         
-        if earliest_acceptable_date <= date <= latest_acceptable_date:
-            print(f"{datetime.now().strftime('%H:%M:%S')} FOUND SLOT ON {date}, location: {loc_str}!!!, sending email...")
+        if settings.is_acceptable(date):
+            print(f"{datetime.now().strftime('%H:%M:%S')} FOUND SLOT ON {date}, location: {loc_str}!!!, sending notification...")
+            status.report("slot_found", date=date, location=loc_str)
+            metrics.incr("slots_detected_total", location=loc_str)
+            (notify or notifier.notify)(loc_str, date.isoformat())
             detected = True
         else:
             print(f"{datetime.now().strftime('%H:%M:%S')} Earliest available date is {date}, location: {loc_str}")
+        status.report("poll", outcome="ok", earliest=date, location=loc_str)
     return detected
 
 def detect_with_new_session() -> bool:
@@ -95,30 +111,73 @@ def detect_with_new_session() -> bool:
     Returns:
         bool: True if an acceptable slot is detected, False otherwise.
     """
-    driver = get_chrome_driver()
+    driver = get_session_driver()
     session_failures = 0
     detected = False
-    while session_failures < NEW_SESSION_AFTER_FAILURES:
+    while session_failures < get_settings().new_session_after_failures:
         try:
-            login(driver)
-            loc_str_array, date_str_array = get_dates_from_payment_page(driver)
+            with metrics.span("login", source="driver"):
+                login(driver)
+            with metrics.span("payment_page"):
+                loc_str_array, date_str_array = get_dates_from_payment_page(driver)
             detected = detect_and_notify(loc_str_array, date_str_array)
             break
         except Exception as e:
             print("Unable to get payment page: ", e)
+            status.report("error", message=f"Unable to get payment page: {e}")
             session_failures += 1
-            sleep(FAIL_RETRY_DELAY)
-    driver.quit()
+            sleep(get_settings().fail_retry_delay)
+    release_session_driver(driver)
+    return detected
+
+def detect_with_new_http_session() -> bool:
+    """
+    Sign in over plain HTTP, read the payment page without a browser and notify.
+
+    Returns:
+        bool: True if an acceptable slot is detected, False otherwise.
+    """
+    session = AisSession()
+    session_failures = 0
+    detected = False
+    try:
+        while session_failures < get_settings().new_session_after_failures:
+            try:
+                with metrics.span("login", source="http"):
+                    session.login()
+                with metrics.span("payment_page", source="http"):
+                    pairs = parse_payment_page(session.get_payment_page())
+                detected = detect_and_notify(*split_locations_and_dates(pairs))
+                break
+            except Exception as e:
+                print("Unable to get payment page: ", e)
+                status.report("error", message=f"Unable to get payment page: {e}")
+                session_failures += 1
+                sleep(get_settings().fail_retry_delay)
+    finally:
+        session.close()
     return detected
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch every location for an earlier date and notify")
+    parser.add_argument("--profile", metavar="DIR", help="profile the login and payment page stages into DIR")
+    args = parser.parse_args()
+    if args.profile:
+        enable_profiling(args.profile)
+
     session_count = 0
     
     while True:
         session_count += 1
         print(f"Attempting with new session #{session_count}")
-        detected = detect_with_new_session()
-        sleep(NEW_SESSION_DELAY)
+        status.report("session", number=session_count)
+        if get_settings().http_polling:
+            detected = detect_with_new_http_session()
+        else:
+            detected = detect_with_new_session()
+        metrics.flush()
+        write_reports()
+        sleep(get_settings().new_session_delay)
         if detected:
             sleep(600)
             print("Yay!!!")
\ No newline at end of file
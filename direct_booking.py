@@ -0,0 +1,169 @@
+import re
+import time
+from datetime import date
+from html import unescape
+
+import requests
+
+from metrics import metrics
+from request_tracker import rate_limiter
+from settings import get_settings
+
+AUTHENTICITY_TOKEN_PATTERN = re.compile(r'name="authenticity_token"\s+value="([^"]+)"')
+FACILITY_ID_PATTERN = re.compile(r"/days/(\d+)\.json")
+
+
+class DirectBookingError(Exception):
+    """Raised when the appointment form cannot be submitted directly."""
+
+
+class InvalidTokenError(DirectBookingError):
+    """Raised when the site rejects the authenticity_token of the submitted form."""
+
+
+def get_facility_id() -> str:
+    """
+    Returns:
+    - str: The facility id the days endpoint is polled for, e.g. "94" for Toronto.
+    """
+    return FACILITY_ID_PATTERN.search(get_settings().available_date_request_suffix).group(1)
+
+
+def report_submit(detected_at: float | None, path: str) -> None:
+    """
+    Records the time from detecting a slot to submitting its booking.
+
+    Parameters:
+    - detected_at (float | None): time.monotonic() when the slot was detected.
+    - path (str): "direct" or "legacy".
+    """
+    if detected_at is None:
+        return
+    elapsed = time.monotonic() - detected_at
+    print(f"Submitting {elapsed:.2f}s after detecting the slot")
+    metrics.gauge("detect_to_submit_seconds", round(elapsed, 3), path=path)
+    metrics.event("detect_to_submit", seconds=round(elapsed, 3), path=path)
+
+
+def parse_authenticity_token(html: str) -> str:
+    """
+    Extracts the authenticity_token hidden field of the appointment form.
+
+    Parameters:
+    - html (str): Source of the appointment page.
+
+    Returns:
+    - str: The token.
+
+    Raises:
+    - DirectBookingError: If the page has no appointment form.
+    """
+    match = AUTHENTICITY_TOKEN_PATTERN.search(html)
+    if not match:
+        raise DirectBookingError("Appointment form not found on page")
+    return unescape(match.group(1))
+
+
+def get_available_times(
+    http_session: requests.Session, appointment_url: str, slot_date: date, facility_id: str | None = None
+) -> list:
+    """
+    Retrieves the bookable times of a date from the times JSON endpoint.
+
+    Parameters:
+    - http_session (requests.Session): A signed in session.
+    - appointment_url (str): The appointment page url of the schedule.
+    - slot_date (date): The date to get times for.
+    - facility_id (str | None): The facility of the date, the polled one by default.
+
+    Returns:
+    - list: Times as "HH:MM" strings, possibly empty.
+    """
+    settings = get_settings()
+    request_url = appointment_url + settings.time_request_suffix.format(
+        facility_id=facility_id or get_facility_id(), date=slot_date.isoformat()
+    )
+    with rate_limiter.request("booking"):
+        response = http_session.get(
+            request_url,
+            headers={"X-Requested-With": "XMLHttpRequest", "Referer": appointment_url},
+            timeout=settings.timeout,
+        )
+        if response.status_code != 200:
+            raise DirectBookingError(f"Times request failed with status code {response.status_code}")
+        return response.json().get("available_times") or []
+
+
+def direct_reschedule(
+    http_session: requests.Session,
+    appointment_url: str,
+    slot_date: date,
+    facility_id: str | None = None,
+    authenticity_token: str | None = None,
+    detected_at: float | None = None,
+) -> bool:
+    """
+    Books a known date by submitting the appointment form directly, without the datepicker.
+
+    Picks the last available time of the date, like legacy_reschedule does.
+
+    Parameters:
+    - http_session (requests.Session): A signed in session.
+    - appointment_url (str): The appointment page url of the schedule.
+    - slot_date (date): The date that was found by polling.
+    - facility_id (str | None): The facility the date was found at, the polled one by default.
+    - authenticity_token (str | None): The token of an already loaded appointment form;
+      without one the page is loaded first.
+    - detected_at (float | None): time.monotonic() when the slot was detected, for the
+      detect_to_submit_seconds metric.
+
+    Returns:
+    - bool: True if the appointment was rescheduled (or would have been, in test mode),
+      False if the slot was taken by someone else.
+
+    Raises:
+    - DirectBookingError, requests.RequestException: If the form could not be submitted,
+      in which case the caller should fall back to legacy_reschedule.
+    """
+    settings = get_settings()
+    facility_id = facility_id or get_facility_id()
+    if authenticity_token is None:
+        with rate_limiter.request("booking"):
+            page = http_session.get(appointment_url, timeout=settings.timeout)
+            authenticity_token = parse_authenticity_token(page.text)
+
+    times = get_available_times(http_session, appointment_url, slot_date, facility_id)
+    if not times:
+        print(f"No times left on {slot_date}")
+        return False
+    slot_time = times[-1]
+
+    report_submit(detected_at, "direct")
+    if settings.test_mode:
+        print(f"Test mode: would reschedule to {slot_date} {slot_time}")
+        return True
+
+    with rate_limiter.request("booking"):
+        response = http_session.post(
+            appointment_url,
+            data={
+                "authenticity_token": authenticity_token,
+                "confirmed_limit_message": "1",
+                "use_consulate_appointment_capacity": "true",
+                "appointments[consulate_appointment][facility_id]": facility_id,
+                "appointments[consulate_appointment][date]": slot_date.isoformat(),
+                "appointments[consulate_appointment][time]": slot_time,
+            },
+            headers={"Referer": appointment_url},
+            timeout=settings.timeout,
+        )
+        # Rails answers a stale or foreign authenticity_token with 422
+        if response.status_code == 422:
+            raise InvalidTokenError("Reschedule request was rejected with status code 422")
+        if response.status_code != 200:
+            raise DirectBookingError(f"Reschedule request failed with status code {response.status_code}")
+    if "successfully" in response.text:
+        print(f"Successfully rescheduled to {slot_date} {slot_time}!")
+        return True
+    print("Rescheduling failed. The date may have been taken by someone else.")
+    return False
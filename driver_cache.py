@@ -0,0 +1,62 @@
+import os
+import json
+
+from settings import get_settings
+
+
+def load_cached_driver_path() -> str | None:
+    """
+    Returns:
+    - str | None: The chromedriver path resolved on an earlier run, if it still exists.
+    """
+    try:
+        with open(get_settings().driver_cache_file, 'r') as f:
+            path = json.load(f).get("driver_path")
+    except (OSError, ValueError):
+        return None
+    if path and os.path.isfile(path):
+        return path
+    return None
+
+
+def save_driver_path(path: str) -> None:
+    with open(get_settings().driver_cache_file, 'w') as f:
+        json.dump({"driver_path": path}, f, indent=4)
+
+
+def invalidate_driver_path() -> None:
+    """
+    Forgets the cached path, e.g. after Chrome was updated and the driver no longer matches.
+    """
+    try:
+        os.remove(get_settings().driver_cache_file)
+    except FileNotFoundError:
+        pass
+
+
+def get_driver_path(refresh: bool = False) -> str | None:
+    """
+    Resolves the chromedriver binary, preferring the path cached on disk.
+
+    Only when nothing is cached (or refresh is set) is webdriver_manager asked, which
+    may look up the latest version over the network.
+
+    Parameters:
+    - refresh (bool): Ignore the cache and resolve again.
+
+    Returns:
+    - str | None: The driver path, or None if it cannot be resolved (e.g. offline with
+      an empty cache), in which case Selenium's own driver lookup is used.
+    """
+    if not refresh:
+        path = load_cached_driver_path()
+        if path:
+            return path
+    try:
+        from webdriver_manager.chrome import ChromeDriverManager
+        path = ChromeDriverManager().install()
+    except Exception as e:
+        print("Unable to resolve chromedriver with webdriver_manager: ", e)
+        return load_cached_driver_path()
+    save_driver_path(path)
+    return path
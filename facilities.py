@@ -0,0 +1,34 @@
+"""
+The consulates that can be booked, by the name shown on the site.
+
+The ids are those of the facility select on the appointment page and of the
+days/{id}.json and times/{id}.json endpoints. Kept free of third-party imports so
+the GUI can load it.
+"""
+import re
+
+FACILITY_IDS = {
+    "Calgary": "89",
+    "Halifax": "90",
+    "Montreal": "91",
+    "Ottawa": "92",
+    "Quebec City": "93",
+    "Toronto": "94",
+    "Vancouver": "95",
+}
+
+DAYS_PATH_PATTERN = re.compile(r"/days/\d+\.json")
+
+
+def days_suffix(suffix: str, facility_id: str) -> str:
+    """
+    Points an AVAILABLE_DATE_REQUEST_SUFFIX at another facility, keeping its query.
+
+    Parameters:
+    - suffix (str): e.g. "/days/94.json?appointments[expedite]=false".
+    - facility_id (str): e.g. "92".
+
+    Returns:
+    - str: e.g. "/days/92.json?appointments[expedite]=false".
+    """
+    return DAYS_PATH_PATTERN.sub(f"/days/{facility_id}.json", suffix, count=1)
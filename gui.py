@@ -3,10 +3,16 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import subprocess
 import importlib
+import importlib.util
+import threading
+import queue
 import sys
 import json
 import os
 
+from facilities import FACILITY_IDS
+from status_channel import STATUS_PORT_ENV, StatusListener
+
 class SettingsGUI:
     def __init__(self, master):
         self.master = master
@@ -17,7 +23,14 @@ class SettingsGUI:
         self.dependencies = ["requests", "selenium", "webdriver_manager"]
 
         self.dev_frame_visible = False
+        self.process = None
+        self.status_listener = StatusListener()
+        # Callbacks from worker threads, run on the Tk main loop by refresh_status
+        self.ui_callbacks = queue.Queue()
         self.create_widgets()
+        self.master.after(500, self.refresh_status)
+        # Probe dependencies once the window is on screen instead of before it
+        self.master.after(100, self.probe_dependencies)
 
     def load_settings(self):
         if os.path.exists('settings.json'):
@@ -31,16 +44,25 @@ class SettingsGUI:
                 "USER_EMAIL": "",
                 "USER_PASSWORD": "",
                 "SELECTED_CITY": "Toronto",
+                "ACCEPTABLE_CITIES": [],
                 "EARLIEST_ACCEPTABLE_DATE": date_start,
                 "LATEST_ACCEPTABLE_DATE": date_end,
                 "HEADLESS_MODE": False,
                 "TEST_MODE": True,
                 "DETACH": True,
+                "HTTP_POLLING": True,
+                "REUSE_BROWSER": True,
+                "PERSIST_SESSION": True,
                 "NEW_SESSION_AFTER_FAILURES": 5,
                 "NEW_SESSION_DELAY": 120,
                 "TIMEOUT": 10,
+                "PAGE_READY_TIMEOUT": 20,
+                "TIME_SLOT_TIMEOUT": 10,
+                "BOOKING_RETRY_DELAY": 5,
                 "FAIL_RETRY_DELAY": 30,
                 "DATE_REQUEST_DELAY": 30,
+                "MIN_POLL_INTERVAL": 10,
+                "MAX_POLL_BACKOFF": 600,
                 "DATE_REQUEST_MAX_RETRY": 60,
                 "DATE_REQUEST_MAX_TIME": 30 * 60,
                 "LOGIN_URL": "https://ais.usvisa-info.com/en-ca/niv/users/sign_in",
@@ -50,16 +72,18 @@ class SettingsGUI:
             }
 
     def save_settings(self):
-    # Get settings from the GUI
-        settings = {
+    # Get settings from the GUI, keeping settings that are only set in settings.json
+        settings = dict(self.settings)
+        settings.update({
             "USER_EMAIL": self.user_email.get(),
             "USER_PASSWORD": self.user_password.get(),
             "EARLIEST_ACCEPTABLE_DATE": self.earliest_date.get(),
             "LATEST_ACCEPTABLE_DATE": self.latest_date.get(),
             "HEADLESS_MODE": self.headless_mode.get(),
             "TEST_MODE": self.test_mode.get(),
-            "SELECTED_CITY": self.selected_city.get()
-        }
+            "SELECTED_CITY": self.selected_city.get(),
+            "ACCEPTABLE_CITIES": [self.city_list.get(i) for i in self.city_list.curselection()]
+        })
 
         # Validate dates
         try:
@@ -77,17 +101,7 @@ class SettingsGUI:
         settings.update(dev_settings)
 
         # Map city to value and update the suffix
-        city_values = {
-            "Calgary": 89,
-            "Halifax": 90,
-            "Montreal": 91,
-            "Ottawa": 92,
-            "Quebec City": 93,
-            "Toronto": 94,
-            "Vancouver": 95
-        }
-
-        selected_city_value = city_values.get(self.selected_city.get(), 94)
+        selected_city_value = FACILITY_IDS.get(self.selected_city.get(), "94")
         settings["AVAILABLE_DATE_REQUEST_SUFFIX"] = f"/days/{selected_city_value}.json?appointments[expedite]=false"
     
         # Save settings to file
@@ -133,17 +147,9 @@ class SettingsGUI:
         self.dependency_buttons = {}
 
         for i, dep in enumerate(self.dependencies):
-            status = self.check_dependency(dep)
-            button_text = f"{dep}: {'Installed' if status else 'Not Installed'}"
-
-            # Create button with initial color based on status using tk.Button
-            button = tk.Button(self.dependency_buttons_frame, text=button_text, command=lambda d=dep: self.install_dependency(d))
-
-            # Set background color based on status
-            if status:
-                button.config(bg="green", fg="white")
-            else:
-                button.config(bg="gray", fg="white")
+            # The status is filled in by probe_dependencies once the window is shown
+            button = tk.Button(self.dependency_buttons_frame, text=f"{dep}: Checking...", command=lambda d=dep: self.install_dependency(d))
+            button.config(bg="gray", fg="white")
 
             button.grid(row=0, column=i, padx=5) 
 
@@ -170,26 +176,100 @@ class SettingsGUI:
 
         save_button = ttk.Button(save_start_frame, text="Save Settings", command=self.save_settings)
         start_button = ttk.Button(save_start_frame, text="Start Rescheduler", command=self.start_rescheduler)
+        stop_button = ttk.Button(save_start_frame, text="Stop", command=self.stop_rescheduler)
+        restart_button = ttk.Button(save_start_frame, text="Restart", command=self.restart_rescheduler)
 
         # Pack the buttons side by side with some padding
         save_button.pack(side="left", padx=10)
         start_button.pack(side="left", padx=10)
+        stop_button.pack(side="left", padx=10)
+        restart_button.pack(side="left", padx=10)
 
         # Center the frame in its grid cell
         save_start_frame.grid_columnconfigure(0, weight=1)
 
+        self.create_status_widgets()
+
+    def create_status_widgets(self):
+        """Creates the live status section fed by the running rescheduler."""
+        ttk.Label(self.master, text="Status", font=("TkDefaultFont", 12, "bold")).grid(row=26, column=0, columnspan=2, pady=10)
+        self.status_vars = {}
+        for i, (key, label) in enumerate([
+            ("process", "Rescheduler:"),
+            ("session", "Session:"),
+            ("last_poll", "Last poll:"),
+            ("earliest", "Earliest date seen:"),
+            ("error", "Last error:"),
+        ]):
+            ttk.Label(self.master, text=label).grid(row=27 + i, column=0, sticky="e", padx=5, pady=2)
+            var = tk.StringVar(value="Not running" if key == "process" else "-")
+            ttk.Label(self.master, textvariable=var, wraplength=300).grid(row=27 + i, column=1, sticky="w", pady=2)
+            self.status_vars[key] = var
+
+    def refresh_status(self):
+        """Applies queued status events and callbacks, then reschedules itself."""
+        while True:
+            try:
+                self.ui_callbacks.get_nowait()()
+            except queue.Empty:
+                break
+        while True:
+            try:
+                self.handle_status_event(self.status_listener.events.get_nowait())
+            except queue.Empty:
+                break
+        if self.process is not None:
+            code = self.process.poll()
+            if code is None:
+                self.status_vars["process"].set(f"Running (pid {self.process.pid})")
+            else:
+                self.status_vars["process"].set(f"Exited with code {code}")
+                self.process = None
+        self.master.after(500, self.refresh_status)
+
+    def handle_status_event(self, event):
+        when = datetime.fromtimestamp(event.get("time", 0)).strftime("%H:%M:%S")
+        kind = event.get("event")
+        if kind == "session":
+            self.status_vars["session"].set(f"#{event.get('number')} (started {when})")
+        elif kind == "poll":
+            self.status_vars["last_poll"].set(f"{when} ({event.get('outcome')})")
+            if event.get("earliest"):
+                location = f" at {event['location']}" if event.get("location") else ""
+                self.status_vars["earliest"].set(f"{event['earliest']}{location}")
+        elif kind == "session_rotated":
+            self.status_vars["session"].set(
+                f"Rotated at {when}, polled {100 * event.get('coverage', 0):.1f}% of the time"
+            )
+        elif kind == "slot_found":
+            self.status_vars["earliest"].set(f"{event.get('date')} - slot found at {when}!")
+        elif kind == "rescheduled":
+            self.status_vars["earliest"].set(f"Rescheduled to {event.get('date')} at {when}")
+        elif kind == "error":
+            self.status_vars["error"].set(f"{when} {event.get('message')}")
+
     def create_city_dropdown(self):
-        """Creates a dropdown menu for city selection."""
-        cities = ["Calgary", "Halifax", "Montreal", "Ottawa", "Quebec City", "Toronto", "Vancouver"]
+        """Creates a dropdown menu for city selection and a list of other acceptable cities."""
+        cities = list(FACILITY_IDS)
+        selected = self.settings.get("SELECTED_CITY", "Toronto")
         self.selected_city = tk.StringVar()
-        self.selected_city.set(cities[5])
+        self.selected_city.set(selected)
 
         ttk.Label(self.master, text="Select City:").grid(row=10, column=0, sticky="e", padx=5, pady=2)
 
-        city_dropdown = ttk.OptionMenu(self.master, self.selected_city, cities[5], *cities)
+        city_dropdown = ttk.OptionMenu(self.master, self.selected_city, selected, *cities)
         city_dropdown.grid(row=10, column=1, pady=2)
         city_dropdown.config(width=35, style="TMenubutton")
 
+        # Selecting cities here watches all of them through the payment page and books the first match
+        ttk.Label(self.master, text="Acceptable Cities:").grid(row=11, column=0, sticky="ne", padx=5, pady=2)
+        self.city_list = tk.Listbox(self.master, selectmode=tk.MULTIPLE, height=len(cities), exportselection=False)
+        for i, city in enumerate(cities):
+            self.city_list.insert(tk.END, city)
+            if city in self.settings.get("ACCEPTABLE_CITIES", []):
+                self.city_list.selection_set(i)
+        self.city_list.grid(row=11, column=1, pady=2)
+
     def toggle_dev_section(self):
         """Toggle visibility of developer options section."""
         if self.dev_frame_visible:
@@ -201,14 +281,27 @@ class SettingsGUI:
         self.dev_frame_visible = not self.dev_frame_visible
 
     def create_dev_widgets(self):
-        """Creates widgets for developer settings within the collapsible frame."""
+        """Creates widgets for developer settings within the collapsible frame, showing the loaded values."""
+        # Defaults for settings that are missing from settings.json
         dev_settings = {
             "DETACH": True,
+            "HTTP_POLLING": True,
+            "REUSE_BROWSER": True,
+            "PERSIST_SESSION": True,
+            "BOOKING_STANDBY": True,
+            "SESSION_ROTATION": True,
+            "METRICS_ENABLED": True,
+            "HISTORY_ENABLED": True,
             "NEW_SESSION_AFTER_FAILURES": 5,
             "NEW_SESSION_DELAY": 120,
             "TIMEOUT": 10,
+            "PAGE_READY_TIMEOUT": 20,
+            "TIME_SLOT_TIMEOUT": 10,
+            "BOOKING_RETRY_DELAY": 5,
             "FAIL_RETRY_DELAY": 30,
             "DATE_REQUEST_DELAY": 30,
+            "MIN_POLL_INTERVAL": 10,
+            "MAX_POLL_BACKOFF": 600,
             "DATE_REQUEST_MAX_RETRY": 60,
             "DATE_REQUEST_MAX_TIME": 30 * 60,
             "LOGIN_URL": "https://ais.usvisa-info.com/en-ca/niv/users/sign_in",
@@ -219,14 +312,17 @@ class SettingsGUI:
 
         self.dev_vars = {}
     
-        for i, (setting, value) in enumerate(dev_settings.items()):
+        for i, (setting, default) in enumerate(dev_settings.items()):
             ttk.Label(self.dev_frame, text=f"{setting}:").grid(row=i+1, column=0, sticky="e", padx=5, pady=2)
-            
+            value = self.settings.get(setting, default)
+
             # Choose the appropriate type of variable
-            if isinstance(value, bool):
-                var = tk.BooleanVar(value=value)
+            if isinstance(default, bool):
+                var = tk.BooleanVar(value=bool(value))
             elif isinstance(value, int):
                 var = tk.IntVar(value=value)
+            elif isinstance(value, float):
+                var = tk.DoubleVar(value=value)
             else:
                 var = tk.StringVar(value=str(value))
             
@@ -234,33 +330,64 @@ class SettingsGUI:
             self.dev_vars[setting] = var
 
     def check_dependency(self, package):
+        # find_spec only locates the package, importing selenium here would cost seconds
         try:
-            importlib.import_module(package)
-            return True
-        except ImportError:
+            return importlib.util.find_spec(package) is not None
+        except (ImportError, ValueError):
             return False
 
+    def probe_dependencies(self):
+        """Checks every dependency on a worker thread and updates the buttons from the main loop."""
+        def probe():
+            found = {dep: self.check_dependency(dep) for dep in self.dependencies}
+            self.ui_callbacks.put(lambda: self.show_dependency_status(found))
+
+        threading.Thread(target=probe, name="dependency-probe", daemon=True).start()
+
+    def show_dependency_status(self, found):
+        for package, status in found.items():
+            self.dependency_buttons[package].config(
+                text=f"{package}: {'Installed' if status else 'Not Installed'}",
+                bg="green" if status else "gray",
+            )
+
     def install_dependency(self, package):
         if self.check_dependency(package):
             messagebox.showinfo("Info", f"{package} is already installed.")
             return
 
-        try:
-            subprocess.check_call([sys.executable, "-m", "pip", "install", package])
+        self.dependency_buttons[package].config(text=f"{package}: Installing...", state="disabled")
+
+        def install():
+            # pip can take minutes, keep the window responsive
+            try:
+                subprocess.check_call([sys.executable, "-m", "pip", "install", package])
+                succeeded = True
+            except (subprocess.CalledProcessError, OSError):
+                succeeded = False
+            self.ui_callbacks.put(lambda: self.finish_install(package, succeeded))
+
+        threading.Thread(target=install, daemon=True).start()
+
+    def finish_install(self, package, succeeded):
+        importlib.invalidate_caches()
+        self.dependency_buttons[package].config(state="normal")
+        for dep in self.dependencies:
+            self.update_dependency_button(dep)
+        if succeeded:
             messagebox.showinfo("Success", f"{package} has been successfully installed.")
-            
-            for dep in self.dependencies:
-                self.update_dependency_button(dep)
-
-        except subprocess.CalledProcessError:
+        else:
             messagebox.showerror("Error", f"Failed to install {package}. Please install it manually.")
 
     def update_dependency_button(self, package):
-        status = self.check_dependency(package)
-        self.dependency_buttons[package].config(text=f"{package}: {'Installed' if status else 'Not Installed'}")
+        self.show_dependency_status({package: self.check_dependency(package)})
 
 
     def start_rescheduler(self):
+        if self.process is not None and self.process.poll() is None:
+            messagebox.showinfo("Info", "The rescheduler is already running.")
+            return
+
         self.save_settings()  # Save settings before starting
         
         # Check if all dependencies are installed
@@ -270,11 +397,36 @@ class SettingsGUI:
             return
 
         try:
-            subprocess.Popen([sys.executable, "reschedule.py"])
-            messagebox.showinfo("Success", "Rescheduler started successfully!")
+            env = dict(os.environ, **{STATUS_PORT_ENV: str(self.status_listener.port)})
+            self.process = subprocess.Popen([sys.executable, "reschedule.py"], env=env)
+            self.status_vars["process"].set(f"Running (pid {self.process.pid})")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to start rescheduler: {str(e)}")
 
+    def stop_rescheduler(self, then=None):
+        """Stops the running rescheduler without blocking the window, then calls then()."""
+        process = self.process
+        if process is None or process.poll() is not None:
+            if then:
+                then()
+            return
+        self.status_vars["process"].set("Stopping...")
+
+        def stop():
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+            if then:
+                self.ui_callbacks.put(then)
+
+        threading.Thread(target=stop, daemon=True).start()
+
+    def restart_rescheduler(self):
+        self.stop_rescheduler(then=self.start_rescheduler)
+
 if __name__ == "__main__":
     root = tk.Tk()
     app = SettingsGUI(root)
@@ -0,0 +1,250 @@
+"""
+SQLite-backed history of the dates seen by the pollers.
+
+Only changes are stored: one row per contiguous appearance of a date (when it was
+first and last seen), and one row per continuous stretch of polling. A month of
+30-second polling with no changes therefore adds no rows at all.
+
+Usage:
+    python history.py last --facility Toronto --from 2025-01-01 --to 2025-03-01
+    python history.py appearances --facility Toronto --from 2025-01-01 --to 2025-03-01
+    python history.py coverage --facility Toronto --since 2025-01-01
+"""
+import time
+import sqlite3
+import argparse
+import threading
+from datetime import date, datetime
+
+from settings import get_settings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS availability (
+    id INTEGER PRIMARY KEY,
+    facility TEXT NOT NULL,
+    source TEXT NOT NULL,
+    date TEXT NOT NULL,
+    appeared_at REAL NOT NULL,
+    disappeared_at REAL
+);
+CREATE INDEX IF NOT EXISTS availability_open ON availability (facility, source, disappeared_at);
+CREATE INDEX IF NOT EXISTS availability_date ON availability (facility, date);
+CREATE TABLE IF NOT EXISTS coverage (
+    id INTEGER PRIMARY KEY,
+    facility TEXT NOT NULL,
+    source TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    ended_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS coverage_facility ON coverage (facility, source, ended_at);
+"""
+
+
+def to_iso(value) -> str:
+    return value.isoformat() if isinstance(value, date) else str(value)
+
+
+class AvailabilityHistory:
+    """
+    Records poll results per facility and answers questions about past availability.
+
+    A poll whose dates match the previous poll only moves the end of the current
+    coverage row forward. Dates are only written when they appear or disappear.
+    Sources keep pollers with different views apart: "days" is the full list from
+    the days JSON endpoint, "payment" the earliest date from the payment page.
+    """
+
+    def __init__(self, path: str | None = None, coverage_gap: float | None = None):
+        settings = get_settings()
+        self.path = path or settings.history_db
+        self.coverage_gap = settings.history_coverage_gap if coverage_gap is None else coverage_gap
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        self.open_dates = {}
+
+    def load_open_dates(self, facility: str, source: str) -> dict:
+        key = (facility, source)
+        if key not in self.open_dates:
+            rows = self.connection.execute(
+                "SELECT date, id FROM availability WHERE facility = ? AND source = ? AND disappeared_at IS NULL",
+                key,
+            )
+            self.open_dates[key] = dict(rows.fetchall())
+        return self.open_dates[key]
+
+    def record(self, facility: str, dates: list, source: str = "days", observed_at: float | None = None) -> None:
+        """
+        Records one poll result.
+
+        Parameters:
+        - facility (str): Facility name, e.g. "Toronto".
+        - dates (list): The available dates (date objects or ISO strings) seen by the poll.
+        - source (str): "days" or "payment".
+        - observed_at (float | None): Unix time of the poll, now by default.
+        """
+        observed_at = time.time() if observed_at is None else observed_at
+        seen = {to_iso(d) for d in dates}
+        with self.lock, self.connection:
+            open_dates = self.load_open_dates(facility, source)
+            coverage = self.connection.execute(
+                "SELECT id, ended_at FROM coverage WHERE facility = ? AND source = ? "
+                "ORDER BY ended_at DESC LIMIT 1",
+                (facility, source),
+            ).fetchone()
+            if coverage and observed_at - coverage[1] <= self.coverage_gap:
+                self.connection.execute("UPDATE coverage SET ended_at = ? WHERE id = ?", (observed_at, coverage[0]))
+            else:
+                if coverage and open_dates:
+                    # Nobody was watching during the gap: close what was open at the last poll
+                    self.connection.executemany(
+                        "UPDATE availability SET disappeared_at = ? WHERE id = ?",
+                        [(coverage[1], row_id) for row_id in open_dates.values()],
+                    )
+                    open_dates.clear()
+                self.connection.execute(
+                    "INSERT INTO coverage (facility, source, started_at, ended_at) VALUES (?, ?, ?, ?)",
+                    (facility, source, observed_at, observed_at),
+                )
+
+            for gone in set(open_dates) - seen:
+                self.connection.execute(
+                    "UPDATE availability SET disappeared_at = ? WHERE id = ?",
+                    (observed_at, open_dates.pop(gone)),
+                )
+            for new in seen - set(open_dates):
+                cursor = self.connection.execute(
+                    "INSERT INTO availability (facility, source, date, appeared_at) VALUES (?, ?, ?, ?)",
+                    (facility, source, new, observed_at),
+                )
+                open_dates[new] = cursor.lastrowid
+
+    def appearances(self, facility: str, earliest, latest, since: float = 0) -> list[dict]:
+        """
+        Lists the appearances of dates inside a window, newest first.
+
+        Parameters:
+        - facility (str): Facility name.
+        - earliest, latest: The acceptable date window (date objects or ISO strings).
+        - since (float): Only appearances that were still open at or after this Unix time.
+
+        Returns:
+        - list[dict]: date, appeared_at, disappeared_at (None while still available) and
+          duration in seconds (up to now for open appearances).
+        """
+        rows = self.connection.execute(
+            "SELECT date, source, appeared_at, disappeared_at FROM availability "
+            "WHERE facility = ? AND date BETWEEN ? AND ? AND COALESCE(disappeared_at, ?) >= ? "
+            "ORDER BY appeared_at DESC",
+            (facility, to_iso(earliest), to_iso(latest), float("inf"), since),
+        ).fetchall()
+        now = time.time()
+        return [
+            {
+                "date": row[0],
+                "source": row[1],
+                "appeared_at": row[2],
+                "disappeared_at": row[3],
+                "duration": (row[3] if row[3] is not None else now) - row[2],
+            }
+            for row in rows
+        ]
+
+    def last_appearance(self, facility: str, earliest, latest) -> dict | None:
+        """
+        Answers "when did a date inside my window last appear, and for how long".
+
+        Returns:
+        - dict | None: The newest appearance as returned by appearances(), or None.
+        """
+        found = self.appearances(facility, earliest, latest)
+        return found[0] if found else None
+
+    def coverage(self, facility: str, since: float = 0, until: float | None = None) -> dict:
+        """
+        Reports how much of a time range the facility was being polled, to tell whether
+        an appearance could have been missed.
+
+        Returns:
+        - dict: covered seconds, total seconds and the uncovered gaps as (start, end) pairs.
+        """
+        until = time.time() if until is None else until
+        rows = self.connection.execute(
+            "SELECT started_at, ended_at FROM coverage WHERE facility = ? AND ended_at >= ? AND started_at <= ? "
+            "ORDER BY started_at",
+            (facility, since, until),
+        ).fetchall()
+        covered = 0.0
+        gaps = []
+        cursor = since
+        for started_at, ended_at in rows:
+            start, end = max(started_at, since), min(ended_at, until)
+            if start > cursor:
+                gaps.append((cursor, start))
+            if end > cursor:
+                covered += end - max(start, cursor)
+                cursor = end
+        if cursor < until:
+            gaps.append((cursor, until))
+        return {"covered": covered, "total": until - since, "gaps": gaps}
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+shared_history = None
+
+
+def get_history() -> AvailabilityHistory | None:
+    """
+    Returns:
+    - AvailabilityHistory | None: The process-wide history, or None when HISTORY_ENABLED is off.
+    """
+    global shared_history
+    if not get_settings().history_enabled:
+        return None
+    if shared_history is None:
+        shared_history = AvailabilityHistory()
+    return shared_history
+
+
+def format_time(timestamp: float | None) -> str:
+    if timestamp is None:
+        return "still available"
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Query the availability history")
+    parser.add_argument("query", choices=["last", "appearances", "coverage"])
+    parser.add_argument("--facility", default=settings.selected_city or "Toronto")
+    parser.add_argument("--from", dest="earliest", default=to_iso(settings.earliest_acceptable_date or ""))
+    parser.add_argument("--to", dest="latest", default=to_iso(settings.latest_acceptable_date))
+    parser.add_argument("--since", help="YYYY-MM-DD, start of the period to report on")
+    args = parser.parse_args()
+
+    since = datetime.strptime(args.since, "%Y-%m-%d").timestamp() if args.since else 0
+    history = AvailabilityHistory()
+    if args.query == "coverage":
+        report = history.coverage(args.facility, since)
+        percent = 100 * report["covered"] / report["total"] if report["total"] else 0
+        print(f"{args.facility}: polled {percent:.1f}% of the time")
+        for start, end in report["gaps"]:
+            print(f"  not polled {format_time(start)} - {format_time(end)}")
+        return
+    found = history.appearances(args.facility, args.earliest, args.latest, since)
+    if args.query == "last":
+        found = found[:1]
+    if not found:
+        print(f"No date between {args.earliest} and {args.latest} was seen at {args.facility}")
+    for item in found:
+        print(
+            f"{item['date']} appeared {format_time(item['appeared_at'])}, "
+            f"gone {format_time(item['disappeared_at'])}, lasted {item['duration'] / 60:.1f} min ({item['source']})"
+        )
+
+
+if __name__ == "__main__":
+    main()
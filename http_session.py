@@ -0,0 +1,338 @@
+import re
+from html import unescape
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from days_parser import DaysParseError, DaysParser
+from facilities import days_suffix
+from metrics import metrics
+from profiling import profiled
+from request_tracker import RequestTracker, rate_limiter
+from session_store import clear_session, load_session, save_session
+from settings import get_settings
+
+CSRF_TOKEN_PATTERN = re.compile(r'<meta\s+name="csrf-token"\s+content="([^"]+)"')
+SCHEDULE_ID_PATTERN = re.compile(r"/schedule/(\d+)/continue_actions")
+
+
+class PooledSession(requests.Session):
+    """
+    A long-lived requests session with keep-alive connection pooling.
+
+    Cookies copied in from a browser are only re-applied when they change, and
+    connection_stats() reports how many requests reused a pooled connection.
+    """
+
+    def __init__(self):
+        super().__init__()
+        settings = get_settings()
+        self.adapter = HTTPAdapter(pool_connections=settings.pool_connections, pool_maxsize=settings.pool_maxsize)
+        self.mount("https://", self.adapter)
+        self.mount("http://", self.adapter)
+        self.headers["Connection"] = "keep-alive"
+        self._cookie_fingerprint = None
+
+    def export_cookies(self) -> list[dict]:
+        """
+        Returns:
+        - list[dict]: The session cookies in the format of driver.get_cookies().
+        """
+        return [
+            {"name": c.name, "value": c.value, "domain": c.domain, "path": c.path}
+            for c in self.cookies
+        ]
+
+    def sync_cookies(self, cookies: list[dict]) -> bool:
+        """
+        Copies browser cookies (as returned by driver.get_cookies()) into the session.
+
+        Parameters:
+        - cookies (list[dict]): Cookies with at least name and value keys.
+
+        Returns:
+        - bool: True if the cookies changed and were applied, False if they were already current.
+        """
+        fingerprint = tuple(sorted((c["name"], c["value"], c.get("domain", "")) for c in cookies))
+        if fingerprint == self._cookie_fingerprint:
+            return False
+        for cookie in cookies:
+            self.cookies.set(
+                cookie["name"], cookie["value"],
+                domain=cookie.get("domain", ""), path=cookie.get("path", "/")
+            )
+        self._cookie_fingerprint = fingerprint
+        return True
+
+    def connection_stats(self) -> dict:
+        """
+        Returns:
+        - dict: requests sent, connections opened and requests that reused a connection.
+        """
+        opened = 0
+        sent = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            sent += pool.num_requests
+        return {"requests": sent, "connections": opened, "reused": max(sent - opened, 0)}
+
+    def log_connection_stats(self) -> None:
+        stats = self.connection_stats()
+        print(
+            f"HTTP connections: {stats['connections']} opened for {stats['requests']} requests "
+            f"({stats['reused']} reused)"
+        )
+
+
+class LoginError(Exception):
+    """Raised when the sign in form is rejected or the schedule id cannot be found."""
+
+
+def get_base_url() -> str:
+    """
+    Derives the account base url (e.g. https://ais.usvisa-info.com/en-ca/niv) from LOGIN_URL.
+
+    Returns:
+    - str: The url the sign in page lives under.
+    """
+    return get_settings().login_url.rsplit("/users/sign_in", 1)[0]
+
+
+def parse_csrf_token(html: str) -> str:
+    """
+    Extracts the Rails CSRF token from the <meta name="csrf-token"> tag of a page.
+
+    Parameters:
+    - html (str): Page source.
+
+    Returns:
+    - str: The token.
+
+    Raises:
+    - LoginError: If the page carries no token.
+    """
+    match = CSRF_TOKEN_PATTERN.search(html)
+    if not match:
+        raise LoginError("CSRF token not found on page")
+    return unescape(match.group(1))
+
+
+def check_sign_in(response: requests.Response) -> None:
+    """
+    Checks the answer to the XHR sign in POST.
+
+    The POST goes to the sign in url itself and answers 200 there when it succeeds;
+    a rejected sign in is redirected back to the sign in page.
+
+    Raises:
+    - LoginError: If the sign in was not accepted.
+    """
+    if response.status_code != 200 or (response.history and "/users/sign_in" in response.url):
+        raise LoginError(f"Sign in failed with status code {response.status_code}")
+
+
+def log_dates(dates: list, changed: bool, status_code: int) -> None:
+    """
+    Prints the dates of a days response when they changed; unchanged responses are only counted.
+    """
+    if not changed:
+        metrics.incr("days_unchanged_total", status=status_code)
+        return
+    shown = ", ".join(dates[:5]) + (f" and {len(dates) - 5} more" if len(dates) > 5 else "")
+    print(f"Available dates changed: {shown or 'none'}")
+
+
+class AisSession:
+    """
+    A browserless session against the AIS site.
+
+    Signs in through the LOGIN_URL form with plain HTTP and polls the available
+    dates endpoint, so no Chrome process is needed while waiting for a slot.
+    """
+
+    def __init__(self):
+        self.http = PooledSession()
+        self.http.headers["User-Agent"] = get_settings().user_agent
+        self.schedule_id = None
+        # One DaysParser per polled facility id, None for AVAILABLE_DATE_REQUEST_SUFFIX
+        self.days = {}
+        self._saved_cookies = None
+
+    @property
+    def appointment_url(self) -> str:
+        return get_settings().appointment_page_url.format(id=self.schedule_id)
+
+    @profiled("login")
+    def login(self) -> None:
+        """
+        Signs in and resolves the schedule id of the account.
+
+        Returns:
+        - None. The session cookies and schedule_id are stored on the instance.
+
+        Raises:
+        - LoginError: If the credentials are rejected or no schedule is found.
+        - requests.RequestException: On network errors.
+        """
+        settings = get_settings()
+        with rate_limiter.request("login"):
+            sign_in_page = self.http.get(settings.login_url, timeout=settings.timeout)
+            sign_in_page.raise_for_status()
+            csrf_token = parse_csrf_token(sign_in_page.text)
+
+            response = self.http.post(
+                settings.login_url,
+                data={
+                    "utf8": "✓",
+                    "user[email]": settings.user_email,
+                    "user[password]": settings.user_password,
+                    "policy_confirmed": "1",
+                    "commit": "Sign In",
+                },
+                headers={
+                    "X-CSRF-Token": csrf_token,
+                    "X-Requested-With": "XMLHttpRequest",
+                    "Accept": "*/*;q=0.5, text/javascript, application/javascript",
+                    "Referer": settings.login_url,
+                },
+                timeout=settings.timeout,
+            )
+            check_sign_in(response)
+
+            account_page = self.http.get(get_base_url(), timeout=settings.timeout)
+            match = SCHEDULE_ID_PATTERN.search(account_page.text)
+            if not match:
+                raise LoginError("Signed in but no schedule found on the account page")
+            self.schedule_id = match.group(1)
+        self.persist()
+
+    def resume(self) -> bool:
+        """
+        Restores the session saved by an earlier run and checks it is still signed in.
+
+        Returns:
+        - bool: True if the saved session is valid, False if a full login is needed.
+        """
+        saved = load_session()
+        if saved is None:
+            return False
+        self.http.sync_cookies(saved["cookies"])
+        self.schedule_id = saved["schedule_id"]
+        try:
+            # Checking a saved session loads the appointment page, it is not a sign in
+            with rate_limiter.request("booking"):
+                response = self.http.get(self.appointment_url, allow_redirects=False, timeout=get_settings().timeout)
+        except requests.RequestException as e:
+            print("Unable to check saved session: ", e)
+            return False
+        if response.status_code == 200:
+            print("Resumed saved session")
+            self._saved_cookies = self.http.export_cookies()
+            return True
+        print("Saved session expired, signing in again")
+        clear_session()
+        self.http.cookies.clear()
+        self.schedule_id = None
+        return False
+
+    def persist(self) -> None:
+        """
+        Saves the session cookies if they changed since the last save.
+        """
+        cookies = self.http.export_cookies()
+        if cookies != self._saved_cookies:
+            save_session(cookies, self.schedule_id)
+            self._saved_cookies = cookies
+
+    @profiled("get_available_dates")
+    def get_available_dates(self, request_tracker: RequestTracker, facility_id: str | None = None) -> list | None:
+        """
+        Retrieves a list of available appointment dates from the days JSON endpoint.
+
+        Parameters:
+        - request_tracker (RequestTracker): Tracks retries and request timeouts.
+        - facility_id (str | None): The facility to poll, the one in
+          AVAILABLE_DATE_REQUEST_SUFFIX by default.
+
+        Returns:
+        - list | None: The available dates as ISO strings in ascending order if
+          successful, None otherwise.
+        """
+        request_tracker.acquire("days")
+        settings = get_settings()
+        suffix = settings.available_date_request_suffix
+        request_url = self.appointment_url + (days_suffix(suffix, facility_id) if facility_id else suffix)
+        days = self.days.setdefault(facility_id, DaysParser())
+        request_headers = {
+            "X-Requested-With": "XMLHttpRequest",
+            "Accept": "application/json, text/javascript, */*; q=0.01",
+            "Referer": self.appointment_url,
+            **days.request_headers(),
+        }
+        try:
+            with metrics.span("poll", source="http"):
+                response = self.http.get(request_url, headers=request_headers, timeout=settings.timeout)
+        except Exception as e:
+            print("Get available dates request failed: ", e)
+            metrics.incr("request_failures_total", endpoint="days")
+            request_tracker.record(False)
+            return None
+        metrics.incr("http_responses_total", endpoint="days", status=response.status_code)
+        self.persist()
+        if response.status_code not in (200, 304):
+            print(f"Failed with status code {response.status_code}")
+            request_tracker.record(False)
+            return None
+        with metrics.span("parse"):
+            try:
+                dates, changed = days.parse(response.status_code, response.content, response.headers.get("ETag"))
+            except DaysParseError:
+                print("Failed to decode json")
+                metrics.incr("json_decode_failures_total", endpoint="days")
+                request_tracker.record(False)
+                return None
+        request_tracker.record(True)
+        log_dates(dates, changed, response.status_code)
+        return dates
+
+    @profiled("get_payment_page")
+    def get_payment_page(self, request_tracker: RequestTracker | None = None) -> str:
+        """
+        Fetches the payment page, which lists the earliest date of every location.
+
+        Parameters:
+        - request_tracker (RequestTracker | None): Counts the request against the session's
+          limits when the page is polled; only rate limited otherwise.
+
+        Returns:
+        - str: The page source.
+
+        Raises:
+        - requests.RequestException: On network errors or a non-200 response.
+        """
+        settings = get_settings()
+        if request_tracker is not None:
+            request_tracker.acquire("payment")
+        else:
+            rate_limiter.acquire("payment")
+        ok = False
+        try:
+            response = self.http.get(settings.payment_page_url.format(id=self.schedule_id), timeout=settings.timeout)
+            metrics.incr("http_responses_total", endpoint="payment", status=response.status_code)
+            response.raise_for_status()
+            ok = True
+        finally:
+            if request_tracker is not None:
+                request_tracker.record(ok, "payment")
+            else:
+                rate_limiter.record("payment", ok)
+        self.persist()
+        return response.text
+
+    def close(self) -> None:
+        self.http.log_connection_stats()
+        self.http.close()
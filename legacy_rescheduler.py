@@ -1,29 +1,25 @@
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait, Select
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, ElementClickInterceptedException
-from time import sleep
-import json
+import time
 
-# Load settings from settings.json
-def load_settings():
-    with open('settings.json', 'r') as f:
-        return json.load(f)
+from direct_booking import report_submit
+from profiling import profiled
+from request_tracker import rate_limiter
+from settings import get_settings
+from waits import timed_step, wait_for_page_ready, wait_for_select_options
 
-settings = load_settings()
 
-TEST_MODE = settings.get("TEST_MODE")
-SELECTED_CITY = settings.get("SELECTED_CITY")
-
-def legacy_reschedule(driver) -> None:
+@profiled("legacy_reschedule")
+def legacy_reschedule(driver, city: str | None = None, detected_at: float | None = None) -> None:
     """
     Attempts to reschedule an appointment using a web automation script via Selenium.
 
     The script searches for the nearest available date and time slot, selects them,
-    and submits the rescheduling request. Retries the process up to 3 times in case of failure.
+    and submits the rescheduling request. Retries the process up to 3 times in case of failure,
+    starting attempts at least BOOKING_RETRY_DELAY seconds apart.
 
     Parameters:
     - driver (webdriver): A Selenium WebDriver instance controlling the browser.
+    - city (str | None): The facility to book at, SELECTED_CITY by default.
+    - detected_at (float | None): time.monotonic() when the slot was detected.
 
     Returns:
     - None. Prints success or failure messages depending on the outcome.
@@ -32,19 +28,28 @@ def legacy_reschedule(driver) -> None:
     - TimeoutException, NoSuchElementException, ElementClickInterceptedException: 
       If any issues occur during the process.
     """
+    # Imported here so that loading this module does not load Selenium
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait, Select
+    from selenium.common.exceptions import TimeoutException, NoSuchElementException, ElementClickInterceptedException
 
+    settings = get_settings()
     max_retries = 3
     for attempt in range(max_retries):
+        started = time.monotonic()
         try:
-            driver.refresh()
-            
+            with timed_step("appointment page refresh"):
+                rate_limiter.acquire("booking")
+                driver.refresh()
+                wait_for_page_ready(driver)
+
             # Selects the city
             city_select = WebDriverWait(driver, 10).until(
                 EC.presence_of_element_located((By.ID, "appointments_consulate_appointment_facility_id"))
             )
             select = Select(city_select)
-            print(select)
-            select.select_by_visible_text(SELECTED_CITY)
+            select.select_by_visible_text(city or settings.selected_city)
 
             # Wait for and click the date input field
             date_input = WebDriverWait(driver, 10).until(
@@ -52,9 +57,6 @@ def legacy_reschedule(driver) -> None:
             )
             date_input.click()
 
-
-                
-
             def next_month() -> None:
                 """
                 Clicks the next month button in the datepicker.
@@ -95,20 +97,20 @@ def legacy_reschedule(driver) -> None:
                         raise Exception("No available dates found within 12 months")
                 return ava_in
 
-            
-            available_in_months = nearest_ava()
+            with timed_step("datepicker walk"):
+                available_in_months = nearest_ava()
 
             # Select the first available date
             available_date = WebDriverWait(driver, 5).until(
                 EC.element_to_be_clickable((By.CSS_SELECTOR, "#ui-datepicker-div td:not(.ui-datepicker-unselectable) a"))
             )
             available_date.click()
-            sleep(3)
 
-            # Select the time
-            time_select = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.ID, "appointments_consulate_appointment_time"))
-            )
+            # Select the time once the times of the picked date have loaded
+            with timed_step("time slots load"):
+                time_select = wait_for_select_options(
+                    driver, (By.ID, "appointments_consulate_appointment_time")
+                )
             select = Select(time_select)
 
             select.select_by_index(len(select.options) - 1)  # Select the last option
@@ -118,10 +120,11 @@ def legacy_reschedule(driver) -> None:
             reschedule_button = WebDriverWait(driver, 10).until(
                 EC.element_to_be_clickable((By.CSS_SELECTOR, "input[value='Reschedule']"))
             )
+            report_submit(detected_at, "legacy")
             reschedule_button.click()
 
             # Confirm rescheduling if not in test mode
-            if not TEST_MODE:
+            if not settings.test_mode:
                 confirm = WebDriverWait(driver, 10).until(
                     EC.element_to_be_clickable((By.CSS_SELECTOR, "a.button.alert"))
                 )
@@ -136,7 +139,6 @@ def legacy_reschedule(driver) -> None:
                 EC.presence_of_element_located((By.CSS_SELECTOR, "div#flash_messages.learnMorePopUp"))
             )
 
-            
             success_message = message_div.find_element(By.CSS_SELECTOR, "div.learn_more > p").text
             if "successfully" in success_message:
                 print(f"Successfully rescheduled for {available_in_months} months from now!")
@@ -148,7 +150,8 @@ def legacy_reschedule(driver) -> None:
             print(f"Rescheduling attempt {attempt + 1} failed: {str(e)}")
             if attempt < max_retries - 1:
                 print("Retrying...")
-                sleep(5)
+                # The next attempt refreshes and waits for the page; this only spaces out quick failures
+                time.sleep(max(0, settings.booking_retry_delay - (time.monotonic() - started)))
             else:
                 print("Max retries reached. Rescheduling failed.")
                 raise
\ No newline at end of file
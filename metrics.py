@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+from settings import get_settings
+
+METRIC_PREFIX = "rescheduler_"
+
+
+def label_key(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def format_labels(key: tuple) -> str:
+    if not key:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"') for _, value in key)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(key, escaped)) + "}"
+
+
+class Metrics:
+    """
+    Records spans, counters and gauges for the rescheduler.
+
+    Every span and event is appended to events.jsonl as it happens, and the
+    aggregated values are written to metrics.prom in the Prometheus text format,
+    at most every METRICS_FLUSH_INTERVAL seconds and on flush().
+
+    events.jsonl stays open and is rotated once it reaches METRICS_MAX_BYTES,
+    keeping METRICS_BACKUP_COUNT old files. The directory is only created once
+    something is written, so nothing is created while metrics are off.
+    """
+
+    def __init__(self, directory: str | None = None, enabled: bool | None = None):
+        settings = get_settings()
+        self.directory = directory or settings.metrics_dir
+        self.enabled = settings.metrics_enabled if enabled is None else enabled
+        self.flush_interval = settings.metrics_flush_interval
+        self.max_bytes = settings.metrics_max_bytes
+        self.backup_count = settings.metrics_backup_count
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.spans = {}
+        self.last_flush = 0.0
+        self.events = None
+
+    @property
+    def events_path(self) -> str:
+        return os.path.join(self.directory, "events.jsonl")
+
+    @property
+    def prometheus_path(self) -> str:
+        return os.path.join(self.directory, "metrics.prom")
+
+    def incr(self, name: str, value: float = 1, **labels) -> None:
+        """
+        Increments a counter, e.g. incr("http_responses_total", endpoint="days", status=200).
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            key = (name, label_key(labels))
+            self.counters[key] = self.counters.get(key, 0) + value
+        self.maybe_flush()
+
+    def gauge(self, name: str, value: float, **labels) -> None:
+        """
+        Sets a gauge to its current value.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.gauges[(name, label_key(labels))] = value
+        self.maybe_flush()
+
+    def event(self, name: str, **fields) -> None:
+        """
+        Appends a free-form event to the JSON-lines log.
+        """
+        if not self.enabled:
+            return
+        self.write_event({"type": "event", "name": name, "time": time.time(), **fields})
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        """
+        Times the wrapped block and records it as a span.
+
+        Parameters:
+        - name (str): Span name, e.g. "login" or "poll".
+        - labels: Extra labels, also written to the JSON-lines record.
+        """
+        if not self.enabled:
+            yield
+            return
+        start_time = time.time()
+        start = time.perf_counter()
+        ok = True
+        try:
+            yield
+        except BaseException:
+            ok = False
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            with self.lock:
+                key = (name, label_key(labels))
+                count, total, _ = self.spans.get(key, (0, 0.0, 0.0))
+                self.spans[key] = (count + 1, total + duration, duration)
+                errors_key = ("span_errors_total", label_key({"span": name, **labels}))
+                if not ok:
+                    self.counters[errors_key] = self.counters.get(errors_key, 0) + 1
+            self.write_event({
+                "type": "span", "name": name, "time": start_time,
+                "duration": round(duration, 6), "ok": ok, **labels
+            })
+            self.maybe_flush()
+
+    def open_events(self) -> RotatingFileHandler:
+        """
+        Opens events.jsonl on first use. Called with the lock held.
+        """
+        if self.events is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.events = RotatingFileHandler(
+                self.events_path, maxBytes=self.max_bytes, backupCount=self.backup_count, encoding="utf-8"
+            )
+        return self.events
+
+    def write_event(self, record: dict) -> None:
+        line = json.dumps(record, default=str)
+        with self.lock:
+            self.open_events().handle(logging.makeLogRecord({"msg": line}))
+
+    def maybe_flush(self) -> None:
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Rewrites metrics.prom with the current values.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.last_flush = time.monotonic()
+            lines = []
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {METRIC_PREFIX}{name} counter")
+                for (counter, key), value in sorted(self.counters.items()):
+                    if counter == name:
+                        lines.append(f"{METRIC_PREFIX}{name}{format_labels(key)} {value}")
+            for name in sorted({name for name, _ in self.gauges}):
+                lines.append(f"# TYPE {METRIC_PREFIX}{name} gauge")
+                for (gauge, key), value in sorted(self.gauges.items()):
+                    if gauge == name:
+                        lines.append(f"{METRIC_PREFIX}{name}{format_labels(key)} {value}")
+            if self.spans:
+                span_labels = {
+                    key: format_labels(label_key({"span": key[0], **dict(key[1])})) for key in self.spans
+                }
+                lines.append(f"# TYPE {METRIC_PREFIX}span_seconds summary")
+                for key, (count, total, _) in sorted(self.spans.items()):
+                    lines.append(f"{METRIC_PREFIX}span_seconds_count{span_labels[key]} {count}")
+                    lines.append(f"{METRIC_PREFIX}span_seconds_sum{span_labels[key]} {total:.6f}")
+                lines.append(f"# TYPE {METRIC_PREFIX}span_last_seconds gauge")
+                for key, (_, _, last) in sorted(self.spans.items()):
+                    lines.append(f"{METRIC_PREFIX}span_last_seconds{span_labels[key]} {last:.6f}")
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = self.prometheus_path + ".tmp"
+            with open(temp_path, 'w') as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(temp_path, self.prometheus_path)
+
+
+metrics = Metrics()
@@ -0,0 +1,276 @@
+import sys
+import json
+import time
+import queue
+import random
+import shutil
+import smtplib
+import threading
+import subprocess
+import urllib.request
+from email.message import EmailMessage
+
+from metrics import metrics
+from settings import get_settings
+
+
+def format_slots(slots: list[tuple[str, str]]) -> str:
+    return "\n".join(f"{location}: {date}" for location, date in slots)
+
+
+class SmtpChannel:
+    name = "smtp"
+
+    def __init__(self, host: str, port: int, sender: str, recipients: list, user: str | None = None,
+                 password: str | None = None, starttls: bool = True, timeout: float = 10):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = recipients
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def send(self, slots: list[tuple[str, str]]) -> None:
+        message = EmailMessage()
+        message["Subject"] = f"Visa appointment available: {slots[0][1]} at {slots[0][0]}"
+        message["From"] = self.sender
+        message["To"] = ", ".join(self.recipients)
+        message.set_content("Appointment slots found:\n\n" + format_slots(slots))
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password)
+            smtp.send_message(message)
+
+
+class WebhookChannel:
+    name = "webhook"
+
+    def __init__(self, url: str, timeout: float = 10):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, slots: list[tuple[str, str]]) -> None:
+        payload = {
+            "text": "Visa appointment available:\n" + format_slots(slots),
+            "slots": [{"location": location, "date": date} for location, date in slots],
+        }
+        request = urllib.request.Request(
+            self.url, data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class DesktopChannel:
+    name = "desktop"
+
+    def __init__(self, timeout: float = 10):
+        self.timeout = timeout
+
+    def send(self, slots: list[tuple[str, str]]) -> None:
+        title = "Visa appointment available"
+        body = format_slots(slots)
+        if sys.platform == "darwin":
+            script = f"display notification {json.dumps(body)} with title {json.dumps(title)}"
+            command = ["osascript", "-e", script]
+        elif sys.platform == "win32":
+            script = (
+                "Add-Type -AssemblyName System.Windows.Forms;"
+                "$n = New-Object System.Windows.Forms.NotifyIcon;"
+                "$n.Icon = [System.Drawing.SystemIcons]::Information; $n.Visible = $true;"
+                f"$n.ShowBalloonTip(10000, {json.dumps(title)}, {json.dumps(body)}, 'Info');"
+                "Start-Sleep -Seconds 10"
+            )
+            command = ["powershell", "-NoProfile", "-Command", script]
+        elif shutil.which("notify-send"):
+            command = ["notify-send", title, body]
+        else:
+            raise RuntimeError("No desktop notification command available")
+        subprocess.run(command, check=True, timeout=self.timeout + 10, capture_output=True)
+
+
+def configured_channels() -> list:
+    """
+    Returns:
+    - list: The channels enabled in settings.json.
+    """
+    settings = get_settings()
+    channels = []
+    if settings.notify_smtp_host and settings.notify_email_to:
+        recipients = settings.notify_email_to if isinstance(settings.notify_email_to, list) else [
+            address.strip() for address in settings.notify_email_to.split(",")
+        ]
+        channels.append(SmtpChannel(
+            settings.notify_smtp_host, settings.notify_smtp_port, settings.notify_email_from, recipients,
+            settings.notify_smtp_user, settings.notify_smtp_password, settings.notify_smtp_starttls,
+            settings.notify_timeout
+        ))
+    if settings.notify_webhook_url:
+        channels.append(WebhookChannel(settings.notify_webhook_url, settings.notify_timeout))
+    if settings.notify_desktop:
+        channels.append(DesktopChannel(settings.notify_timeout))
+    return channels
+
+
+class Notifier:
+    """
+    Delivers slot notifications on a background thread so detection never waits on them.
+
+    notify() only checks the dedup table and puts the slot on a bounded queue; when the
+    queue is full the slot is dropped rather than blocking. The worker collects slots
+    for NOTIFY_BATCH_WINDOW seconds into one message per channel and retries failed
+    deliveries with exponential backoff.
+
+    The dedup table is kept per channel: a slot that one channel failed to deliver is
+    sent again on that channel only, and entries are dropped once NOTIFY_DEDUP_TTL passed.
+    """
+
+    def __init__(self, channels: list | None = None, queue_size: int | None = None,
+                 batch_window: float | None = None, dedup_ttl: float | None = None,
+                 max_attempts: int | None = None):
+        settings = get_settings()
+        self.channels = configured_channels() if channels is None else channels
+        self.queue = queue.Queue(maxsize=queue_size or settings.notify_queue_size)
+        self.batch_window = settings.notify_batch_window if batch_window is None else batch_window
+        self.dedup_ttl = settings.notify_dedup_ttl if dedup_ttl is None else dedup_ttl
+        self.max_attempts = max_attempts or settings.notify_max_attempts
+        self.sent = {}
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.worker = None
+
+    def start(self) -> "Notifier":
+        if self.worker is None and self.channels:
+            self.worker = threading.Thread(target=self.run, name="notifier", daemon=True)
+            self.worker.start()
+        return self
+
+    def notify(self, location: str, date: str) -> bool:
+        """
+        Queues a slot for delivery, unless it was already sent within NOTIFY_DEDUP_TTL.
+
+        Parameters:
+        - location (str): Facility name.
+        - date (str): The available date.
+
+        Returns:
+        - bool: True if the slot was queued.
+        """
+        if not self.channels:
+            return False
+        claim = self.claim(location, date)
+        if claim is None:
+            return False
+        try:
+            self.queue.put_nowait(claim)
+        except queue.Full:
+            self.release(*claim)
+            metrics.incr("notifications_total", result="dropped")
+            print(f"Notification queue full, dropped slot {date} at {location}")
+            return False
+        self.start()
+        return True
+
+    def claim(self, location: str, date: str) -> tuple | None:
+        """
+        Marks a slot as sent on every channel that did not send it within NOTIFY_DEDUP_TTL.
+
+        Returns:
+        - tuple | None: The (location, date) key and the names of the channels to deliver
+          it on, None for a duplicate.
+        """
+        key = (location, str(date))
+        now = time.monotonic()
+        with self.lock:
+            self.prune(now)
+            sent = self.sent.setdefault(key, {})
+            names = tuple(channel.name for channel in self.channels if channel.name not in sent)
+            if not names:
+                metrics.incr("notifications_total", result="duplicate")
+                return None
+            for name in names:
+                sent[name] = now
+        return key, names
+
+    def prune(self, now: float) -> None:
+        """
+        Drops the channels that sent a slot more than NOTIFY_DEDUP_TTL ago, and slots left without any.
+        Called with the lock held.
+        """
+        for key, sent in list(self.sent.items()):
+            for name, sent_at in list(sent.items()):
+                if now - sent_at >= self.dedup_ttl:
+                    del sent[name]
+            if not sent:
+                del self.sent[key]
+
+    def release(self, key: tuple, names: tuple) -> None:
+        """
+        Forgets a claimed slot on the given channels, so it is sent there on a later detection.
+        """
+        with self.lock:
+            sent = self.sent.get(key, {})
+            for name in names:
+                sent.pop(name, None)
+            if not sent:
+                self.sent.pop(key, None)
+
+    def run(self) -> None:
+        while not self.stopping.is_set() or not self.queue.empty():
+            try:
+                first = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.batch_window
+            while not self.stopping.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.deliver_batch(batch)
+
+    def deliver_batch(self, batch: list[tuple]) -> None:
+        """
+        Sends each channel one message with the slots of the batch that were claimed for it.
+
+        Parameters:
+        - batch (list[tuple]): Claims as returned by claim().
+        """
+        for channel in self.channels:
+            slots = [key for key, names in batch if channel.name in names]
+            if slots:
+                self.deliver(channel, slots)
+
+    def deliver(self, channel, batch: list[tuple[str, str]]) -> bool:
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                channel.send(batch)
+                metrics.incr("notifications_total", result="sent", channel=channel.name)
+                return True
+            except Exception as e:
+                print(f"Sending {channel.name} notification failed (attempt {attempt}): ", e)
+                if attempt == self.max_attempts or self.stopping.is_set():
+                    break
+                self.stopping.wait(min(60, 2 ** attempt) * random.uniform(0.5, 1.0))
+        metrics.incr("notifications_total", result="failed", channel=channel.name)
+        # Let the slot be sent again on a later detection, on this channel only
+        for key in batch:
+            self.release(key, (channel.name,))
+        return False
+
+    def stop(self, timeout: float = 10) -> None:
+        """
+        Delivers what is already queued (without retry waits) and stops the worker.
+        """
+        self.stopping.set()
+        if self.worker is not None:
+            self.worker.join(timeout)
@@ -0,0 +1,72 @@
+from datetime import date, datetime
+from html.parser import HTMLParser
+
+
+class PaymentTableParser(HTMLParser):
+    """
+    Collects the text of every <td> of the table.for-layout of the payment page.
+    Tables nested inside its cells are skipped, together with their text.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.cells = []
+        self.table_depth = 0
+        self.in_layout_table = False
+        self.cell_text = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "table":
+            if self.in_layout_table:
+                self.table_depth += 1
+            elif "for-layout" in (dict(attrs).get("class") or "").split():
+                self.in_layout_table = True
+                self.table_depth = 1
+        elif tag == "td" and self.in_layout_table and self.table_depth == 1:
+            self.cell_text = []
+
+    def handle_endtag(self, tag):
+        if tag == "td" and self.cell_text is not None and self.table_depth == 1:
+            self.cells.append(" ".join("".join(self.cell_text).split()))
+            self.cell_text = None
+        elif tag == "table" and self.in_layout_table:
+            self.table_depth -= 1
+            if self.table_depth == 0:
+                self.in_layout_table = False
+
+    def handle_data(self, data):
+        if self.cell_text is not None and self.table_depth == 1:
+            self.cell_text.append(data)
+
+
+def parse_payment_page(html: str) -> list[tuple[str, str]]:
+    """
+    Parses the payment page into (location, date) pairs.
+
+    Parameters:
+    - html (str): Source of the payment page.
+
+    Returns:
+    - list[tuple[str, str]]: Location and its earliest date text, e.g.
+      ("Toronto", "02 January, 2025") or ("Ottawa", "No Appointments Available").
+    """
+    parser = PaymentTableParser()
+    parser.feed(html)
+    parser.close()
+    cells = parser.cells
+    return list(zip(cells[0::2], cells[1::2]))
+
+
+def parse_payment_date(text: str) -> date | None:
+    """
+    Parses the date cell of the payment page.
+
+    Parameters:
+    - text (str): e.g. "02 January, 2025" or "No Appointments Available".
+
+    Returns:
+    - date | None: The earliest date of the location, None if it has none.
+    """
+    if text == "No Appointments Available":
+        return None
+    return datetime.strptime(text, "%d %B, %Y").date()
@@ -0,0 +1,122 @@
+import random
+from datetime import datetime
+from functools import lru_cache
+from time import sleep
+
+from metrics import metrics
+from settings import get_settings, parse_poll_profile
+
+OK = "ok"
+BUSY = "busy"
+ERROR = "error"
+
+
+@lru_cache(maxsize=None)
+def get_profile_timezone(name: str):
+    """
+    Returns:
+    - tzinfo | None: The profile timezone, or None (local time) for "local" or if it is unavailable.
+    """
+    if not name or name == "local":
+        return None
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo(name)
+    except Exception:
+        print(f"Timezone {name} unavailable, using local time for the poll profile")
+        return None
+
+
+class PollScheduler:
+    """
+    Decides how long to wait before the next date request.
+
+    The base interval comes from the first POLL_PROFILE entry matching the current
+    time, or DATE_REQUEST_DELAY. Errors and busy responses back off exponentially
+    with jitter up to MAX_POLL_BACKOFF; a successful response returns straight to
+    the base interval. No interval is ever shorter than MIN_POLL_INTERVAL.
+
+    Arguments left as None follow settings.json, including edits made while polling.
+
+    A profile entry looks like {"days": [0, 1, 2, 3, 4], "start": "21:00", "end": "02:00",
+    "interval": 15}, with days numbered from Monday = 0 and optional; the range may
+    wrap past midnight.
+    """
+
+    def __init__(
+        self,
+        base_interval: float | None = None,
+        min_interval: float | None = None,
+        max_backoff: float | None = None,
+        profile: list | None = None,
+        timezone: str | None = None,
+        jitter: float | None = None,
+    ):
+        self.overrides = {
+            "date_request_delay": base_interval,
+            "min_poll_interval": min_interval,
+            "max_poll_backoff": max_backoff,
+            "poll_profile": parse_poll_profile(profile) if profile is not None else None,
+            "poll_profile_timezone": timezone,
+            "poll_jitter": jitter,
+        }
+        self.failures = 0
+
+    def setting(self, name: str):
+        value = self.overrides[name]
+        return getattr(get_settings(), name) if value is None else value
+
+    def record(self, outcome: str) -> None:
+        """
+        Records the outcome of the last request.
+
+        Parameters:
+        - outcome (str): OK, BUSY or ERROR.
+        """
+        metrics.incr("poll_outcomes_total", outcome=outcome)
+        if outcome == OK:
+            self.failures = 0
+        else:
+            self.failures += 1
+
+    def profile_interval(self, now: datetime | None = None) -> float:
+        """
+        Returns:
+        - float: The base interval for the given (or current) time.
+        """
+        profile = self.setting("poll_profile")
+        if not profile:
+            return float(self.setting("date_request_delay"))
+        now = now or datetime.now(get_profile_timezone(self.setting("poll_profile_timezone")))
+        minute = now.hour * 60 + now.minute
+        for entry in profile:
+            days, start, end = entry["days"], entry["start"], entry["end"]
+            if start <= end:
+                in_range = start <= minute < end
+                weekday = now.weekday()
+            else:
+                in_range = minute >= start or minute < end
+                # Past midnight the range still belongs to the day it started on
+                weekday = now.weekday() if minute >= start else (now.weekday() - 1) % 7
+            if in_range and (days is None or weekday in days):
+                return entry["interval"]
+        return float(self.setting("date_request_delay"))
+
+    def next_delay(self) -> float:
+        """
+        Returns:
+        - float: Seconds to wait before the next request.
+        """
+        base = self.profile_interval()
+        if self.failures:
+            ceiling = min(self.setting("max_poll_backoff"), base * 2 ** min(self.failures, 16))
+            delay = random.uniform(base, ceiling)
+        else:
+            jitter = self.setting("poll_jitter")
+            delay = base * random.uniform(1 - jitter, 1 + jitter)
+        return max(self.setting("min_poll_interval"), delay)
+
+    def wait(self) -> None:
+        delay = self.next_delay()
+        metrics.gauge("poll_interval_seconds", round(delay, 3))
+        sleep(delay)
@@ -0,0 +1,254 @@
+"""
+Sampling profiler for the stages of a polling cycle, switched on with --profile DIR.
+
+Functions decorated with @profiled("stage") (login, get_appointment_page,
+get_available_dates, legacy_reschedule, ...) become stages. While profiling, a
+background thread samples the stack of every thread that is inside a stage every
+PROFILE_SAMPLE_INTERVAL seconds (wall clock, so time blocked on Selenium or the
+network shows up), and every stage call is measured for wall time, CPU time and
+the memory it kept allocated, with tracemalloc. Allocation sites are taken from
+snapshot diffs of every PROFILE_SNAPSHOT_EVERY-th call.
+
+write_reports() writes to the directory:
+
+- stages.txt / stages.json: per stage calls, wall and CPU time, where the samples
+  fell (selenium, http, parsing or python code) and the top allocation sites;
+- stacks.folded: the samples as collapsed stacks, for flamegraph.pl or speedscope.
+
+Profiling is off unless enable() is called; a profiled function then costs one
+global lookup more per call.
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import functools
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+from settings import get_settings
+
+# Checked in this order against a sample's stack, innermost frame first
+CATEGORIES = [
+    ("selenium", ("/selenium/",)),
+    ("http", ("/requests/", "/urllib3/", "/http/client.py", "/socket.py", "/ssl.py")),
+    ("parsing", ("/json/", "/_strptime.py", "/html/parser.py", "payment_parser.py", "days_parser.py")),
+]
+
+# The active Profiler, None while profiling is off
+profiler = None
+
+# The profiler's own allocations are left out of the stage reports
+OWN_FILES = (tracemalloc.__file__, __file__)
+
+
+def profiled(stage: str):
+    """
+    Makes the decorated function a profiling stage.
+
+    Parameters:
+    - stage (str): Stage name in the reports, e.g. "login".
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if profiler is None:
+                return function(*args, **kwargs)
+            with profiler.stage(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def enable(directory: str) -> "Profiler":
+    """
+    Starts profiling; the reports are written to the directory at exit and on write_reports().
+    """
+    global profiler
+    if profiler is None:
+        profiler = Profiler(directory)
+        profiler.start()
+        atexit.register(profiler.stop)
+    return profiler
+
+
+def write_reports() -> None:
+    if profiler is not None:
+        profiler.write()
+
+
+def frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def categorize(frames: list) -> str:
+    """
+    Returns:
+    - str: The category of a sample, from its frames innermost first.
+    """
+    filenames = [frame.f_code.co_filename.replace("\\", "/") for frame in frames]
+    for category, markers in CATEGORIES:
+        if any(marker in filename for filename in filenames for marker in markers):
+            return category
+    return "python"
+
+
+class StageStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.allocated = 0
+        self.snapshots = 0
+        self.samples = {}
+        # Allocation site to bytes allocated across all calls
+        self.allocations = {}
+
+    def to_dict(self, top_allocations: int) -> dict:
+        top = sorted(self.allocations.items(), key=lambda item: item[1], reverse=True)[:top_allocations]
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "wall_seconds": round(self.wall, 4),
+            "cpu_seconds": round(self.cpu, 4),
+            "wall_per_call": round(self.wall / self.calls, 4) if self.calls else None,
+            "allocated_bytes": self.allocated,
+            "snapshot_calls": self.snapshots,
+            "samples": dict(sorted(self.samples.items())),
+            "top_allocations": [{"site": site, "bytes": size} for site, size in top],
+        }
+
+
+class Profiler:
+    """
+    Samples the threads that are inside a stage and measures every stage call.
+    """
+
+    def __init__(self, directory: str, interval: float | None = None):
+        settings = get_settings()
+        self.directory = directory
+        self.interval = interval or settings.profile_sample_interval
+        self.tracemalloc_frames = settings.profile_tracemalloc_frames
+        self.snapshot_every = settings.profile_snapshot_every
+        self.top_allocations = settings.profile_top_allocations
+        self.lock = threading.Lock()
+        # Thread id to the names of the stages it is in, outermost first
+        self.active = {}
+        self.stats = {}
+        self.stacks = {}
+        self.stopping = threading.Event()
+        self.sampler = None
+
+    def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.tracemalloc_frames)
+        self.sampler = threading.Thread(target=self.sample_loop, name="profiler", daemon=True)
+        self.sampler.start()
+        print(f"Profiling to {self.directory}")
+
+    def stop(self) -> None:
+        self.stopping.set()
+        if self.sampler is not None:
+            self.sampler.join(1)
+        self.write()
+
+    @contextmanager
+    def stage(self, name: str):
+        thread_id = threading.get_ident()
+        with self.lock:
+            calls = self.stats[name].calls if name in self.stats else 0
+        # Snapshots are taken outside the sampled and timed part of the stage
+        # PROFILE_SNAPSHOT_EVERY 0 compares the first call of each stage only
+        compare = calls == 0 or (self.snapshot_every and calls % self.snapshot_every == 0)
+        before = tracemalloc.take_snapshot() if compare else None
+        memory_start = tracemalloc.get_traced_memory()[0]
+        with self.lock:
+            self.active.setdefault(thread_id, []).append(name)
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        ok = True
+        try:
+            yield
+        except BaseException:
+            ok = False
+            raise
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start
+            allocated = tracemalloc.get_traced_memory()[0] - memory_start
+            with self.lock:
+                self.active[thread_id].pop()
+                if not self.active[thread_id]:
+                    del self.active[thread_id]
+            differences = []
+            if before is not None:
+                differences = [
+                    d for d in tracemalloc.take_snapshot().compare_to(before, "lineno")
+                    if d.size_diff > 0 and d.traceback[0].filename not in OWN_FILES
+                ]
+            with self.lock:
+                stats = self.stats.setdefault(name, StageStats())
+                stats.calls += 1
+                stats.errors += not ok
+                stats.wall += wall
+                stats.cpu += cpu
+                stats.allocated += max(allocated, 0)
+                stats.snapshots += before is not None
+                for difference in differences:
+                    frame = difference.traceback[0]
+                    site = f"{frame.filename}:{frame.lineno}"
+                    stats.allocations[site] = stats.allocations.get(site, 0) + difference.size_diff
+
+    def sample_loop(self) -> None:
+        while not self.stopping.wait(self.interval):
+            with self.lock:
+                active = {thread_id: list(stages) for thread_id, stages in self.active.items()}
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for thread_id, stages in active.items():
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame)
+                    frame = frame.f_back
+                category = categorize(stack)
+                folded = ";".join(stages + [frame_name(f) for f in reversed(stack)])
+                with self.lock:
+                    stats = self.stats.setdefault(stages[-1], StageStats())
+                    stats.samples[category] = stats.samples.get(category, 0) + 1
+                    self.stacks[folded] = self.stacks.get(folded, 0) + 1
+
+    def write(self) -> None:
+        with self.lock:
+            report = {name: stats.to_dict(self.top_allocations) for name, stats in sorted(self.stats.items())}
+            stacks = dict(self.stacks)
+        with open(os.path.join(self.directory, "stages.json"), 'w') as f:
+            json.dump({"sample_interval": self.interval, "stages": report}, f, indent=4)
+        with open(os.path.join(self.directory, "stacks.folded"), 'w') as f:
+            for stack, count in sorted(stacks.items()):
+                f.write(f"{stack} {count}\n")
+        with open(os.path.join(self.directory, "stages.txt"), 'w') as f:
+            for name, stage in report.items():
+                total = sum(stage["samples"].values())
+                shares = ", ".join(
+                    f"{category} {100 * count / total:.0f}%" for category, count in stage["samples"].items()
+                ) if total else "no samples"
+                f.write(
+                    f"{name}: {stage['calls']} calls ({stage['errors']} failed), "
+                    f"{stage['wall_seconds']:.3f}s wall, {stage['cpu_seconds']:.3f}s CPU, "
+                    f"{stage['allocated_bytes'] / 1024:.1f} KiB kept allocated\n"
+                )
+                f.write(f"  time spent in: {shares}\n")
+                if stage["top_allocations"]:
+                    f.write(f"  top allocation sites ({stage['snapshot_calls']} calls compared):\n")
+                for allocation in stage["top_allocations"]:
+                    f.write(f"  {allocation['bytes'] / 1024:10.1f} KiB  {allocation['site']}\n")
+                f.write("\n")
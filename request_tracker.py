@@ -1,23 +1,227 @@
+"""
+Request accounting and rate limiting for everything sent to the AIS site.
+
+rate_limiter is shared by the whole process. Before each request the caller takes
+a token for its endpoint ("login", "days", "payment" or "booking"), and one from
+the "global" bucket that caps all endpoints together. Buckets refill at the rates
+in RATE_LIMITS and the caller sleeps when a bucket is empty, so bursts are allowed
+up to the bucket size while the long-run rate never exceeds the limit.
+
+Failed requests also draw on a retry budget of RETRY_BUDGET tokens that refills at
+RETRY_BUDGET_PER_HOUR. Once it is spent, every request waits for it to refill, so
+a site outage or an expired account cannot turn into a lockout-inducing stream of
+retries. Bucket levels and the budget are saved to RATE_LIMIT_STATE_FILE at most
+every RATE_LIMIT_SAVE_INTERVAL seconds and at exit, so restarts (including the
+supervisor's) do not start with full buckets.
+
+RequestTracker is the per-session view on top: it counts a session's date
+requests and time against DATE_REQUEST_MAX_RETRY and DATE_REQUEST_MAX_TIME.
+"""
+import os
+import json
 import time
+import atexit
+import threading
+from contextlib import contextmanager
+
+from metrics import metrics
+from settings import get_settings
+
+
+class RateLimiter:
+    """
+    Token buckets per endpoint plus a global bucket and a retry budget, all persisted.
+    """
+
+    def __init__(self, path: str | None = None):
+        self.path = path or get_settings().rate_limit_state_file
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.retry_budget = None
+        self.counts = {}
+        # Changed since the last save, and when that was (time.monotonic())
+        self.dirty = False
+        self.saved_at = time.monotonic()
+        self.load()
+        atexit.register(self.save)
+
+    def load(self) -> None:
+        try:
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.buckets = state.get("buckets", {})
+        self.retry_budget = state.get("retry_budget")
+        self.counts = state.get("counts", {})
+
+    def save(self) -> None:
+        with self.lock:
+            if not self.dirty:
+                return
+            state = json.dumps(
+                {"buckets": self.buckets, "retry_budget": self.retry_budget, "counts": self.counts}, indent=4
+            )
+            self.dirty = False
+            self.saved_at = time.monotonic()
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temporary, 'w') as f:
+                f.write(state)
+            os.replace(temporary, self.path)
+        except OSError as e:
+            print("Unable to save rate limit state: ", e)
+
+    def maybe_save(self) -> None:
+        """
+        Saves the state if it changed and the last save is RATE_LIMIT_SAVE_INTERVAL seconds old.
+        """
+        if self.dirty and time.monotonic() - self.saved_at >= get_settings().rate_limit_save_interval:
+            self.save()
+
+    @staticmethod
+    def refill(bucket: dict | None, capacity: float, per_second: float, now: float) -> dict:
+        if bucket is None:
+            return {"tokens": capacity, "updated_at": now}
+        elapsed = max(0.0, now - bucket["updated_at"])
+        return {"tokens": min(capacity, bucket["tokens"] + elapsed * per_second), "updated_at": now}
+
+    def wait_time(self, endpoint: str, now: float) -> float:
+        """
+        Refills the buckets an endpoint needs and returns how long until all have a token.
+        """
+        current = get_settings()
+        wait = 0.0
+        for name in ("global", endpoint):
+            limit = current.rate_limits.get(name)
+            if not limit:
+                continue
+            per_second = limit["rate"] / limit["per"]
+            bucket = self.refill(self.buckets.get(name), limit["burst"], per_second, now)
+            self.buckets[name] = bucket
+            if bucket["tokens"] < 1:
+                wait = max(wait, (1 - bucket["tokens"]) / per_second)
+        per_second = current.retry_budget_per_hour / 3600
+        self.retry_budget = self.refill(self.retry_budget, current.retry_budget, per_second, now)
+        if self.retry_budget["tokens"] < 1 and per_second > 0:
+            wait = max(wait, (1 - self.retry_budget["tokens"]) / per_second)
+        return wait
+
+    def acquire(self, endpoint: str) -> float:
+        """
+        Waits until a request to the endpoint is allowed and takes its tokens.
+
+        Parameters:
+        - endpoint (str): "login", "days", "payment" or "booking".
+
+        Returns:
+        - float: Seconds spent waiting.
+        """
+        if not get_settings().rate_limits_enabled:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.time()
+                wait = self.wait_time(endpoint, now)
+                if wait <= 0:
+                    for name in ("global", endpoint):
+                        if name in self.buckets and get_settings().rate_limits.get(name):
+                            self.buckets[name]["tokens"] -= 1
+                    self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+                    self.dirty = True
+                    break
+            if waited == 0:
+                print(f"Rate limit reached for {endpoint}, waiting {wait:.0f}s")
+            sleep_for = min(wait, 60)
+            time.sleep(sleep_for)
+            waited += sleep_for
+        self.maybe_save()
+        metrics.incr("requests_total", endpoint=endpoint)
+        if waited:
+            metrics.incr("rate_limit_wait_seconds_total", round(waited, 3), endpoint=endpoint)
+        metrics.gauge("rate_limit_tokens", round(self.buckets.get(endpoint, {}).get("tokens", 0), 2), endpoint=endpoint)
+        return waited
+
+    def record(self, endpoint: str, ok: bool) -> None:
+        """
+        Records the outcome of a request; failures spend the retry budget.
+
+        Parameters:
+        - endpoint (str): The endpoint passed to acquire().
+        - ok (bool): False for network errors and unexpected responses.
+        """
+        metrics.incr("request_outcomes_total", endpoint=endpoint, outcome="ok" if ok else "failed")
+        if ok or not get_settings().rate_limits_enabled:
+            return
+        with self.lock:
+            self.wait_time(endpoint, time.time())
+            self.retry_budget["tokens"] = max(0.0, self.retry_budget["tokens"] - 1)
+            self.dirty = True
+            remaining = self.retry_budget["tokens"]
+        self.maybe_save()
+        metrics.gauge("retry_budget_tokens", round(remaining, 2))
+        if remaining < 1:
+            print("Retry budget spent, slowing down until it refills")
+
+    @contextmanager
+    def request(self, endpoint: str):
+        """
+        Takes a token for the wrapped request and records its outcome; an exception
+        raised inside counts as a failure.
+
+        Parameters:
+        - endpoint (str): "login", "days", "payment" or "booking".
+        """
+        self.acquire(endpoint)
+        try:
+            yield
+        except Exception:
+            self.record(endpoint, False)
+            raise
+        self.record(endpoint, True)
+
+
+rate_limiter = RateLimiter()
 
 
 class RequestTracker:
-    def __init__(self, max_retries, max_time):
+    """
+    Counts one session's date requests and time against its limits, taking every
+    request through the shared rate limiter.
+    """
+
+    def __init__(self, max_retries, max_time, limiter: RateLimiter = rate_limiter):
         self.retries = 0
         self.max_retries = max_retries
         self.max_time = max_time
         self.start_time = time.time()
+        self.limiter = limiter
+
+    def acquire(self, endpoint: str = "days") -> None:
+        """
+        Counts a request of this session and waits for the rate limiter.
+        """
+        self.log_retry()
+        self.retry()
+        self.limiter.acquire(endpoint)
+
+    def record(self, ok: bool, endpoint: str = "days") -> None:
+        self.limiter.record(endpoint, ok)
 
     def retry(self):
         self.retries += 1
+        metrics.incr("retries_total")
 
     def should_retry(self):
         if self.retries > self.max_retries:
             print("Max retries reached")
+            metrics.event("session_limit", reason="max_retries", retries=self.retries)
             return False
         elapsed_time = time.time() - self.start_time
         if elapsed_time > self.max_time:
             print("Max time reached")
+            metrics.event("session_limit", reason="max_time", retries=self.retries)
             return False
         return True
 
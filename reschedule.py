@@ -1,52 +1,43 @@
+from __future__ import annotations
+
 import re
-import json
+import signal
+import argparse
 import traceback
 from datetime import datetime
-from time import sleep
-
-import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.webdriver import WebDriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
-from webdriver_manager.chrome import ChromeDriverManager
-
+from time import monotonic, sleep
+from typing import TYPE_CHECKING
+
+from browser_registry import register_browser, unregister_browser
+from days_parser import DaysParseError, DaysParser, first_acceptable_date
+from booking_standby import BookingStandby
+from driver_cache import get_driver_path, invalidate_driver_path
+from facilities import FACILITY_IDS
+from history import get_history
+from http_session import AisSession, PooledSession, get_base_url, log_dates
 from legacy_rescheduler import legacy_reschedule
-from request_tracker import RequestTracker
-#from settings import *
-
-# Load settings from settings.json
-def load_settings():
-    with open('settings.json', 'r') as f:
-        return json.load(f)
-
-settings = load_settings()
-
-# Assign settings to variables
-USER_EMAIL = settings.get("USER_EMAIL")
-USER_PASSWORD = settings.get("USER_PASSWORD")
-EARLIEST_ACCEPTABLE_DATE = settings.get("EARLIEST_ACCEPTABLE_DATE")
-LATEST_ACCEPTABLE_DATE = settings.get("LATEST_ACCEPTABLE_DATE")
-HEADLESS_MODE = settings.get("HEADLESS_MODE")
-TEST_MODE = settings.get("TEST_MODE")
-DETACH = settings.get("DETACH")
-NEW_SESSION_AFTER_FAILURES = int(settings.get("NEW_SESSION_AFTER_FAILURES", 5))
-NEW_SESSION_DELAY = int(settings.get("NEW_SESSION_DELAY", 120))
-TIMEOUT = int(settings.get("TIMEOUT", 10))
-FAIL_RETRY_DELAY = int(settings.get("FAIL_RETRY_DELAY", 30))
-DATE_REQUEST_DELAY = int(settings.get("DATE_REQUEST_DELAY", 30))
-DATE_REQUEST_MAX_RETRY = int(settings.get("DATE_REQUEST_MAX_RETRY", 60))
-DATE_REQUEST_MAX_TIME = int(settings.get("DATE_REQUEST_MAX_TIME", 1800))
-LOGIN_URL = settings.get("LOGIN_URL")
-AVAILABLE_DATE_REQUEST_SUFFIX = settings.get("AVAILABLE_DATE_REQUEST_SUFFIX")
-APPOINTMENT_PAGE_URL = settings.get("APPOINTMENT_PAGE_URL")
-PAYMENT_PAGE_URL = settings.get("PAYMENT_PAGE_URL")
+from metrics import metrics
+from payment_parser import parse_payment_date, parse_payment_page
+from poll_scheduler import BUSY, ERROR, OK, PollScheduler
+from profiling import enable as enable_profiling, profiled, write_reports
+from request_tracker import RequestTracker, rate_limiter
+from session_rotation import SessionRotator, coverage
+from session_store import clear_session, load_session, save_session
+from settings import get_settings
+from status_channel import status
+from waits import timed_step, wait_for_page_ready
+
+# Selenium is imported where it is used, so HTTP polling starts without loading it
+if TYPE_CHECKING:
+    from selenium.webdriver.chrome.webdriver import WebDriver
+
 REQUEST_HEADERS = {
     "X-Requested-With": "XMLHttpRequest"
 }
 
+# Browser kept alive across sessions when REUSE_BROWSER is set
+shared_driver = None
+
 
 def get_chrome_driver() -> WebDriver:
     """
@@ -56,18 +47,89 @@ def get_chrome_driver() -> WebDriver:
     - WebDriver: An instance of Chrome WebDriver configured with headless or visible GUI 
       based on the settings.
     """
+    from selenium import webdriver
+    from selenium.common.exceptions import SessionNotCreatedException
+    from selenium.webdriver.chrome.service import Service
+
     options = webdriver.ChromeOptions()
-    if HEADLESS_MODE:
+    settings = get_settings()
+    if settings.headless_mode:
         options.add_argument("headless")
         options.add_argument("window-size=1920x1080")
         options.add_argument("disable-gpu")
-    options.add_experimental_option("detach", DETACH)
-    driver = webdriver.Chrome(
-        service=Service(ChromeDriverManager().install()), options=options
-    )
+    options.add_experimental_option("detach", settings.detach)
+    with metrics.span("session_start"):
+        driver_path = get_driver_path()
+        try:
+            driver = webdriver.Chrome(service=Service(driver_path), options=options)
+        except SessionNotCreatedException:
+            # Chrome was probably updated past the cached driver
+            invalidate_driver_path()
+            driver = webdriver.Chrome(service=Service(get_driver_path(refresh=True)), options=options)
+    register_browser(driver)
     return driver
 
 
+def get_session_driver() -> WebDriver:
+    """
+    Returns the browser to use for a new session.
+
+    With REUSE_BROWSER, the browser of the previous session is handed out again if
+    it is still responsive, instead of launching a new Chrome.
+
+    Returns:
+    - WebDriver: A driver with no AIS cookies.
+    """
+    from selenium.common.exceptions import WebDriverException
+
+    global shared_driver
+    if not get_settings().reuse_browser:
+        return get_chrome_driver()
+    if shared_driver is not None:
+        try:
+            shared_driver.current_url
+            return shared_driver
+        except WebDriverException:
+            print("Reused browser is not responding, starting a new one")
+            quit_driver(shared_driver)
+    shared_driver = get_chrome_driver()
+    return shared_driver
+
+
+def release_session_driver(driver: WebDriver) -> None:
+    """
+    Ends a session's use of the browser: clears its cookies so the next session
+    signs in from scratch, or quits it when REUSE_BROWSER is off.
+
+    Parameters:
+    - driver (WebDriver): The driver returned by get_session_driver().
+    """
+    from selenium.common.exceptions import WebDriverException
+
+    global shared_driver
+    if not get_settings().reuse_browser or driver is not shared_driver:
+        quit_driver(driver)
+        return
+    try:
+        driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        driver.get("about:blank")
+    except WebDriverException as e:
+        print("Unable to reset browser, quitting it: ", e)
+        quit_driver(driver)
+        shared_driver = None
+
+
+def quit_driver(driver: WebDriver) -> None:
+    from selenium.common.exceptions import WebDriverException
+
+    try:
+        driver.quit()
+    except WebDriverException:
+        pass
+    unregister_browser(driver)
+
+
+@profiled("login")
 def login(driver: WebDriver) -> None:
     """
     Logs in to the appointment website using the provided WebDriver instance.
@@ -78,30 +140,40 @@ def login(driver: WebDriver) -> None:
     Returns:
     - None. Logs in to the website using pre-configured user credentials.
     """
-    driver.get(LOGIN_URL)
-    timeout = TIMEOUT
-    sleep(10)
-    email_input = WebDriverWait(driver, timeout).until(
-        EC.visibility_of_element_located((By.ID, "user_email"))
-    )
-    email_input.send_keys(USER_EMAIL)
-
-    password_input = WebDriverWait(driver, timeout).until(
-        EC.visibility_of_element_located((By.ID, "user_password"))
-    )
-    password_input.send_keys(USER_PASSWORD)
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    settings = get_settings()
+    with rate_limiter.request("login"):
+        with timed_step("login page load"):
+            driver.get(settings.login_url)
+            wait_for_page_ready(driver)
+        timeout = settings.timeout
+        email_input = WebDriverWait(driver, timeout).until(
+            EC.visibility_of_element_located((By.ID, "user_email"))
+        )
+        email_input.send_keys(settings.user_email)
+
+        password_input = WebDriverWait(driver, timeout).until(
+            EC.visibility_of_element_located((By.ID, "user_password"))
+        )
+        password_input.send_keys(settings.user_password)
     
-    policy_checkbox = WebDriverWait(driver, timeout).until(
-        EC.element_to_be_clickable((By.CLASS_NAME, "icheckbox"))
-    )
-    policy_checkbox.click()
+        policy_checkbox = WebDriverWait(driver, timeout).until(
+            EC.element_to_be_clickable((By.CLASS_NAME, "icheckbox"))
+        )
+        policy_checkbox.click()
 
-    login_button = WebDriverWait(driver, timeout).until(
-        EC.element_to_be_clickable((By.NAME, "commit"))
-    )
-    login_button.click()
+        login_button = WebDriverWait(driver, timeout).until(
+            EC.element_to_be_clickable((By.NAME, "commit"))
+        )
+        with timed_step("login submit"):
+            login_button.click()
+            wait_for_page_ready(driver)
 
 
+@profiled("get_appointment_page")
 def get_appointment_page(driver: WebDriver) -> None:
     """
     Navigates to the appointment page after logging in.
@@ -112,125 +184,433 @@ def get_appointment_page(driver: WebDriver) -> None:
     Returns:
     - None. Navigates to the appointment page using the current URL.
     """
-    timeout = TIMEOUT
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    settings = get_settings()
+    timeout = settings.timeout
     continue_button = WebDriverWait(driver, timeout).until(
         EC.element_to_be_clickable((By.LINK_TEXT, "Continue"))
     )
     continue_button.click()
     current_url = driver.current_url
     url_id = re.search(r"/(\d+)", current_url).group(1)
-    appointment_url = APPOINTMENT_PAGE_URL.format(id=url_id)
-    driver.get(appointment_url)
+    appointment_url = settings.appointment_page_url.format(id=url_id)
+    with timed_step("appointment page load"):
+        driver.get(appointment_url)
+        wait_for_page_ready(driver)
+    save_session(driver.get_cookies(), url_id)
+
+
+def resume_session(driver: WebDriver) -> bool:
+    """
+    Restores the session saved by an earlier run into the browser and opens the appointment page.
+
+    Parameters:
+    - driver (WebDriver): A Selenium WebDriver instance controlling the browser.
+
+    Returns:
+    - bool: True if the saved session is still signed in, False if a full login is needed.
+    """
+    from selenium.common.exceptions import WebDriverException
 
+    saved = load_session()
+    if saved is None:
+        return False
+    try:
+        # Cookies can only be added for the domain of the current page
+        driver.get(get_base_url() + "/users/sign_in")
+        for cookie in saved["cookies"]:
+            driver.add_cookie({"name": cookie["name"], "value": cookie["value"], "path": cookie.get("path", "/")})
+        # Checking a saved session loads the appointment page, it is not a sign in
+        with rate_limiter.request("booking"):
+            driver.get(get_settings().appointment_page_url.format(id=saved["schedule_id"]))
+            wait_for_page_ready(driver)
+    except WebDriverException as e:
+        print("Unable to check saved session: ", e)
+        return False
+    if "/users/sign_in" in driver.current_url:
+        print("Saved session expired, signing in again")
+        clear_session()
+        driver.delete_all_cookies()
+        return False
+    print("Resumed saved session")
+    return True
 
-def get_available_dates(driver: WebDriver, request_tracker: RequestTracker) -> list | None:
+
+@profiled("get_available_dates")
+def get_available_dates(
+    driver: WebDriver,
+    request_tracker: RequestTracker,
+    http_session: PooledSession | None = None,
+    days_parser: DaysParser | None = None,
+) -> list | None:
     """
     Retrieves a list of available appointment dates from the appointment page.
 
     Parameters:
     - driver (WebDriver): A Selenium WebDriver instance controlling the browser.
     - request_tracker (RequestTracker): Tracks retries and request timeouts.
+    - http_session (PooledSession | None): Keep-alive session owned by the polling loop.
+      Without one, a throwaway session is built from the driver's cookies.
+    - days_parser (DaysParser | None): Remembers the last response, to skip unchanged ones.
 
     Returns:
-    - list | None: A list of available dates if successful, None otherwise.
+    - list | None: The available dates as ISO strings in ascending order if
+      successful, None otherwise.
     """
-    request_tracker.log_retry()
-    request_tracker.retry()
+    request_tracker.acquire("days")
+    if http_session is None:
+        http_session = create_driver_http_session(driver)
+    if days_parser is None:
+        days_parser = DaysParser()
     current_url = driver.current_url
-    request_url = current_url + AVAILABLE_DATE_REQUEST_SUFFIX
-    request_header_cookie = "".join(
-        [f"{cookie['name']}={cookie['value']};" for cookie in driver.get_cookies()]
-    )
-    request_headers = REQUEST_HEADERS.copy()
-    request_headers["Cookie"] = request_header_cookie
-    request_headers["User-Agent"] = driver.execute_script("return navigator.userAgent")
+    settings = get_settings()
+    request_url = current_url + settings.available_date_request_suffix
     try:
-        response = requests.get(request_url, headers=request_headers)
+        with metrics.span("poll", source="driver"):
+            response = http_session.get(
+                request_url, headers={**REQUEST_HEADERS, **days_parser.request_headers()}, timeout=settings.timeout
+            )
     except Exception as e:
         print("Get available dates request failed: ", e)
+        metrics.incr("request_failures_total", endpoint="days")
+        request_tracker.record(False)
         return None
-    if response.status_code != 200:
+    metrics.incr("http_responses_total", endpoint="days", status=response.status_code)
+    if response.status_code not in (200, 304):
         print(f"Failed with status code {response.status_code}")
+        request_tracker.record(False)
         return None
-    try:
-        dates_json = response.json()
-    except:
-        print("Failed to decode json")
-        return None
-    dates = [datetime.strptime(item["date"], "%Y-%m-%d").date() for item in dates_json]
-    print(dates)
+    with metrics.span("parse"):
+        try:
+            dates, changed = days_parser.parse(response.status_code, response.content, response.headers.get("ETag"))
+        except DaysParseError:
+            print("Failed to decode json")
+            metrics.incr("json_decode_failures_total", endpoint="days")
+            request_tracker.record(False)
+            return None
+    request_tracker.record(True)
+    log_dates(dates, changed, response.status_code)
     return dates
 
 
-def reschedule(driver: WebDriver) -> bool:
+def poll_facilities(session: AisSession, request_tracker: RequestTracker) -> tuple[str | None, list | None]:
     """
-    Attempts to reschedule the appointment by selecting the earliest available date.
+    Polls every facility in ACCEPTABLE_CITIES with one payment page request, and the
+    days endpoint only of those whose earliest date there is inside the window.
+
+    Parameters:
+    - session (AisSession): A signed in browserless session.
+    - request_tracker (RequestTracker): Tracks retries and request timeouts.
+
+    Returns:
+    - tuple[str | None, list | None]: The first facility with an acceptable date and
+      its dates, or else the facility with the earliest date. (None, None) if the
+      requests failed, (None, []) if no watched facility has any date.
+    """
+    settings = get_settings()
+    history = get_history()
+    try:
+        with metrics.span("payment_page", source="http"):
+            pairs = parse_payment_page(session.get_payment_page(request_tracker))
+    except Exception as e:
+        print("Get payment page request failed: ", e)
+        return None, None
+    overview = []
+    for city, text in pairs:
+        if city not in settings.acceptable_cities:
+            continue
+        try:
+            earliest = parse_payment_date(text)
+        except ValueError:
+            print(f"Unable to read the date of {city}: {text}")
+            continue
+        if history is not None:
+            history.record(city, [earliest] if earliest else [], source="payment")
+        if earliest is not None:
+            overview.append((earliest, city))
+    if not overview:
+        return None, []
+    overview.sort()
+
+    fetched = {}
+    failed = False
+    for earliest, city in overview:
+        if earliest > settings.latest_acceptable_date:
+            break
+        dates = session.get_available_dates(request_tracker, FACILITY_IDS[city])
+        if dates is None:
+            failed = True
+            continue
+        fetched[city] = dates
+        if history is not None:
+            history.record(city, dates)
+        if first_acceptable_date(dates, settings) is not None:
+            return city, dates
+    if failed:
+        return None, None
+    # Nothing acceptable: report the earliest date of all, whose days were only fetched if in the window
+    earliest, city = overview[0]
+    return city, fetched.get(city, [earliest.isoformat()])
+
+
+def create_driver_http_session(driver: WebDriver) -> PooledSession:
+    """
+    Creates a keep-alive HTTP session carrying the driver's cookies and user agent.
 
     Parameters:
     - driver (WebDriver): A Selenium WebDriver instance controlling the browser.
 
+    Returns:
+    - PooledSession: The session to poll with.
+    """
+    http_session = PooledSession()
+    http_session.headers["User-Agent"] = driver.execute_script("return navigator.userAgent")
+    http_session.sync_cookies(driver.get_cookies())
+    return http_session
+
+
+def reschedule(
+    driver: WebDriver | None = None,
+    session: AisSession | None = None,
+    scheduler: PollScheduler | None = None,
+    rotator: SessionRotator | None = None,
+) -> bool:
+    """
+    Attempts to reschedule the appointment by selecting the earliest available date.
+
+    Dates are polled over plain HTTP when a session or rotator is given, otherwise
+    through the driver. When polling over HTTP, a browser is only started once a slot
+    is found.
+
+    Parameters:
+    - driver (WebDriver | None): A Selenium WebDriver instance controlling the browser.
+    - session (AisSession | None): A signed in browserless session.
+    - scheduler (PollScheduler | None): Spaces the date requests; pass one in to keep
+      its backoff state across sessions.
+    - rotator (SessionRotator | None): Supplies the session to poll with and replaces
+      it before it reaches its limits; polling ends when it has no session left.
+
     Returns:
     - bool: True if the rescheduling was successful, False otherwise.
     """
-    date_request_tracker = RequestTracker(DATE_REQUEST_MAX_RETRY, DATE_REQUEST_MAX_TIME)
-    while date_request_tracker.should_retry():
-        dates = get_available_dates(driver, date_request_tracker)
-        if not dates:
+    if scheduler is None:
+        scheduler = PollScheduler()
+    history = get_history()
+    settings = get_settings()
+    date_request_tracker = RequestTracker(settings.date_request_max_retry, settings.date_request_max_time)
+    http_session = None
+    days_parser = DaysParser()
+    standby = BookingStandby()
+    if rotator is not None:
+        session = rotator.session
+    if session is None:
+        http_session = create_driver_http_session(driver)
+        booking_session, appointment_url = http_session, driver.current_url
+    else:
+        booking_session, appointment_url = session.http, session.appointment_url
+    if session is None and settings.acceptable_cities:
+        print("ACCEPTABLE_CITIES needs HTTP_POLLING, watching SELECTED_CITY only")
+    while True:
+        if rotator is not None:
+            # Switches to the pre-warmed replacement instead of ending the session
+            session, date_request_tracker = rotator.current()
+            if session is None:
+                break
+            booking_session, appointment_url = session.http, session.appointment_url
+        elif not date_request_tracker.should_retry():
+            break
+        standby.attach(booking_session, appointment_url)
+        standby.refresh_if_due()
+        # Several facilities are watched through the payment page overview
+        multi_facility = session is not None and bool(get_settings().acceptable_cities)
+        facility = get_settings().selected_city
+        if multi_facility:
+            facility, dates = poll_facilities(session, date_request_tracker)
+        elif session is not None:
+            dates = session.get_available_dates(date_request_tracker)
+        else:
+            dates = get_available_dates(driver, date_request_tracker, http_session, days_parser)
+        if dates is None:
             print("Error occured when requesting available dates")
-            sleep(DATE_REQUEST_DELAY)
+            status.report("poll", outcome=ERROR)
+            scheduler.record(ERROR)
+            scheduler.wait()
             continue
+        if not dates:
+            print("No available dates, the system may be busy")
+            status.report("poll", outcome=BUSY)
+            scheduler.record(BUSY)
+            scheduler.wait()
+            continue
+        scheduler.record(OK)
+        # Picks up edits to settings.json made while polling
+        settings = get_settings()
+        if history is not None and not multi_facility:
+            history.record(facility, dates)
         earliest_available_date = dates[0]
-        latest_acceptable_date = datetime.strptime(LATEST_ACCEPTABLE_DATE, "%Y-%m-%d").date()
-
-        if earliest_available_date <= latest_acceptable_date:
-            print(f"{datetime.now().strftime('%H:%M:%S')} FOUND SLOT ON {earliest_available_date}!!!")
+        location = facility if multi_facility else None
+        where = f", location: {location}" if location else ""
+        status.report("poll", outcome=OK, earliest=earliest_available_date, location=location)
+
+        slot_date = first_acceptable_date(dates, settings)
+        if slot_date is not None:
+            detected_at = monotonic()
+            print(f"{datetime.now().strftime('%H:%M:%S')} FOUND SLOT ON {slot_date}{where}!!!")
+            status.report("slot_found", date=slot_date, location=location)
             try:
-                legacy_reschedule(driver)
+                with metrics.span("booking_attempt", path="direct"):
+                    booked = standby.book(slot_date, FACILITY_IDS.get(location) if location else None, detected_at)
+                if booked:
+                    print("SUCCESSFULLY RESCHEDULED!!!")
+                    status.report("rescheduled", date=slot_date)
+                    return True
+                scheduler.wait()
+                continue
+            except Exception as e:
+                print("Direct rescheduling failed, falling back to the datepicker: ", e)
+            try:
+                if driver is None:
+                    driver = get_booking_driver()
+                with metrics.span("booking_attempt", path="legacy"):
+                    legacy_reschedule(driver, location, detected_at)
                 print("SUCCESSFULLY RESCHEDULED!!!")
+                status.report("rescheduled", date=slot_date)
                 return True
             except Exception as e:
                 print("Rescheduling failed: ", e)
+                status.report("error", message=f"Rescheduling failed: {e}")
                 traceback.print_exc()
+                if http_session is not None:
+                    # The booking attempt navigated the browser, pick up any renewed cookies
+                    http_session.sync_cookies(driver.get_cookies())
                 continue
         else:
-            print(f"{datetime.now().strftime('%H:%M:%S')} Earliest available date is {earliest_available_date}")
-        sleep(DATE_REQUEST_DELAY)
+            print(f"{datetime.now().strftime('%H:%M:%S')} Earliest available date is {earliest_available_date}{where}")
+        scheduler.wait()
+    if http_session is not None:
+        http_session.log_connection_stats()
+        http_session.close()
+    if session is not None and driver is not None:
+        release_session_driver(driver)
     return False
 
 
-def reschedule_with_new_session() -> bool:
+def get_booking_driver() -> WebDriver:
+    """
+    Starts a browser and opens the appointment page, for booking after HTTP polling found a slot.
+
+    Returns:
+    - WebDriver: A logged in driver on the appointment page.
+    """
+    driver = get_session_driver()
+    try:
+        login(driver)
+        get_appointment_page(driver)
+    except Exception:
+        release_session_driver(driver)
+        raise
+    return driver
+
+
+def reschedule_with_new_session(scheduler: PollScheduler | None = None, resume: bool = False) -> bool:
     """
     Attempts to reschedule by creating a new session, logging in, and trying to reschedule the appointment.
 
+    Parameters:
+    - scheduler (PollScheduler | None): Poll scheduler shared across sessions.
+    - resume (bool): Try the session saved by an earlier run before logging in.
+
     Returns:
     - bool: True if the rescheduling was successful, False otherwise.
     """
-    driver = get_chrome_driver()
+    driver = get_session_driver()
     session_failures = 0
-    while session_failures < NEW_SESSION_AFTER_FAILURES:
+    signed_in = resume and resume_session(driver)
+    while not signed_in and session_failures < get_settings().new_session_after_failures:
         try:
-            login(driver)
-            get_appointment_page(driver)
-            break
+            with metrics.span("login", source="driver"):
+                login(driver)
+                get_appointment_page(driver)
+            signed_in = True
         except Exception as e:
             print("Unable to get appointment page: ", e)
+            status.report("error", message=f"Unable to get appointment page: {e}")
             session_failures += 1
-            sleep(FAIL_RETRY_DELAY)
-            continue
-    rescheduled = reschedule(driver)
-    if rescheduled:
-        return True
-    else:
-        driver.quit()
+            sleep(get_settings().fail_retry_delay)
+    if not signed_in:
+        release_session_driver(driver)
         return False
+    coverage.set_active(True)
+    rescheduled = False
+    try:
+        rescheduled = reschedule(driver, scheduler=scheduler)
+    finally:
+        coverage.set_active(False)
+        # Keep the browser open only to show a successful booking
+        if not rescheduled:
+            release_session_driver(driver)
+    return rescheduled
+
+
+def reschedule_with_new_http_session(scheduler: PollScheduler | None = None, resume: bool = False) -> bool:
+    """
+    Attempts to reschedule by signing in over plain HTTP and polling without a browser.
+
+    The session is rotated to a freshly signed in one before it reaches its limits,
+    so this only returns once rescheduled or when no replacement could be signed in.
+
+    Parameters:
+    - scheduler (PollScheduler | None): Poll scheduler shared across sessions.
+    - resume (bool): Try the session saved by an earlier run before signing in.
+
+    Returns:
+    - bool: True if the rescheduling was successful, False otherwise.
+    """
+    rotator = SessionRotator()
+    try:
+        if not rotator.start(resume):
+            return False
+        return reschedule(scheduler=scheduler, rotator=rotator)
+    finally:
+        rotator.close()
+
+
+def handle_sigterm(signum, frame):
+    # Unwinds like Ctrl+C, so the finally blocks close the session and release the browser
+    raise SystemExit(128 + signum)
 
 
 if __name__ == "__main__":
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    parser = argparse.ArgumentParser(description="Poll for an earlier appointment and book it")
+    parser.add_argument("--profile", metavar="DIR", help="profile the login, polling and booking stages into DIR")
+    args = parser.parse_args()
+    if args.profile:
+        enable_profiling(args.profile)
+
     session_count = 0
-    while True:
-        session_count += 1
-        print(f"Attempting with new session #{session_count}")
-        rescheduled = reschedule_with_new_session()
-        sleep(NEW_SESSION_DELAY)
-        if rescheduled:
-            break
+    scheduler = PollScheduler()
+    rescheduled = False
+    try:
+        while True:
+            session_count += 1
+            print(f"Attempting with new session #{session_count}")
+            status.report("session", number=session_count)
+            # Only a restart resumes the saved session, later sessions sign in afresh
+            resume = session_count == 1
+            if get_settings().http_polling:
+                rescheduled = reschedule_with_new_http_session(scheduler, resume)
+            else:
+                rescheduled = reschedule_with_new_session(scheduler, resume)
+            metrics.flush()
+            write_reports()
+            sleep(get_settings().new_session_delay)
+            if rescheduled:
+                break
+    finally:
+        # A session only clears the cookies of a reused browser; quit it unless it shows a booking
+        if not rescheduled and shared_driver is not None:
+            quit_driver(shared_driver)
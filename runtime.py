@@ -0,0 +1,467 @@
+"""
+Runs polling, booking, notifications and a status endpoint on one asyncio event loop.
+
+The __main__ loops of reschedule.py and detect_and_notify.py do one thing at a
+time and spend most of it in sleep(). Here each job is a cancellable task:
+
+- the poller signs in, polls and waits between polls with asyncio.sleep(), so a
+  stop request ends the wait at once;
+- the booking worker books slots handed over by the poller while polling goes on;
+- the notifier task batches and delivers notifications for found slots;
+- the status endpoint answers GET http://127.0.0.1:RUNTIME_STATUS_PORT/ with JSON.
+
+Blocking calls run in a ThreadPoolExecutor of RUNTIME_WORKERS threads, and
+Selenium calls in a separate one-thread executor because a driver must only be
+used by one thread at a time. SIGINT and SIGTERM cancel the tasks, close the
+sessions and quit the browser.
+
+Usage:
+    python runtime.py [--detect]
+    python supervisor.py --worker runtime.py
+"""
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from booking_standby import BookingStandby
+from days_parser import DaysParser, first_acceptable_date
+from detect_and_notify import detect_and_notify, notifier, split_locations_and_dates
+from facilities import FACILITY_IDS
+from history import get_history
+from legacy_rescheduler import legacy_reschedule
+from metrics import metrics
+from payment_parser import parse_payment_page
+from poll_scheduler import BUSY, ERROR, OK, PollScheduler
+from profiling import enable as enable_profiling, write_reports
+from request_tracker import RequestTracker
+from session_rotation import SessionRotator, coverage
+from settings import get_settings
+from status_channel import status
+import reschedule
+
+
+class Runtime:
+    """
+    Owns the tasks, executors, sessions and browser of one run.
+    """
+
+    def __init__(self, detect_only: bool = False):
+        settings = get_settings()
+        self.detect_only = detect_only
+        self.status_port = settings.runtime_status_port
+        self.shutdown_timeout = settings.runtime_shutdown_timeout
+        self.executor = ThreadPoolExecutor(max_workers=settings.runtime_workers, thread_name_prefix="runtime")
+        self.browser_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="browser")
+        self.scheduler = PollScheduler()
+        self.standby = BookingStandby()
+        self.rotator = None
+        self.driver = None
+        self.driver_polling = None
+        self.tasks = {}
+        self.loop = None
+        self.slots = None
+        self.notifications = None
+        self.stopping = None
+        self.booking = False
+        self.rescheduled = False
+        self.state = {
+            "mode": "detect" if detect_only else "reschedule",
+            "started_at": time.time(),
+            "session": 0,
+            "polls": 0,
+            "last_poll": None,
+            "earliest": None,
+            "booking": "idle",
+            "last_error": None,
+        }
+
+    # Executors
+
+    async def blocking(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def in_browser(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.browser_executor, function, *args)
+
+    def error(self, message: str) -> None:
+        print(message)
+        status.report("error", message=message)
+        self.state["last_error"] = {"time": time.time(), "message": message}
+
+    # Sessions
+
+    def open_http_session(self, resume: bool) -> bool:
+        self.rotator = SessionRotator()
+        return self.rotator.start(resume)
+
+    def open_driver_session(self, resume: bool) -> bool:
+        driver = reschedule.get_session_driver()
+        self.driver = driver
+        signed_in = resume and reschedule.resume_session(driver)
+        failures = 0
+        while not signed_in and failures < get_settings().new_session_after_failures:
+            try:
+                with metrics.span("login", source="driver"):
+                    reschedule.login(driver)
+                    reschedule.get_appointment_page(driver)
+                signed_in = True
+            except Exception as e:
+                self.error(f"Unable to get appointment page: {e}")
+                failures += 1
+                time.sleep(get_settings().fail_retry_delay)
+        if not signed_in:
+            return False
+        current = get_settings()
+        self.driver_polling = {
+            "http": reschedule.create_driver_http_session(driver),
+            "url": driver.current_url,
+            "tracker": RequestTracker(current.date_request_max_retry, current.date_request_max_time),
+            "days": DaysParser(),
+        }
+        coverage.set_active(True)
+        return True
+
+    def close_session(self) -> None:
+        if self.rotator is not None:
+            self.rotator.close()
+            self.rotator = None
+        if self.driver_polling is not None:
+            coverage.set_active(False)
+            self.driver_polling["http"].close()
+            self.driver_polling = None
+
+    def release_driver(self) -> None:
+        """
+        Hands the polling browser back between sessions; it is quit at shutdown.
+        """
+        if self.driver is not None and not self.booking:
+            reschedule.release_session_driver(self.driver)
+            self.driver = None
+
+    def quit_driver(self) -> None:
+        if self.driver is None:
+            return
+        reschedule.quit_driver(self.driver)
+        if reschedule.shared_driver is self.driver:
+            reschedule.shared_driver = None
+        self.driver = None
+
+    # Polling
+
+    def poll_http(self) -> tuple | None:
+        """
+        Polls once with the rotated HTTP session.
+
+        Returns:
+        - tuple | None: (outcome, facility, dates), None once the session is over.
+        """
+        session, tracker = self.rotator.current()
+        if session is None:
+            return None
+        current = get_settings()
+        if self.detect_only:
+            try:
+                with metrics.span("payment_page", source="http"):
+                    pairs = parse_payment_page(session.get_payment_page(tracker))
+            except Exception as e:
+                self.error(f"Unable to get payment page: {e}")
+                return ERROR, None, None
+            detect_and_notify(*split_locations_and_dates(pairs), notify=self.notify_threadsafe)
+            return OK, None, None
+        self.standby.attach(session.http, session.appointment_url)
+        self.standby.refresh_if_due()
+        if current.acceptable_cities:
+            facility, dates = reschedule.poll_facilities(session, tracker)
+        else:
+            facility, dates = current.selected_city, session.get_available_dates(tracker)
+            history = get_history()
+            if history is not None and dates:
+                history.record(facility, dates)
+        return self.outcome(dates), facility, dates
+
+    def poll_driver(self) -> tuple | None:
+        """
+        Polls once through the browser's cookies, on the browser thread.
+
+        Returns:
+        - tuple | None: (outcome, facility, dates), None once the session is over.
+        """
+        polling = self.driver_polling
+        if not polling["tracker"].should_retry():
+            return None
+        self.standby.attach(polling["http"], polling["url"])
+        self.standby.refresh_if_due()
+        dates = reschedule.get_available_dates(self.driver, polling["tracker"], polling["http"], polling["days"])
+        facility = get_settings().selected_city
+        history = get_history()
+        if history is not None and dates:
+            history.record(facility, dates)
+        return self.outcome(dates), facility, dates
+
+    @staticmethod
+    def outcome(dates: list | None) -> str:
+        if dates is None:
+            return ERROR
+        return OK if dates else BUSY
+
+    async def poller(self) -> None:
+        session_count = 0
+        while True:
+            session_count += 1
+            self.state["session"] = session_count
+            print(f"Attempting with new session #{session_count}")
+            status.report("session", number=session_count)
+            # Only a restart resumes the saved session, later sessions sign in afresh
+            resume = session_count == 1
+            driver_mode = not get_settings().http_polling and not self.detect_only
+            try:
+                if driver_mode:
+                    signed_in = await self.in_browser(self.open_driver_session, resume)
+                else:
+                    signed_in = await self.blocking(self.open_http_session, resume)
+                if signed_in:
+                    await self.poll_session(driver_mode)
+            finally:
+                await self.blocking(self.close_session)
+                if driver_mode:
+                    await self.in_browser(self.release_driver)
+            metrics.flush()
+            write_reports()
+            await asyncio.sleep(get_settings().new_session_delay)
+
+    async def poll_session(self, driver_mode: bool) -> None:
+        while True:
+            if driver_mode:
+                result = await self.in_browser(self.poll_driver)
+            else:
+                result = await self.blocking(self.poll_http)
+            if result is None:
+                return
+            outcome, facility, dates = result
+            self.scheduler.record(outcome)
+            self.state["polls"] += 1
+            self.state["last_poll"] = {"time": time.time(), "outcome": outcome}
+            if outcome == ERROR:
+                print("Error occured when requesting available dates")
+                status.report("poll", outcome=ERROR)
+            elif outcome == BUSY:
+                print("No available dates, the system may be busy")
+                status.report("poll", outcome=BUSY)
+            elif dates:
+                self.found(facility, dates)
+            delay = self.scheduler.next_delay()
+            metrics.gauge("poll_interval_seconds", round(delay, 3))
+            await asyncio.sleep(delay)
+
+    def found(self, facility: str, dates: list) -> None:
+        """
+        Reports a poll result and hands an acceptable date to the booking worker.
+        """
+        current = get_settings()
+        location = facility if current.acceptable_cities else None
+        where = f", location: {location}" if location else ""
+        self.state["earliest"] = {"date": dates[0], "location": facility}
+        status.report("poll", outcome=OK, earliest=dates[0], location=location)
+        slot_date = first_acceptable_date(dates, current)
+        if slot_date is None:
+            print(f"{datetime.now().strftime('%H:%M:%S')} Earliest available date is {dates[0]}{where}")
+            return
+        print(f"{datetime.now().strftime('%H:%M:%S')} FOUND SLOT ON {slot_date}{where}!!!")
+        status.report("slot_found", date=slot_date, location=location)
+        self.queue_notification(facility, slot_date.isoformat())
+        if self.booking:
+            return
+        try:
+            self.slots.put_nowait((location, slot_date, time.monotonic()))
+        except asyncio.QueueFull:
+            pass
+
+    # Booking
+
+    async def booker(self) -> None:
+        while True:
+            location, slot_date, detected_at = await self.slots.get()
+            self.booking = True
+            self.state["booking"] = "running"
+            try:
+                booked = await self.book(location, slot_date, detected_at)
+            finally:
+                self.booking = False
+            self.state["booking"] = "booked" if booked else "idle"
+            if booked:
+                print("SUCCESSFULLY RESCHEDULED!!!")
+                status.report("rescheduled", date=slot_date)
+                self.rescheduled = True
+                self.stopping.set()
+                return
+
+    async def book(self, location: str | None, slot_date, detected_at: float) -> bool:
+        facility_id = FACILITY_IDS.get(location) if location else None
+        try:
+            with metrics.span("booking_attempt", path="direct"):
+                return await self.blocking(self.standby.book, slot_date, facility_id, detected_at)
+        except Exception as e:
+            print("Direct rescheduling failed, falling back to the datepicker: ", e)
+        try:
+            with metrics.span("booking_attempt", path="legacy"):
+                await self.in_browser(self.legacy_book, location, detected_at)
+            return True
+        except Exception as e:
+            self.error(f"Rescheduling failed: {e}")
+            return False
+
+    def legacy_book(self, location: str | None, detected_at: float) -> None:
+        if self.driver is None:
+            self.driver = reschedule.get_booking_driver()
+        legacy_reschedule(self.driver, location, detected_at)
+
+    # Notifications
+
+    def notify_threadsafe(self, location: str, date: str) -> None:
+        self.loop.call_soon_threadsafe(self.queue_notification, location, date)
+
+    def queue_notification(self, location: str, date: str) -> None:
+        if not notifier.channels:
+            return
+        claim = notifier.claim(location, date)
+        if claim is None:
+            return
+        try:
+            self.notifications.put_nowait(claim)
+        except asyncio.QueueFull:
+            notifier.release(*claim)
+            metrics.incr("notifications_total", result="dropped")
+            print(f"Notification queue full, dropped slot {date} at {location}")
+
+    async def notification_sender(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.notifications.get()]
+            deadline = loop.time() + notifier.batch_window
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    batch.append(await asyncio.wait_for(self.notifications.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self.blocking(notifier.deliver_batch, batch)
+
+    # Status endpoint
+
+    def snapshot(self) -> dict:
+        age = self.standby.age()
+        return {
+            **self.state,
+            "uptime": round(time.time() - self.state["started_at"], 1),
+            "coverage": round(coverage.ratio(), 4),
+            "standby_age": round(age, 1) if age is not None else None,
+            "tasks": {name: "running" if not task.done() else "done" for name, task in self.tasks.items()},
+        }
+
+    async def serve_status(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            # The request itself does not matter: every GET gets the snapshot
+            while (await asyncio.wait_for(reader.readline(), 5)).strip():
+                pass
+            body = json.dumps(self.snapshot(), default=str, indent=4).encode("utf-8")
+            writer.write(
+                b"HTTP/1.0 200 OK\r\nContent-Type: application/json\r\n"
+                + f"Content-Length: {len(body)}\r\n\r\n".encode("ascii") + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def status_server(self) -> None:
+        try:
+            server = await asyncio.start_server(self.serve_status, "127.0.0.1", self.status_port)
+        except OSError as e:
+            # Polling goes on without the endpoint
+            self.error(f"Unable to serve status on port {self.status_port}: {e}")
+            return
+        print(f"Status on http://127.0.0.1:{self.status_port}/")
+        async with server:
+            await server.serve_forever()
+
+    # Lifecycle
+
+    async def run(self) -> int:
+        """
+        Runs until a slot is booked or a stop signal arrives.
+
+        Returns:
+        - int: 0 once rescheduled, 1 otherwise.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        self.slots = asyncio.Queue(maxsize=1)
+        self.notifications = asyncio.Queue(maxsize=notifier.queue.maxsize)
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self.loop.add_signal_handler(signum, self.stopping.set)
+            except NotImplementedError:
+                # Windows: Ctrl+C still raises KeyboardInterrupt out of asyncio.run()
+                pass
+
+        self.tasks = {
+            "poller": asyncio.create_task(self.poller(), name="poller"),
+            "booker": asyncio.create_task(self.booker(), name="booker"),
+            "notifications": asyncio.create_task(self.notification_sender(), name="notifications"),
+        }
+        if self.status_port:
+            self.tasks["status"] = asyncio.create_task(self.status_server(), name="status")
+        stop = asyncio.create_task(self.stopping.wait(), name="stop")
+        try:
+            # The booker ends by setting stopping; the poller only ends by failing
+            watched = [stop, self.tasks["poller"], self.tasks["booker"]]
+            done, _ = await asyncio.wait(watched, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is not stop and not task.cancelled() and task.exception() is not None:
+                    self.error(f"{task.get_name()} stopped: {task.exception()!r}")
+        finally:
+            stop.cancel()
+            await self.shutdown()
+        return 0 if self.rescheduled else 1
+
+    async def shutdown(self) -> None:
+        """
+        Cancels the tasks, delivers queued notifications, closes the sessions and quits the browser.
+        """
+        print("Shutting down")
+        notifier.stopping.set()
+        for task in self.tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        while not self.notifications.empty():
+            batch = [self.notifications.get_nowait() for _ in range(self.notifications.qsize())]
+            await self.blocking(notifier.deliver_batch, batch)
+        try:
+            await asyncio.wait_for(self.blocking(self.close_session), self.shutdown_timeout)
+            # Queued behind any Selenium call still running; the browser stays open to show a booking when detached
+            if not (self.rescheduled and get_settings().detach):
+                await asyncio.wait_for(self.in_browser(self.quit_driver), self.shutdown_timeout)
+        except asyncio.TimeoutError:
+            print("Blocking calls did not finish, exiting anyway")
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.browser_executor.shutdown(wait=False, cancel_futures=True)
+        metrics.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Poll, book, notify and serve status on one event loop")
+    parser.add_argument("--detect", action="store_true", help="only detect and notify, like detect_and_notify.py")
+    parser.add_argument("--profile", metavar="DIR", help="profile the login, polling and booking stages into DIR")
+    args = parser.parse_args()
+    if args.profile:
+        enable_profiling(args.profile)
+    sys.exit(asyncio.run(Runtime(args.detect).run()))
+
+
+if __name__ == "__main__":
+    main()
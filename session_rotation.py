@@ -0,0 +1,247 @@
+"""
+Overlapping rotation of the HTTP polling session.
+
+A session ends when its RequestTracker runs out of retries or time. Previously the
+poller then stopped, waited NEW_SESSION_DELAY and signed in again, leaving minutes
+with nobody watching. SessionRotator instead signs in the replacement on a
+background thread ROTATION_LEAD_TIME before the current session is due to retire,
+keeps polling the old session until the new one is ready, and hands over between
+two polls. Sign ins are never closer together than MIN_RELOGIN_INTERVAL.
+
+The old session is never polled past its limits. If MIN_RELOGIN_INTERVAL or a
+failed sign in holds the replacement back until then, polling pauses until it is
+ready, and the pause shows as a gap in poll_coverage_ratio.
+
+CoverageTracker reports the share of wall-clock time during which a signed in
+session was polling, as the poll_coverage_ratio gauge.
+"""
+import math
+import time
+import threading
+
+from http_session import AisSession
+from metrics import metrics
+from request_tracker import RequestTracker
+from settings import get_settings
+from status_channel import status
+
+
+class CoverageTracker:
+    """
+    Measures how much of the run had an active poller.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.active_since = None
+        self.active_total = 0.0
+
+    def set_active(self, active: bool) -> None:
+        with self.lock:
+            now = time.monotonic()
+            if active and self.active_since is None:
+                self.active_since = now
+            elif not active and self.active_since is not None:
+                self.active_total += now - self.active_since
+                self.active_since = None
+        self.report()
+
+    def ratio(self) -> float:
+        """
+        Returns:
+        - float: Share of wall-clock time with an active poller since the start, 0 to 1.
+        """
+        with self.lock:
+            now = time.monotonic()
+            active = self.active_total + (now - self.active_since if self.active_since is not None else 0)
+            elapsed = now - self.started_at
+        return active / elapsed if elapsed > 0 else 1.0
+
+    def report(self) -> None:
+        ratio = self.ratio()
+        metrics.gauge("poll_coverage_ratio", round(ratio, 4))
+        metrics.gauge("poll_blind_seconds", round((1 - ratio) * (time.monotonic() - self.started_at), 1))
+
+
+coverage = CoverageTracker()
+
+
+def new_request_tracker() -> RequestTracker:
+    settings = get_settings()
+    return RequestTracker(settings.date_request_max_retry, settings.date_request_max_time)
+
+
+def is_exhausted(tracker: RequestTracker, lead_time: float = 0, lead_polls: int = 0) -> bool:
+    """
+    Checks a tracker against its limits without the logging of should_retry().
+
+    Returns:
+    - bool: Whether the tracker is within lead_time seconds or lead_polls requests of a limit.
+    """
+    elapsed = time.time() - tracker.start_time
+    return tracker.retries > tracker.max_retries - lead_polls or elapsed > tracker.max_time - lead_time
+
+
+class SessionRotator:
+    """
+    Owns the polling AisSession and its RequestTracker and replaces them without a gap.
+
+    reschedule() calls current() before every poll and polls whichever session it
+    returns; None means the rotation gave up and the caller should start over.
+    """
+
+    def __init__(self):
+        self.session = None
+        self.tracker = None
+        self.standby = None
+        self.warming = None
+        self.last_login_at = float("-inf")
+        self.warmup_failures = 0
+        self.closed = False
+        self.paused = False
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def start(self, resume: bool = False) -> bool:
+        """
+        Signs in the first session, retrying up to NEW_SESSION_AFTER_FAILURES times.
+
+        Parameters:
+        - resume (bool): Try the session saved by an earlier run before signing in.
+
+        Returns:
+        - bool: True once a session is signed in.
+        """
+        session = AisSession()
+        session_failures = 0
+        signed_in = resume and session.resume()
+        while not signed_in and session_failures < get_settings().new_session_after_failures:
+            try:
+                self.last_login_at = time.monotonic()
+                with metrics.span("login", source="http"):
+                    session.login()
+                signed_in = True
+            except Exception as e:
+                print("Unable to sign in: ", e)
+                status.report("error", message=f"Unable to sign in: {e}")
+                session_failures += 1
+                time.sleep(get_settings().fail_retry_delay)
+        if not signed_in:
+            session.close()
+            return False
+        self.session = session
+        self.tracker = new_request_tracker()
+        coverage.set_active(True)
+        return True
+
+    def current(self) -> tuple:
+        """
+        Starts warming the replacement when due and hands over once it is signed in.
+
+        Once the session is exhausted it is not polled again; this waits for the
+        replacement instead.
+
+        Returns:
+        - tuple: (AisSession, RequestTracker) to poll with, or (None, None) when the
+          session is exhausted and no replacement could be signed in, or the rotator
+          was closed.
+        """
+        settings = get_settings()
+        if not settings.session_rotation:
+            # Rotation disabled: end the session at its limits like before
+            if is_exhausted(self.tracker):
+                print("Session limits reached")
+                return None, None
+            return self.session, self.tracker
+
+        while not self.stopping.is_set():
+            settings = get_settings()
+            due = is_exhausted(self.tracker, settings.rotation_lead_time, self.lead_polls(settings))
+            spaced = time.monotonic() - self.last_login_at >= settings.min_relogin_interval
+            with self.lock:
+                standby, warming = self.standby, self.warming
+            if due and standby is None and warming is None and spaced:
+                self.start_warmup()
+            if not is_exhausted(self.tracker):
+                coverage.report()
+                return self.session, self.tracker
+            if standby is not None:
+                self.hand_over()
+                return self.session, self.tracker
+            if warming is None and self.warmup_failures >= settings.new_session_after_failures:
+                print("Unable to sign in a replacement session")
+                return None, None
+            if not self.paused:
+                print("Session limits reached, waiting for the replacement session")
+                self.paused = True
+                coverage.set_active(False)
+            self.stopping.wait(1)
+        return None, None
+
+    def lead_polls(self, settings) -> int:
+        """
+        Returns:
+        - int: The requests the session is expected to make in ROTATION_LEAD_TIME, from
+          its pace so far, or DATE_REQUEST_DELAY before its first request.
+        """
+        elapsed = time.time() - self.tracker.start_time
+        interval = elapsed / self.tracker.retries if self.tracker.retries else settings.date_request_delay
+        return math.ceil(settings.rotation_lead_time / max(interval, 1)) + 1
+
+    def start_warmup(self) -> None:
+        self.last_login_at = time.monotonic()
+        self.warming = threading.Thread(target=self.warm_up, name="session-warmup", daemon=True)
+        self.warming.start()
+
+    def warm_up(self) -> None:
+        session = AisSession()
+        try:
+            with metrics.span("login", source="http", rotation=True):
+                session.login()
+        except Exception as e:
+            print("Unable to sign in the replacement session: ", e)
+            status.report("error", message=f"Unable to sign in the replacement session: {e}")
+            metrics.incr("session_rotations_total", outcome="failed")
+            session.close()
+            with self.lock:
+                self.warmup_failures += 1
+                self.warming = None
+            return
+        with self.lock:
+            self.warming = None
+            if self.closed:
+                # The poller stopped while this session was signing in
+                session.close()
+                return
+            self.standby = session
+            self.warmup_failures = 0
+        print("Replacement session signed in")
+
+    def hand_over(self) -> None:
+        with self.lock:
+            old, self.session = self.session, self.standby
+            self.standby = None
+        overlap = time.monotonic() - self.last_login_at
+        self.tracker = new_request_tracker()
+        old.close()
+        if self.paused:
+            self.paused = False
+            coverage.set_active(True)
+        print("Handed over to the replacement session")
+        status.report("session_rotated", coverage=round(coverage.ratio(), 4))
+        metrics.incr("session_rotations_total", outcome="ok")
+        metrics.gauge("session_rotation_overlap_seconds", round(overlap, 1))
+
+    def close(self) -> None:
+        """
+        Closes the polling session and any signed in replacement.
+        """
+        coverage.set_active(False)
+        self.stopping.set()
+        with self.lock:
+            self.closed = True
+            sessions = [s for s in (self.session, self.standby) if s is not None]
+            self.session = self.standby = None
+        for session in sessions:
+            session.close()
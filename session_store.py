@@ -0,0 +1,50 @@
+import os
+import json
+import time
+
+from settings import get_settings
+
+
+def save_session(cookies: list[dict], schedule_id: str) -> None:
+    """
+    Saves the signed in cookies and schedule id, readable by the current user only.
+
+    Parameters:
+    - cookies (list[dict]): Cookies with name, value, domain and path keys.
+    - schedule_id (str): The schedule id from the appointment page url.
+    """
+    settings = get_settings()
+    if not settings.persist_session:
+        return
+    data = {"schedule_id": schedule_id, "cookies": cookies, "saved_at": time.time()}
+    temp_path = settings.session_file + ".tmp"
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.chmod(temp_path, 0o600)
+    os.replace(temp_path, settings.session_file)
+
+
+def load_session() -> dict | None:
+    """
+    Returns:
+    - dict | None: {"schedule_id", "cookies", "saved_at"} of the saved session, if any.
+    """
+    settings = get_settings()
+    if not settings.persist_session:
+        return None
+    try:
+        with open(settings.session_file, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not data.get("schedule_id") or not data.get("cookies"):
+        return None
+    return data
+
+
+def clear_session() -> None:
+    try:
+        os.remove(get_settings().session_file)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,378 @@
+"""
+Typed view of settings.json that follows edits while the rescheduler runs.
+
+Every module used to load settings.json once at import and keep strings around,
+so narrowing the date window meant restarting, signing in again and being blind
+for minutes. get_settings() instead returns a validated Settings object with the
+dates and intervals already parsed, and re-reads the file whenever its
+modification time changes. Callers read it where they use a value, so the next
+poll picks up the edit. A file that fails to parse or validate (for example
+half-written by the GUI) is reported and the previous settings stay in effect.
+
+Credentials and URLs are read at sign in, so changing them applies to the next
+session. File locations, pool and worker sizes, and the metrics, history, notifier,
+supervisor and profiler options are validated here as well, but only read when
+those parts start.
+"""
+import os
+import json
+import time
+import threading
+from datetime import date, datetime
+
+from facilities import FACILITY_IDS
+
+SETTINGS_FILE = "settings.json"
+
+# Seconds between checks of the file's modification time
+SETTINGS_CHECK_INTERVAL = 1.0
+
+# Requests allowed per endpoint: rate requests every per seconds, in bursts of up to burst.
+# RATE_LIMITS in settings.json overrides single entries; null turns an entry off.
+# The login entry is added by parse_rate_limits(), from MIN_RELOGIN_INTERVAL.
+DEFAULT_RATE_LIMITS = {
+    "global": {"rate": 20, "per": 60, "burst": 10},
+    "days": {"rate": 6, "per": 60, "burst": 3},
+    "payment": {"rate": 2, "per": 60, "burst": 2},
+    "booking": {"rate": 12, "per": 60, "burst": 6},
+}
+
+
+def load_settings(path: str = SETTINGS_FILE) -> dict:
+    """
+    Returns:
+    - dict: The raw contents of settings.json.
+    """
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+class SettingsError(ValueError):
+    """Raised when settings.json holds a value the rescheduler cannot use."""
+
+
+def parse_date(raw: dict, key: str) -> date | None:
+    value = raw.get(key)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        raise SettingsError(f"{key} must be a YYYY-MM-DD date, got {value!r}")
+
+
+def parse_rate_limits(raw: dict, min_relogin_interval: float) -> dict:
+    # One sign in per MIN_RELOGIN_INTERVAL (12 an hour by default), with room for a few quick retries
+    login = {"rate": 1, "per": max(min_relogin_interval, 1), "burst": 3}
+    limits = {**DEFAULT_RATE_LIMITS, "login": login, **(raw.get("RATE_LIMITS") or {})}
+    for name, limit in limits.items():
+        if limit is None:
+            continue
+        try:
+            valid = float(limit["rate"]) > 0 and float(limit["per"]) > 0 and float(limit["burst"]) >= 1
+        except (KeyError, TypeError, ValueError):
+            valid = False
+        if not valid:
+            raise SettingsError(f"RATE_LIMITS {name} needs a positive rate and per, and a burst of at least 1")
+    return limits
+
+
+def parse_number(raw: dict, key: str, default, kind=float, minimum: float = 0, maximum: float | None = None):
+    value = raw.get(key, default)
+    try:
+        number = kind(value)
+    except (TypeError, ValueError):
+        raise SettingsError(f"{key} must be a number, got {value!r}")
+    if number < minimum:
+        raise SettingsError(f"{key} must be at least {minimum}, got {number}")
+    if maximum is not None and number > maximum:
+        raise SettingsError(f"{key} must be at most {maximum}, got {number}")
+    return number
+
+
+def parse_minutes(value) -> int:
+    """
+    Returns:
+    - int: Minutes since midnight of an "HH:MM" time, "24:00" included.
+
+    Raises:
+    - ValueError: If the value is not a time of day.
+    """
+    hours, minutes = value.split(":")
+    total = int(hours) * 60 + int(minutes)
+    if not 0 <= int(minutes) < 60 or not 0 <= total <= 24 * 60:
+        raise ValueError(value)
+    return total
+
+
+def parse_poll_profile(entries) -> list[dict]:
+    """
+    Parses POLL_PROFILE entries such as {"days": [5, 6], "start": "21:00", "end": "02:00", "interval": 15}.
+
+    Returns:
+    - list[dict]: The entries with days as a tuple (None for every day), start and end
+      in minutes since midnight and interval in seconds.
+
+    Raises:
+    - SettingsError: If an entry is malformed.
+    """
+    if not isinstance(entries, list):
+        raise SettingsError("POLL_PROFILE must be a list of entries")
+    profile = []
+    for number, entry in enumerate(entries, 1):
+        try:
+            days = entry.get("days")
+            if days is not None:
+                days = tuple(int(day) for day in days)
+                if not all(0 <= day <= 6 for day in days):
+                    raise ValueError(days)
+            interval = float(entry["interval"])
+            if interval <= 0:
+                raise ValueError(interval)
+            profile.append({
+                "days": days,
+                "start": parse_minutes(entry.get("start", "00:00")),
+                "end": parse_minutes(entry.get("end", "24:00")),
+                "interval": interval,
+            })
+        except (AttributeError, KeyError, TypeError, ValueError):
+            raise SettingsError(
+                f"POLL_PROFILE entry {number} needs a positive interval, HH:MM start and end times "
+                f"and days from 0 (Monday) to 6, got {entry!r}"
+            )
+    return profile
+
+
+class Settings:
+    """
+    One validated snapshot of settings.json. Attributes are the lower case setting
+    names; get() reads any other key from the raw file.
+
+    Raises:
+    - SettingsError: If a value is missing, malformed or out of range.
+    """
+
+    def __init__(self, raw: dict):
+        self.raw = raw
+
+        self.user_email: str | None = raw.get("USER_EMAIL")
+        self.user_password: str | None = raw.get("USER_PASSWORD")
+        self.earliest_acceptable_date = parse_date(raw, "EARLIEST_ACCEPTABLE_DATE")
+        self.latest_acceptable_date = parse_date(raw, "LATEST_ACCEPTABLE_DATE")
+        if self.latest_acceptable_date is None:
+            raise SettingsError("LATEST_ACCEPTABLE_DATE is not set")
+        if self.earliest_acceptable_date and self.earliest_acceptable_date > self.latest_acceptable_date:
+            raise SettingsError("EARLIEST_ACCEPTABLE_DATE is after LATEST_ACCEPTABLE_DATE")
+        self.selected_city: str | None = raw.get("SELECTED_CITY")
+        # Watched together through the payment page overview when set, instead of SELECTED_CITY alone
+        self.acceptable_cities: list = raw.get("ACCEPTABLE_CITIES") or []
+        if not isinstance(self.acceptable_cities, list) or any(c not in FACILITY_IDS for c in self.acceptable_cities):
+            raise SettingsError(f"ACCEPTABLE_CITIES must list cities from {', '.join(FACILITY_IDS)}")
+
+        self.headless_mode = bool(raw.get("HEADLESS_MODE"))
+        self.test_mode = bool(raw.get("TEST_MODE"))
+        self.detach = bool(raw.get("DETACH"))
+        self.http_polling = bool(raw.get("HTTP_POLLING", True))
+        self.reuse_browser = bool(raw.get("REUSE_BROWSER", True))
+
+        self.new_session_after_failures = parse_number(raw, "NEW_SESSION_AFTER_FAILURES", 5, int, 1)
+        self.new_session_delay = parse_number(raw, "NEW_SESSION_DELAY", 120)
+        self.timeout = parse_number(raw, "TIMEOUT", 10, int, 1)
+        self.fail_retry_delay = parse_number(raw, "FAIL_RETRY_DELAY", 30)
+        self.date_request_delay = parse_number(raw, "DATE_REQUEST_DELAY", 30)
+        self.date_request_max_retry = parse_number(raw, "DATE_REQUEST_MAX_RETRY", 60, int)
+        self.date_request_max_time = parse_number(raw, "DATE_REQUEST_MAX_TIME", 1800)
+        self.page_ready_timeout = parse_number(raw, "PAGE_READY_TIMEOUT", 20, int, 1)
+        self.time_slot_timeout = parse_number(raw, "TIME_SLOT_TIMEOUT", 10, int, 1)
+        self.booking_retry_delay = parse_number(raw, "BOOKING_RETRY_DELAY", 5)
+
+        self.min_poll_interval = parse_number(raw, "MIN_POLL_INTERVAL", 10)
+        self.max_poll_backoff = parse_number(raw, "MAX_POLL_BACKOFF", 600)
+        self.poll_jitter = parse_number(raw, "POLL_JITTER", 0.1)
+        if self.poll_jitter >= 1:
+            raise SettingsError(f"POLL_JITTER must be below 1, got {self.poll_jitter}")
+        self.poll_profile = parse_poll_profile(raw.get("POLL_PROFILE") or [])
+        self.poll_profile_timezone: str = raw.get("POLL_PROFILE_TIMEZONE", "America/New_York")
+
+        self.session_rotation = bool(raw.get("SESSION_ROTATION", True))
+        self.min_relogin_interval = parse_number(raw, "MIN_RELOGIN_INTERVAL", 300)
+        self.rotation_lead_time = parse_number(raw, "ROTATION_LEAD_TIME", 60)
+
+        self.booking_standby = bool(raw.get("BOOKING_STANDBY", True))
+        self.standby_refresh_interval = parse_number(raw, "STANDBY_REFRESH_INTERVAL", 240)
+        self.standby_max_age = parse_number(raw, "STANDBY_MAX_AGE", 600)
+
+        self.rate_limits_enabled = bool(raw.get("RATE_LIMITS_ENABLED", True))
+        self.rate_limits = parse_rate_limits(raw, self.min_relogin_interval)
+        self.retry_budget = parse_number(raw, "RETRY_BUDGET", 10, float, 1)
+        self.retry_budget_per_hour = parse_number(raw, "RETRY_BUDGET_PER_HOUR", 20)
+        # Seconds between saves of the bucket levels; they are saved at exit as well
+        self.rate_limit_save_interval = parse_number(raw, "RATE_LIMIT_SAVE_INTERVAL", 30)
+
+        self.login_url: str | None = raw.get("LOGIN_URL")
+        self.appointment_page_url: str | None = raw.get("APPOINTMENT_PAGE_URL")
+        self.payment_page_url: str | None = raw.get("PAYMENT_PAGE_URL")
+        self.available_date_request_suffix: str | None = raw.get("AVAILABLE_DATE_REQUEST_SUFFIX")
+        self.time_request_suffix: str = raw.get(
+            "TIME_REQUEST_SUFFIX", "/times/{facility_id}.json?date={date}&appointments[expedite]=false"
+        )
+        self.user_agent: str = raw.get(
+            "USER_AGENT",
+            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+            "(KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36"
+        )
+
+        # Read when the part of the rescheduler that uses them starts, so changing them needs a restart
+        self.persist_session = bool(raw.get("PERSIST_SESSION", True))
+        self.session_file: str = raw.get("SESSION_FILE", ".session.json")
+        self.driver_cache_file: str = raw.get("DRIVER_CACHE_FILE", ".driver_cache.json")
+        self.browser_registry_file: str = raw.get("BROWSER_REGISTRY_FILE", ".browsers.json")
+        self.rate_limit_state_file: str = raw.get("RATE_LIMIT_STATE_FILE", ".rate_limit.json")
+        self.pool_connections = parse_number(raw, "POOL_CONNECTIONS", 2, int, 1)
+        self.pool_maxsize = parse_number(raw, "POOL_MAXSIZE", 4, int, 1)
+
+        self.metrics_enabled = bool(raw.get("METRICS_ENABLED", True))
+        self.metrics_dir: str = raw.get("METRICS_DIR", "metrics")
+        self.metrics_flush_interval = parse_number(raw, "METRICS_FLUSH_INTERVAL", 5)
+        self.metrics_max_bytes = parse_number(raw, "METRICS_MAX_BYTES", 10 * 1024 * 1024, int, 1)
+        self.metrics_backup_count = parse_number(raw, "METRICS_BACKUP_COUNT", 3, int, 1)
+
+        self.history_enabled = bool(raw.get("HISTORY_ENABLED", True))
+        self.history_db: str = raw.get("HISTORY_DB", "history.sqlite3")
+        self.history_coverage_gap = parse_number(raw, "HISTORY_COVERAGE_GAP", 900)
+
+        self.notify_smtp_host: str | None = raw.get("NOTIFY_SMTP_HOST")
+        self.notify_smtp_port = parse_number(raw, "NOTIFY_SMTP_PORT", 587, int, 1, 65535)
+        self.notify_smtp_user: str | None = raw.get("NOTIFY_SMTP_USER")
+        self.notify_smtp_password: str | None = raw.get("NOTIFY_SMTP_PASSWORD")
+        self.notify_smtp_starttls = bool(raw.get("NOTIFY_SMTP_STARTTLS", True))
+        self.notify_email_from: str | None = raw.get("NOTIFY_EMAIL_FROM") or self.user_email
+        self.notify_email_to: str | list | None = raw.get("NOTIFY_EMAIL_TO") or self.user_email
+        self.notify_webhook_url: str | None = raw.get("NOTIFY_WEBHOOK_URL")
+        self.notify_desktop = bool(raw.get("NOTIFY_DESKTOP", False))
+        self.notify_queue_size = parse_number(raw, "NOTIFY_QUEUE_SIZE", 100, int, 1)
+        self.notify_batch_window = parse_number(raw, "NOTIFY_BATCH_WINDOW", 5)
+        self.notify_dedup_ttl = parse_number(raw, "NOTIFY_DEDUP_TTL", 6 * 60 * 60)
+        self.notify_max_attempts = parse_number(raw, "NOTIFY_MAX_ATTEMPTS", 5, int, 1)
+        self.notify_timeout = parse_number(raw, "NOTIFY_TIMEOUT", 10, float, 1)
+
+        self.runtime_workers = parse_number(raw, "RUNTIME_WORKERS", 4, int, 1)
+        # 0 turns the status endpoint off
+        self.runtime_status_port = parse_number(raw, "RUNTIME_STATUS_PORT", 8766, int, 0, 65535)
+        # Seconds to wait for a running blocking call before shutting down regardless
+        self.runtime_shutdown_timeout = parse_number(raw, "RUNTIME_SHUTDOWN_TIMEOUT", 30)
+
+        self.supervisor_check_interval = parse_number(raw, "SUPERVISOR_CHECK_INTERVAL", 10, float, 1)
+        self.supervisor_hung_timeout = parse_number(raw, "SUPERVISOR_HUNG_TIMEOUT", 120)
+        self.supervisor_max_browsers = parse_number(raw, "SUPERVISOR_MAX_BROWSERS", 2, int, 1)
+        self.supervisor_max_rss_mb = parse_number(raw, "SUPERVISOR_MAX_RSS_MB", 2048)
+        self.supervisor_restart_delay = parse_number(raw, "SUPERVISOR_RESTART_DELAY", 5)
+        self.supervisor_max_restart_delay = parse_number(raw, "SUPERVISOR_MAX_RESTART_DELAY", 600)
+        # A worker that ran this long before crashing starts the backoff from scratch
+        self.supervisor_stable_after = parse_number(raw, "SUPERVISOR_STABLE_AFTER", 1800)
+        self.supervisor_status_file: str = raw.get("SUPERVISOR_STATUS_FILE", ".supervisor_status.json")
+
+        self.profile_sample_interval = parse_number(raw, "PROFILE_SAMPLE_INTERVAL", 0.005, float, 0.001)
+        self.profile_tracemalloc_frames = parse_number(raw, "PROFILE_TRACEMALLOC_FRAMES", 1, int, 1)
+        # Allocation sites come from comparing full snapshots, which takes about a second:
+        # only done on the first and then every PROFILE_SNAPSHOT_EVERY-th call of a stage, 0 for the first only
+        self.profile_snapshot_every = parse_number(raw, "PROFILE_SNAPSHOT_EVERY", 10, int)
+        self.profile_top_allocations = parse_number(raw, "PROFILE_TOP_ALLOCATIONS", 10, int)
+
+    def get(self, key: str, default=None):
+        return self.raw.get(key, default)
+
+    def is_acceptable(self, slot_date: date) -> bool:
+        """
+        Returns:
+        - bool: Whether the date lies inside the acceptable window.
+        """
+        if self.earliest_acceptable_date and slot_date < self.earliest_acceptable_date:
+            return False
+        return slot_date <= self.latest_acceptable_date
+
+
+class SettingsWatcher:
+    """
+    Holds the current Settings and reloads them when settings.json changes.
+
+    The modification time is checked at most every check_interval seconds, so
+    calling current() on every poll costs one stat() call now and then.
+    Overrides (used by the benchmark to point the URLs at the stand-in server)
+    are applied on top of every load.
+    """
+
+    def __init__(self, path: str = SETTINGS_FILE, check_interval: float = SETTINGS_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.overrides = {}
+        self.settings = None
+        self.mtime = None
+        self.checked_at = 0.0
+
+    def current(self) -> Settings:
+        """
+        Returns:
+        - Settings: The latest valid settings.
+
+        Raises:
+        - SettingsError, OSError, ValueError: If the first load fails; later failures
+          keep the previous settings.
+        """
+        now = time.monotonic()
+        if self.settings is not None and now - self.checked_at < self.check_interval:
+            return self.settings
+        with self.lock:
+            self.checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                if self.settings is None:
+                    raise
+                return self.settings
+            if mtime != self.mtime:
+                self.reload(mtime)
+            return self.settings
+
+    def reload(self, mtime: int) -> None:
+        previous = self.settings
+        try:
+            settings = Settings({**load_settings(self.path), **self.overrides})
+        except (OSError, ValueError) as e:
+            if previous is None:
+                raise
+            # Keep polling with the old settings, and try again on the next change
+            print(f"Ignoring invalid {self.path}: {e}")
+            self.mtime = mtime
+            return
+        self.settings = settings
+        self.mtime = mtime
+        if previous is not None:
+            keys = set(previous.raw) | set(settings.raw)
+            changed = sorted(key for key in keys if previous.raw.get(key) != settings.raw.get(key))
+            if changed:
+                print(f"Reloaded {self.path}, changed: {', '.join(changed)}")
+
+    def override(self, values: dict) -> None:
+        """
+        Replaces settings in memory without touching settings.json.
+
+        Parameters:
+        - values (dict): Setting name to value, e.g. {"TEST_MODE": False}.
+        """
+        with self.lock:
+            self.overrides.update(values)
+            self.mtime = None
+            self.checked_at = 0.0
+
+
+watcher = SettingsWatcher()
+
+
+def get_settings() -> Settings:
+    """
+    Returns:
+    - Settings: The current settings, reloaded if settings.json changed.
+    """
+    return watcher.current()
@@ -0,0 +1,183 @@
+"""
+Analyses the availability history to find when earlier dates get released.
+
+For each hour of the week it computes how many dates earlier than a cut-off
+appeared, how long they survived and how many hours were actually being polled,
+and turns that into a POLL_PROFILE: dense polling in the hours that account for
+most releases, sparse polling elsewhere. All aggregation runs inside SQLite, so
+it stays fast over months of history.
+
+Usage:
+    python slot_analytics.py --facility Toronto --before 2025-06-01 [--weeks 12]
+                             [--dense 15] [--sparse 120] [--target 0.9] [--write-profile]
+
+Hours are in the local time of this machine; the written profile sets
+POLL_PROFILE_TIMEZONE to "local" to match.
+"""
+import json
+import time
+import argparse
+
+from history import AvailabilityHistory
+from settings import get_settings, load_settings
+
+DAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+# Hour of week with Monday 00:00 = 0, matching datetime.weekday() used by PollScheduler
+HOUR_OF_WEEK_SQL = (
+    "((CAST(strftime('%w', {column}, 'unixepoch', 'localtime') AS INTEGER) + 6) % 7) * 24"
+    " + CAST(strftime('%H', {column}, 'unixepoch', 'localtime') AS INTEGER)"
+)
+
+# Dates seen by the first poll of a coverage row were already open before it (when polling started or
+# after a gap), so they are not counted as releases
+RELEASES_SQL = f"""
+SELECT {HOUR_OF_WEEK_SQL.format(column="appeared_at")} AS hour_of_week,
+       COUNT(*) AS releases,
+       AVG(COALESCE(disappeared_at, :now) - appeared_at) AS mean_survival,
+       MIN(COALESCE(disappeared_at, :now) - appeared_at) AS min_survival
+FROM availability
+WHERE facility = :facility AND source = :source AND date < :before AND appeared_at >= :since
+    AND NOT EXISTS (
+        SELECT 1 FROM coverage
+        WHERE coverage.facility = availability.facility AND coverage.source = availability.source
+            AND coverage.started_at = availability.appeared_at
+    )
+GROUP BY hour_of_week
+"""
+
+# Splits every coverage row into the clock hours it overlaps and sums the overlap per hour of week
+COVERAGE_SQL = f"""
+WITH RECURSIVE hours(start) AS (
+    SELECT CAST(MAX(:since, (SELECT MIN(started_at) FROM coverage WHERE facility = :facility AND source = :source)) / 3600 AS INTEGER) * 3600
+    UNION ALL
+    SELECT start + 3600 FROM hours WHERE start + 3600 < :now
+)
+SELECT {HOUR_OF_WEEK_SQL.format(column="hours.start")} AS hour_of_week,
+       SUM(MIN(coverage.ended_at, hours.start + 3600) - MAX(coverage.started_at, hours.start)) AS covered
+FROM hours
+JOIN coverage ON coverage.facility = :facility AND coverage.source = :source
+    AND coverage.started_at < hours.start + 3600 AND coverage.ended_at > hours.start
+GROUP BY hour_of_week
+"""
+
+
+def release_statistics(
+    history: AvailabilityHistory, facility: str, before: str, since: float, source: str = "days"
+) -> list[dict]:
+    """
+    Computes the release distribution of a facility by hour of week.
+
+    Parameters:
+    - history (AvailabilityHistory): The recorded poll results.
+    - facility (str): Facility name.
+    - before (str): Only dates earlier than this ISO date count as releases.
+    - since (float): Unix time to start from.
+    - source (str): The history source to use, "days" or "payment"; a slot seen by both is
+      only counted once.
+
+    Returns:
+    - list[dict]: One entry per hour of week (0 = Monday 00:00) with releases, covered
+      hours, releases per covered hour and mean/min survival in seconds.
+    """
+    params = {"facility": facility, "source": source, "before": before, "since": since, "now": time.time()}
+    releases = {row[0]: row[1:] for row in history.connection.execute(RELEASES_SQL, params)}
+    covered = {row[0]: row[1] for row in history.connection.execute(COVERAGE_SQL, params)}
+    statistics = []
+    for hour in range(7 * 24):
+        count, mean_survival, min_survival = releases.get(hour, (0, None, None))
+        covered_hours = (covered.get(hour) or 0) / 3600
+        statistics.append({
+            "hour_of_week": hour,
+            "releases": count,
+            "covered_hours": covered_hours,
+            "rate": count / covered_hours if covered_hours else None,
+            "mean_survival": mean_survival,
+            "min_survival": min_survival,
+        })
+    return statistics
+
+
+def build_profile(statistics: list[dict], dense: float, sparse: float, target: float) -> list[dict]:
+    """
+    Picks the hours with the highest release rate until they account for the target
+    share of releases, and builds a POLL_PROFILE polling those densely.
+
+    Hours that were never polled keep the default interval (no profile entry), so
+    they are not ruled out before there is data for them.
+
+    Returns:
+    - list[dict]: Profile entries in the format PollScheduler reads.
+    """
+    total = sum(s["releases"] for s in statistics)
+    ranked = sorted((s for s in statistics if s["rate"] is not None), key=lambda s: s["rate"], reverse=True)
+    intervals = {}
+    accounted = 0
+    for entry in ranked:
+        if total and accounted / total < target and entry["releases"]:
+            intervals[entry["hour_of_week"]] = dense
+            accounted += entry["releases"]
+        else:
+            intervals[entry["hour_of_week"]] = sparse
+
+    profile = []
+    for day in range(7):
+        hour = 0
+        while hour < 24:
+            interval = intervals.get(day * 24 + hour)
+            end = hour + 1
+            while end < 24 and intervals.get(day * 24 + end) == interval:
+                end += 1
+            if interval is not None:
+                profile.append({
+                    "days": [day], "start": f"{hour:02d}:00",
+                    "end": "24:00" if end == 24 else f"{end:02d}:00", "interval": interval,
+                })
+            hour = end
+    return profile
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Find when earlier dates are released and build a poll profile")
+    parser.add_argument("--facility", default=settings.selected_city or "Toronto")
+    parser.add_argument("--before", default=settings.latest_acceptable_date.isoformat(),
+                        help="count dates earlier than this YYYY-MM-DD as releases")
+    parser.add_argument("--source", default="days", choices=["days", "payment"],
+                        help="poll results to use: the full date lists, or the earliest dates of the payment page")
+    parser.add_argument("--weeks", type=float, default=12, help="how much history to use")
+    parser.add_argument("--dense", type=float, default=15, help="interval in the busiest release hours")
+    parser.add_argument("--sparse", type=float, default=120, help="interval in the other polled hours")
+    parser.add_argument("--target", type=float, default=0.9, help="share of releases to poll densely for")
+    parser.add_argument("--write-profile", action="store_true", help="save the profile to settings.json")
+    args = parser.parse_args()
+
+    history = AvailabilityHistory()
+    since = time.time() - args.weeks * 7 * 24 * 3600
+    statistics = release_statistics(history, args.facility, args.before, since, args.source)
+    history.close()
+
+    total = sum(s["releases"] for s in statistics)
+    print(f"{total} releases of dates before {args.before} at {args.facility} in the last {args.weeks:g} weeks")
+    busiest = sorted((s for s in statistics if s["releases"]), key=lambda s: s["rate"] or 0, reverse=True)
+    for s in busiest[:15]:
+        day, hour = divmod(s["hour_of_week"], 24)
+        print(
+            f"  {DAY_NAMES[day]} {hour:02d}:00  {s['releases']:>4} releases over {s['covered_hours']:.1f}h polled, "
+            f"mean survival {s['mean_survival'] / 60:.1f} min, shortest {s['min_survival'] / 60:.1f} min"
+        )
+
+    profile = build_profile(statistics, args.dense, args.sparse, args.target)
+    if args.write_profile:
+        raw = load_settings()
+        raw["POLL_PROFILE"] = profile
+        raw["POLL_PROFILE_TIMEZONE"] = "local"
+        with open('settings.json', 'w') as f:
+            json.dump(raw, f, indent=4)
+        print(f"Wrote a {len(profile)} entry POLL_PROFILE to settings.json")
+    else:
+        print(json.dumps({"POLL_PROFILE": profile, "POLL_PROFILE_TIMEZONE": "local"}, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,657 @@
+"""
+A local stand-in for ais.usvisa-info.com, for running the rescheduler offline.
+
+Serves the sign in form, the account page with its "Continue" link, the appointment
+page with the facility select and a datepicker, the days/times JSON endpoints and the
+payment page table. Availability, latency and error responses come from a scenario
+file and can be changed while the server runs by POSTing JSON to /__control.
+
+Usage:
+    python stand_in_server.py --port 8765 --scenario scenario.json [--write-settings]
+
+Scenario format (all keys optional):
+    {
+        "schedule_id": "12345678",
+        "busy": false,                  # days endpoint returns [] like the busy site
+        "etag": true,                   # days endpoint answers If-None-Match with 304
+        "session_ttl": 1800,            # seconds until a sign in expires
+        "facilities": {
+            "94": {"name": "Toronto", "dates": ["2025-03-04"], "times": ["08:00", "08:15"]}
+        },
+        "latency": {"default": 0.0, "days": 0.3},     # seconds, per endpoint
+        "errors": {"days": {"rate": 0.1, "status": 503}},
+        "timeline": [{"at": 60, "facility": "94", "dates": ["2025-02-01"]}]
+    }
+
+Endpoint names used by "latency" and "errors": sign_in, account, continue,
+appointment, days, times, book, payment.
+
+Point the URL settings at http://localhost:<port> rather than 127.0.0.1: the
+schedule id is parsed as the first number in the page url.
+
+--smtp-port also starts an SMTP sink that accepts and prints every message, for
+testing notifications (NOTIFY_SMTP_HOST=localhost, NOTIFY_SMTP_STARTTLS=false).
+"""
+import re
+import json
+import hashlib
+import time
+import random
+import secrets
+import argparse
+import threading
+import socketserver
+from copy import deepcopy
+from datetime import date, datetime
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+PREFIX = "/en-ca/niv"
+
+DEFAULT_SCENARIO = {
+    "schedule_id": "12345678",
+    "user_id": "1",
+    "busy": False,
+    "etag": True,
+    "session_ttl": 1800,
+    "facilities": {
+        "89": {"name": "Calgary", "dates": [], "times": ["08:00"]},
+        "90": {"name": "Halifax", "dates": [], "times": ["08:00"]},
+        "91": {"name": "Montreal", "dates": [], "times": ["08:00"]},
+        "92": {"name": "Ottawa", "dates": [], "times": ["08:00"]},
+        "93": {"name": "Quebec City", "dates": [], "times": ["08:00"]},
+        "94": {"name": "Toronto", "dates": [], "times": ["08:00", "08:15", "09:30"]},
+        "95": {"name": "Vancouver", "dates": [], "times": ["08:00"]},
+    },
+    "latency": {"default": 0.0},
+    "errors": {},
+    "timeline": [],
+}
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<meta name="csrf-param" content="authenticity_token">
+<meta name="csrf-token" content="{csrf_token}">
+</head><body>{body}</body></html>"""
+
+SIGN_IN_BODY = """
+<form id="sign_in_form" action="{prefix}/users/sign_in" method="post">
+  <input type="hidden" name="utf8" value="&#x2713;">
+  <input type="hidden" name="authenticity_token" value="{csrf_token}">
+  <input type="email" id="user_email" name="user[email]">
+  <input type="password" id="user_password" name="user[password]">
+  <div class="icheckbox" onclick="var c=document.getElementById('policy_confirmed');c.checked=!c.checked;">
+    <input type="checkbox" id="policy_confirmed" name="policy_confirmed" value="1" style="display:none">
+  </div>
+  <input type="submit" name="commit" value="Sign In">
+</form>"""
+
+ACCOUNT_BODY = """
+<h2>Groups</h2>
+<a class="button primary small" href="{prefix}/schedule/{schedule_id}/continue_actions">Continue</a>"""
+
+CONTINUE_BODY = """
+<ul class="accordion">
+  <li><a href="{prefix}/schedule/{schedule_id}/appointment">Reschedule Appointment</a></li>
+  <li><a href="{prefix}/schedule/{schedule_id}/payment">Pay Visa Fee</a></li>
+</ul>"""
+
+PAYMENT_BODY = """
+<table class="for-layout">
+{rows}
+</table>"""
+
+APPOINTMENT_BODY = """
+<div id="flash_messages" class="learnMorePopUp"><div class="learn_more"><p>{flash}</p></div></div>
+<form id="appointment-form" action="{prefix}/schedule/{schedule_id}/appointment" method="post">
+  <input type="hidden" name="authenticity_token" value="{csrf_token}">
+  <input type="hidden" name="confirmed_limit_message" value="1">
+  <input type="hidden" name="use_consulate_appointment_capacity" value="true">
+  <select id="appointments_consulate_appointment_facility_id"
+          name="appointments[consulate_appointment][facility_id]">{facility_options}</select>
+  <input type="text" id="appointments_consulate_appointment_date"
+         name="appointments[consulate_appointment][date]" readonly>
+  <select id="appointments_consulate_appointment_time"
+          name="appointments[consulate_appointment][time]"><option value=""></option></select>
+  <input type="button" id="reschedule_button" value="Reschedule">
+</form>
+<div id="confirm_dialog" style="display:none">
+  <a class="button alert" href="#" id="confirm_button">Confirm</a>
+</div>
+<div id="ui-datepicker-div" style="display:none"></div>
+<script>
+(function() {{
+  var base = "{prefix}/schedule/{schedule_id}/appointment";
+  var facility = document.getElementById("appointments_consulate_appointment_facility_id");
+  var dateInput = document.getElementById("appointments_consulate_appointment_date");
+  var timeSelect = document.getElementById("appointments_consulate_appointment_time");
+  var picker = document.getElementById("ui-datepicker-div");
+  var available = {{}};
+  var shown = new Date();
+  shown.setDate(1);
+
+  function getJSON(url, done) {{
+    var xhr = new XMLHttpRequest();
+    xhr.open("GET", url);
+    xhr.setRequestHeader("X-Requested-With", "XMLHttpRequest");
+    xhr.onload = function() {{ if (xhr.status === 200) done(JSON.parse(xhr.responseText)); }};
+    xhr.send();
+  }}
+  function pad(n) {{ return (n < 10 ? "0" : "") + n; }}
+  function render() {{
+    var year = shown.getFullYear(), month = shown.getMonth();
+    var html = '<a class="ui-datepicker-prev" href="#">Prev</a>'
+      + '<a class="ui-datepicker-next" href="#">Next</a>'
+      + '<div class="ui-datepicker-title">' + year + "-" + pad(month + 1) + "</div><table><tr>";
+    var first = new Date(year, month, 1).getDay();
+    var days = new Date(year, month + 1, 0).getDate();
+    for (var i = 0; i < first; i++) html += '<td class="ui-datepicker-unselectable"></td>';
+    for (var d = 1; d <= days; d++) {{
+      var iso = year + "-" + pad(month + 1) + "-" + pad(d);
+      if (available[iso]) html += '<td data-date="' + iso + '"><a href="#">' + d + "</a></td>";
+      else html += '<td class="ui-datepicker-unselectable"><span>' + d + "</span></td>";
+      if ((first + d) % 7 === 0) html += "</tr><tr>";
+    }}
+    picker.innerHTML = html + "</tr></table>";
+    picker.querySelector(".ui-datepicker-next").onclick = function(e) {{
+      e.preventDefault(); shown.setMonth(shown.getMonth() + 1); render();
+    }};
+    picker.querySelector(".ui-datepicker-prev").onclick = function(e) {{
+      e.preventDefault(); shown.setMonth(shown.getMonth() - 1); render();
+    }};
+    var links = picker.querySelectorAll("td[data-date] a");
+    for (var j = 0; j < links.length; j++) links[j].onclick = pick;
+  }}
+  function pick(e) {{
+    e.preventDefault();
+    var iso = this.parentNode.getAttribute("data-date");
+    dateInput.value = iso;
+    picker.style.display = "none";
+    timeSelect.innerHTML = '<option value=""></option>';
+    getJSON(base + "/times/" + facility.value + ".json?date=" + iso + "&appointments[expedite]=false",
+      function(data) {{
+        data.available_times.forEach(function(t) {{
+          var option = document.createElement("option");
+          option.value = t; option.text = t; timeSelect.appendChild(option);
+        }});
+      }});
+  }}
+  function load() {{
+    available = {{}};
+    getJSON(base + "/days/" + facility.value + ".json?appointments[expedite]=false", function(data) {{
+      data.forEach(function(item) {{ available[item.date] = true; }});
+    }});
+  }}
+  facility.onchange = load;
+  dateInput.onclick = function() {{
+    shown = new Date(); shown.setDate(1); render(); picker.style.display = "block";
+  }};
+  document.getElementById("reschedule_button").onclick = function() {{
+    document.getElementById("confirm_dialog").style.display = "block";
+  }};
+  document.getElementById("confirm_button").onclick = function(e) {{
+    e.preventDefault(); document.getElementById("appointment-form").submit();
+  }};
+  load();
+}})();
+</script>"""
+
+
+class StandInState:
+    """
+    The scripted world the stand-in server serves: availability, sessions and bookings.
+    """
+
+    def __init__(self, scenario: dict | None = None):
+        self.lock = threading.Lock()
+        self.scenario = deepcopy(DEFAULT_SCENARIO)
+        self.sessions = {}
+        self.bookings = []
+        self.requests = {}
+        self.started_at = time.monotonic()
+        if scenario:
+            self.update(scenario)
+
+    def update(self, changes: dict) -> None:
+        """
+        Merges scenario changes in; facilities are merged per facility id.
+
+        Parameters:
+        - changes (dict): Partial scenario in the format of the module docstring.
+        """
+        with self.lock:
+            changes = deepcopy(changes)
+            for facility_id, facility in changes.pop("facilities", {}).items():
+                self.scenario["facilities"].setdefault(facility_id, {"times": ["08:00"]}).update(facility)
+            for key in ("latency", "errors"):
+                if key in changes:
+                    self.scenario[key].update(changes.pop(key))
+            self.scenario.update(changes)
+
+    def apply_timeline(self) -> None:
+        elapsed = time.monotonic() - self.started_at
+        with self.lock:
+            due = [event for event in self.scenario["timeline"] if event["at"] <= elapsed]
+            if not due:
+                return
+            self.scenario["timeline"] = [e for e in self.scenario["timeline"] if e["at"] > elapsed]
+        for event in due:
+            event = dict(event)
+            event.pop("at")
+            facility_id = event.pop("facility", None)
+            if facility_id is not None:
+                self.update({"facilities": {facility_id: event}})
+            else:
+                self.update(event)
+
+    def new_session(self) -> str:
+        token = secrets.token_hex(16)
+        with self.lock:
+            self.sessions[token] = time.monotonic()
+        return token
+
+    def session_valid(self, token: str | None) -> bool:
+        with self.lock:
+            started = self.sessions.get(token)
+            return started is not None and time.monotonic() - started < self.scenario["session_ttl"]
+
+    def count(self, endpoint: str) -> None:
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "scenario": deepcopy(self.scenario),
+                "bookings": list(self.bookings),
+                "requests": dict(self.requests),
+                "sessions": len(self.sessions),
+            }
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    server_version = "AisStandIn/1.0"
+
+    routes = [
+        ("GET", re.compile(r"^/users/sign_in$"), "sign_in", "get_sign_in"),
+        ("POST", re.compile(r"^/users/sign_in$"), "sign_in", "post_sign_in"),
+        ("GET", re.compile(r"^/?$"), "account", "get_root"),
+        ("GET", re.compile(r"^/groups/(\d+)$"), "account", "get_account"),
+        ("GET", re.compile(r"^/schedule/(\d+)/continue_actions$"), "continue", "get_continue"),
+        ("GET", re.compile(r"^/schedule/(\d+)/appointment$"), "appointment", "get_appointment"),
+        ("POST", re.compile(r"^/schedule/(\d+)/appointment$"), "book", "post_appointment"),
+        ("GET", re.compile(r"^/schedule/(\d+)/appointment/days/(\d+)\.json$"), "days", "get_days"),
+        ("GET", re.compile(r"^/schedule/(\d+)/appointment/times/(\d+)\.json$"), "times", "get_times"),
+        ("GET", re.compile(r"^/schedule/(\d+)/payment$"), "payment", "get_payment"),
+    ]
+
+    @property
+    def state(self) -> StandInState:
+        return self.server.state
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def dispatch(self, method: str) -> None:
+        url = urlsplit(self.path)
+        self.query = parse_qs(url.query)
+        if url.path == "/__control":
+            return self.control(method)
+        if not url.path.startswith(PREFIX):
+            return self.send_text(404, "Not found")
+        path = url.path[len(PREFIX):]
+        self.state.apply_timeline()
+        for route_method, pattern, endpoint, handler_name in self.routes:
+            match = pattern.match(path)
+            if route_method != method or not match:
+                continue
+            self.state.count(endpoint)
+            if self.inject_latency_and_errors(endpoint):
+                return
+            return getattr(self, handler_name)(*match.groups())
+        self.send_text(404, "Not found")
+
+    def inject_latency_and_errors(self, endpoint: str) -> bool:
+        scenario = self.state.scenario
+        latency = scenario["latency"].get(endpoint, scenario["latency"].get("default", 0.0))
+        if latency:
+            time.sleep(latency)
+        error = scenario["errors"].get(endpoint)
+        if error and random.random() < error.get("rate", 1.0):
+            self.send_text(error.get("status", 503), error.get("body", "System is busy"))
+            return True
+        return False
+
+    # Helpers
+
+    def read_form(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode("utf-8")
+        return {key: values[0] for key, values in parse_qs(body).items()}
+
+    def session_token(self) -> str | None:
+        for part in self.headers.get("Cookie", "").split(";"):
+            name, _, value = part.strip().partition("=")
+            if name == "_yatri_session":
+                return value
+        return None
+
+    def require_session(self) -> bool:
+        if self.state.session_valid(self.session_token()):
+            return True
+        if self.headers.get("X-Requested-With") == "XMLHttpRequest":
+            self.send_text(401, "You need to sign in or sign up before continuing.")
+        else:
+            self.redirect(f"{PREFIX}/users/sign_in")
+        return False
+
+    def send_text(self, status: int, text: str, content_type: str = "text/plain", headers: dict | None = None):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_page(self, title: str, body: str, csrf_token: str = "", headers: dict | None = None):
+        page = PAGE_TEMPLATE.format(title=title, body=body, csrf_token=csrf_token or secrets.token_hex(16))
+        self.send_text(200, page, "text/html", headers)
+
+    def send_json(self, payload) -> None:
+        self.send_text(200, json.dumps(payload), "application/json")
+
+    def redirect(self, location: str, headers: dict | None = None) -> None:
+        self.send_response(302)
+        self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def facility_dates(self, facility_id: str) -> list:
+        facility = self.state.scenario["facilities"].get(facility_id)
+        if facility is None or self.state.scenario["busy"]:
+            return []
+        return sorted(facility.get("dates", []))
+
+    # Pages and endpoints
+
+    def get_sign_in(self):
+        csrf_token = secrets.token_hex(16)
+        self.send_page("Sign In", SIGN_IN_BODY.format(prefix=PREFIX, csrf_token=csrf_token), csrf_token)
+
+    def post_sign_in(self):
+        form = self.read_form()
+        expected = self.state.scenario.get("credentials")
+        if not form.get("user[email]") or not form.get("policy_confirmed") or (
+            expected and (form.get("user[email]"), form.get("user[password]")) != tuple(expected)
+        ):
+            return self.send_text(401, "Invalid email or password.")
+        cookie = {"Set-Cookie": f"_yatri_session={self.state.new_session()}; Path=/; HttpOnly"}
+        account_url = f"{PREFIX}/groups/{self.state.scenario['user_id']}"
+        if self.headers.get("X-Requested-With") == "XMLHttpRequest":
+            return self.send_text(200, f'window.location.href = "{account_url}";', "text/javascript", cookie)
+        self.redirect(account_url, cookie)
+
+    def get_root(self):
+        if self.require_session():
+            self.redirect(f"{PREFIX}/groups/{self.state.scenario['user_id']}")
+
+    def get_account(self, user_id):
+        if self.require_session():
+            body = ACCOUNT_BODY.format(prefix=PREFIX, schedule_id=self.state.scenario["schedule_id"])
+            self.send_page("Groups", body)
+
+    def get_continue(self, schedule_id):
+        if self.require_session():
+            self.send_page("Continue", CONTINUE_BODY.format(prefix=PREFIX, schedule_id=schedule_id))
+
+    def appointment_page(self, schedule_id: str, flash: str = "") -> None:
+        options = "".join(
+            f'<option value="{fid}">{escape(facility["name"])}</option>'
+            for fid, facility in sorted(self.state.scenario["facilities"].items())
+        )
+        csrf_token = secrets.token_hex(16)
+        body = APPOINTMENT_BODY.format(
+            prefix=PREFIX, schedule_id=schedule_id, csrf_token=csrf_token,
+            facility_options=options, flash=escape(flash),
+        )
+        self.send_page("Schedule Appointments", body, csrf_token)
+
+    def get_appointment(self, schedule_id):
+        if self.require_session():
+            self.appointment_page(schedule_id)
+
+    def post_appointment(self, schedule_id):
+        if not self.require_session():
+            return
+        form = self.read_form()
+        facility_id = form.get("appointments[consulate_appointment][facility_id]")
+        slot_date = form.get("appointments[consulate_appointment][date]")
+        slot_time = form.get("appointments[consulate_appointment][time]")
+        with self.state.lock:
+            facility = self.state.scenario["facilities"].get(facility_id, {})
+            booked = bool(form.get("authenticity_token")) and slot_date in facility.get("dates", []) \
+                and slot_time in facility.get("times", [])
+            if booked:
+                facility["dates"].remove(slot_date)
+                self.state.bookings.append(
+                    {"facility_id": facility_id, "date": slot_date, "time": slot_time,
+                     "at": datetime.now().isoformat(timespec="seconds")}
+                )
+        if booked:
+            flash = f"You have successfully scheduled your visa appointment on {slot_date} {slot_time}."
+        else:
+            flash = "Your appointment could not be scheduled. The selected time is no longer available."
+        self.appointment_page(schedule_id, flash)
+
+    def get_days(self, schedule_id, facility_id):
+        if self.require_session():
+            payload = json.dumps([{"date": d, "business_day": True} for d in self.facility_dates(facility_id)])
+            if not self.state.scenario["etag"]:
+                return self.send_text(200, payload, "application/json")
+            # Like Rails' conditional GET: a weak ETag of the body, and 304 when it matches
+            etag = 'W/"' + hashlib.md5(payload.encode("utf-8")).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_text(200, payload, "application/json", {"ETag": etag})
+
+    def get_times(self, schedule_id, facility_id):
+        if not self.require_session():
+            return
+        slot_date = self.query.get("date", [""])[0]
+        times = []
+        if slot_date in self.facility_dates(facility_id):
+            times = list(self.state.scenario["facilities"][facility_id].get("times", []))
+        self.send_json({"available_times": times, "business_times": times})
+
+    def get_payment(self, schedule_id):
+        if not self.require_session():
+            return
+        rows = []
+        for facility_id, facility in sorted(self.state.scenario["facilities"].items()):
+            dates = self.facility_dates(facility_id)
+            if dates:
+                text = date.fromisoformat(dates[0]).strftime("%d %B, %Y")
+            else:
+                text = "No Appointments Available"
+            rows.append(f"<tr><td>{escape(facility['name'])}</td><td>{text}</td></tr>")
+        self.send_page("Payment", PAYMENT_BODY.format(rows="\n".join(rows)))
+
+    def control(self, method: str) -> None:
+        if method == "POST":
+            length = int(self.headers.get("Content-Length", 0))
+            self.state.update(json.loads(self.rfile.read(length) or b"{}"))
+        self.send_json(self.state.snapshot())
+
+
+class StandInServer:
+    """
+    Runs the stand-in on a background thread, for use from scripts and benchmarks.
+    """
+
+    def __init__(self, port: int = 0, scenario: dict | None = None, verbose: bool = False):
+        self.httpd = ThreadingHTTPServer(("localhost", port), StandInHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = StandInState(scenario)
+        self.httpd.verbose = verbose
+        self.thread = None
+
+    @property
+    def state(self) -> StandInState:
+        return self.httpd.state
+
+    @property
+    def base_url(self) -> str:
+        return f"http://localhost:{self.httpd.server_address[1]}{PREFIX}"
+
+    def settings_overrides(self) -> dict:
+        """
+        Returns:
+        - dict: The URL settings pointing at this server.
+        """
+        return {
+            "LOGIN_URL": f"{self.base_url}/users/sign_in",
+            "APPOINTMENT_PAGE_URL": f"{self.base_url}/schedule/{{id}}/appointment",
+            "PAYMENT_PAGE_URL": f"{self.base_url}/schedule/{{id}}/payment",
+        }
+
+    def start(self) -> "StandInServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class SmtpSinkHandler(socketserver.StreamRequestHandler):
+    """
+    Just enough SMTP to accept messages from smtplib, without TLS or auth.
+    """
+
+    def reply(self, line: str) -> None:
+        self.wfile.write((line + "\r\n").encode("utf-8"))
+
+    def handle(self):
+        self.reply("220 localhost AIS stand-in SMTP sink")
+        envelope = {"from": None, "to": []}
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command[:4].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 localhost")
+            elif verb == "MAIL":
+                envelope = {"from": command[10:].strip(), "to": []}
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                envelope["to"].append(command[8:].strip())
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line in (b".\r\n", b".\n"):
+                        break
+                    data.append(data_line.decode("utf-8", "replace"))
+                self.server.messages.append(dict(envelope, data="".join(data)))
+                if self.server.verbose:
+                    print(f"SMTP sink received mail for {envelope['to']}:\n{''.join(data)}")
+                self.reply("250 OK: queued")
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SmtpSink:
+    """
+    Runs the SMTP sink on a background thread; received messages are kept in .messages.
+    """
+
+    def __init__(self, port: int = 0, verbose: bool = True):
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer(("localhost", port), SmtpSinkHandler)
+        self.server.daemon_threads = True
+        self.server.messages = []
+        self.server.verbose = verbose
+        self.thread = None
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    @property
+    def messages(self) -> list:
+        return self.server.messages
+
+    def start(self) -> "SmtpSink":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the AIS appointment site")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--scenario", help="JSON scenario file")
+    parser.add_argument("--write-settings", action="store_true",
+                        help="point the URL settings in settings.json at this server")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    parser.add_argument("--smtp-port", type=int, help="also run an SMTP sink on this port")
+    args = parser.parse_args()
+
+    scenario = None
+    if args.scenario:
+        with open(args.scenario, 'r') as f:
+            scenario = json.load(f)
+    server = StandInServer(args.port, scenario, args.verbose)
+
+    overrides = server.settings_overrides()
+    if args.write_settings:
+        with open('settings.json', 'r') as f:
+            settings = json.load(f)
+        settings.update(overrides)
+        with open('settings.json', 'w') as f:
+            json.dump(settings, f, indent=4)
+        print("Updated settings.json")
+    print(f"Serving AIS stand-in on {server.base_url}")
+    print(json.dumps(overrides, indent=4))
+    if args.smtp_port:
+        SmtpSink(args.smtp_port).start()
+        print(f"SMTP sink listening on localhost:{args.smtp_port}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
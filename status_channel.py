@@ -0,0 +1,92 @@
+import os
+import json
+import time
+import queue
+import socket
+import threading
+
+STATUS_PORT_ENV = "RESCHEDULER_STATUS_PORT"
+
+
+class StatusReporter:
+    """
+    Streams status events from the worker to the GUI as JSON lines over a local socket.
+
+    Does nothing unless the GUI passed its port in RESCHEDULER_STATUS_PORT, and never
+    lets a missing or slow GUI interfere with the worker.
+    """
+
+    def __init__(self, port: int | None = None):
+        if port is None and os.environ.get(STATUS_PORT_ENV):
+            port = int(os.environ[STATUS_PORT_ENV])
+        self.port = port
+        self.sock = None
+        self.lock = threading.Lock()
+
+    def connect(self) -> bool:
+        if self.sock is not None:
+            return True
+        try:
+            self.sock = socket.create_connection(("127.0.0.1", self.port), timeout=1)
+            self.sock.settimeout(1)
+            return True
+        except OSError:
+            self.sock = None
+            return False
+
+    def report(self, event: str, **fields) -> None:
+        """
+        Sends one event, e.g. report("poll", earliest="2025-01-02").
+
+        Parameters:
+        - event (str): Event name.
+        - fields: JSON-serialisable details.
+        """
+        if self.port is None:
+            return
+        line = json.dumps({"event": event, "time": time.time(), **fields}, default=str) + "\n"
+        with self.lock:
+            if not self.connect():
+                return
+            try:
+                self.sock.sendall(line.encode("utf-8"))
+            except OSError:
+                self.sock.close()
+                self.sock = None
+
+
+class StatusListener:
+    """
+    GUI side of the status channel: accepts the worker's connection on an ephemeral
+    local port and puts every received event on a queue for the Tk main loop.
+    """
+
+    def __init__(self):
+        self.events = queue.Queue()
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen()
+        self.port = self.server.getsockname()[1]
+        threading.Thread(target=self.accept_loop, name="status-listener", daemon=True).start()
+
+    def accept_loop(self) -> None:
+        while True:
+            try:
+                connection, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.read_loop, args=(connection,), daemon=True).start()
+
+    def read_loop(self, connection: socket.socket) -> None:
+        with connection, connection.makefile("r", encoding="utf-8") as lines:
+            for line in lines:
+                try:
+                    self.events.put(json.loads(line))
+                except ValueError:
+                    continue
+
+    def close(self) -> None:
+        self.server.close()
+
+
+status = StatusReporter()
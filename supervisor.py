@@ -0,0 +1,317 @@
+"""
+Runs the rescheduler under supervision and reclaims the browsers it leaks.
+
+The worker (reschedule.py by default) is restarted with exponential backoff
+whenever it exits with an error, and the supervisor stops once it exits cleanly
+(a slot was booked). Every SUPERVISOR_CHECK_INTERVAL seconds the browsers listed
+in the browser registry are checked:
+
+- browsers whose worker is gone (orphans, e.g. left by DETACH) are killed;
+- a chromedriver that has not answered its /status for SUPERVISOR_HUNG_TIMEOUT
+  seconds is killed together with its Chrome;
+- beyond SUPERVISOR_MAX_BROWSERS browsers, or SUPERVISOR_MAX_RSS_MB of memory
+  across all of them, the oldest are killed first.
+
+The worker notices a killed browser as a WebDriverException and starts a new one.
+Memory figures and finding Chrome processes need psutil; without it only the
+process counts and chromedriver pids are used.
+
+Usage:
+    python supervisor.py [--worker reschedule.py]
+    python supervisor.py status [--json]
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import subprocess
+import urllib.request
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from browser_registry import read_registry, remove_entries
+from settings import get_settings
+
+
+def pid_alive(pid: int) -> bool:
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).status() != psutil.STATUS_ZOMBIE
+        except psutil.Error:
+            return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def browser_processes(driver_pid: int, entry: dict) -> list:
+    """
+    Returns:
+    - list: The live psutil processes of a browser: chromedriver, its children and the
+      Chrome pids recorded at start (which outlive chromedriver when detached).
+    """
+    if psutil is None:
+        return []
+    processes = {}
+    for pid in [driver_pid] + entry.get("browser_pids", []):
+        try:
+            process = psutil.Process(pid)
+            processes[pid] = process
+            for child in process.children(recursive=True):
+                processes[child.pid] = child
+        except psutil.Error:
+            continue
+    return list(processes.values())
+
+
+def rss_mb(processes: list) -> float:
+    total = 0
+    for process in processes:
+        try:
+            total += process.memory_info().rss
+        except psutil.Error:
+            continue
+    return total / (1024 * 1024)
+
+
+def driver_responds(service_url: str | None) -> bool:
+    if not service_url:
+        return True
+    try:
+        with urllib.request.urlopen(f"{service_url}/status", timeout=5) as response:
+            return response.status == 200
+    except OSError:
+        return False
+
+
+def handle_sigterm(signum, frame):
+    raise KeyboardInterrupt
+
+
+def kill_browser(driver_pid: int, entry: dict, reason: str) -> None:
+    """
+    Kills a chromedriver and every Chrome process belonging to it.
+    """
+    print(f"Killing browser {driver_pid} ({reason})")
+    processes = browser_processes(driver_pid, entry)
+    if processes:
+        for process in processes:
+            try:
+                process.kill()
+            except psutil.Error:
+                pass
+        psutil.wait_procs(processes, timeout=5)
+    else:
+        for pid in [driver_pid] + entry.get("browser_pids", []):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+    remove_entries([driver_pid])
+
+
+class Supervisor:
+    """
+    Keeps one worker running and its browsers within limits.
+    """
+
+    def __init__(self, worker: str):
+        self.worker = worker
+        self.process = None
+        self.started_at = None
+        self.restarts = 0
+        self.crashes = 0
+        self.killed = {}
+        # chromedriver pid to the last time it answered /status
+        self.last_seen = {}
+        self.browsers = []
+
+    def start_worker(self) -> None:
+        self.process = subprocess.Popen([sys.executable, self.worker])
+        self.started_at = time.time()
+        print(f"Started {self.worker} (pid {self.process.pid})")
+
+    def check_browsers(self) -> None:
+        """
+        Applies the orphan, hung, count and memory rules to the registered browsers.
+        """
+        settings = get_settings()
+        now = time.time()
+        browsers = []
+        for key, entry in read_registry().items():
+            driver_pid = int(key)
+            processes = browser_processes(driver_pid, entry)
+            alive = bool(processes) if psutil is not None else pid_alive(driver_pid)
+            if not alive:
+                remove_entries([driver_pid])
+                continue
+            if not pid_alive(entry.get("owner", 0)):
+                self.kill(driver_pid, entry, "orphaned")
+                continue
+            if driver_responds(entry.get("service_url")):
+                self.last_seen[driver_pid] = now
+            elif now - self.last_seen.setdefault(driver_pid, now) > settings.supervisor_hung_timeout:
+                self.kill(driver_pid, entry, "not responding")
+                continue
+            browsers.append({
+                "driver_pid": driver_pid,
+                "owner": entry.get("owner"),
+                "started_at": entry.get("started_at", now),
+                "processes": len(processes) or 1,
+                "rss_mb": round(rss_mb(processes), 1) if psutil is not None else None,
+                "entry": entry,
+            })
+
+        browsers.sort(key=lambda b: b["started_at"])
+        while len(browsers) > settings.supervisor_max_browsers:
+            oldest = browsers.pop(0)
+            self.kill(oldest["driver_pid"], oldest["entry"], "too many browsers")
+        while psutil is not None and browsers and sum(b["rss_mb"] for b in browsers) > settings.supervisor_max_rss_mb:
+            oldest = browsers.pop(0)
+            self.kill(oldest["driver_pid"], oldest["entry"], "memory limit")
+        tracked = {b["driver_pid"] for b in browsers}
+        self.last_seen = {pid: seen for pid, seen in self.last_seen.items() if pid in tracked}
+        self.browsers = browsers
+
+    def kill(self, driver_pid: int, entry: dict, reason: str) -> None:
+        kill_browser(driver_pid, entry, reason)
+        self.killed[reason] = self.killed.get(reason, 0) + 1
+
+    def worker_rss_mb(self) -> float | None:
+        if psutil is None:
+            return None
+        try:
+            worker = psutil.Process(self.process.pid)
+            return round(rss_mb([worker]), 1)
+        except psutil.Error:
+            return None
+
+    def write_status(self) -> None:
+        settings = get_settings()
+        running = self.process is not None and self.process.poll() is None
+        status = {
+            "pid": os.getpid(),
+            "updated_at": time.time(),
+            "worker": self.worker,
+            "worker_pid": self.process.pid if running else None,
+            "worker_started_at": self.started_at if running else None,
+            "worker_rss_mb": self.worker_rss_mb() if running else None,
+            "restarts": self.restarts,
+            "killed": self.killed,
+            "browsers": [{k: v for k, v in b.items() if k != "entry"} for b in self.browsers],
+            "limits": {"browsers": settings.supervisor_max_browsers, "rss_mb": settings.supervisor_max_rss_mb},
+        }
+        with open(settings.supervisor_status_file, 'w') as f:
+            json.dump(status, f, indent=4)
+
+    def restart_delay(self) -> float:
+        settings = get_settings()
+        if time.time() - self.started_at > settings.supervisor_stable_after:
+            self.crashes = 0
+        self.crashes += 1
+        return min(settings.supervisor_max_restart_delay, settings.supervisor_restart_delay * 2 ** (self.crashes - 1))
+
+    def run(self) -> int:
+        """
+        Supervises until the worker exits cleanly or the supervisor is stopped.
+
+        Returns:
+        - int: The exit code of the last worker.
+        """
+        signal.signal(signal.SIGTERM, handle_sigterm)
+        self.start_worker()
+        try:
+            while True:
+                time.sleep(get_settings().supervisor_check_interval)
+                code = self.process.poll()
+                if code == 0:
+                    # Booked: leave the browser showing the confirmation open
+                    print(f"{self.worker} finished")
+                    self.write_status()
+                    return 0
+                # After a crash, whatever the worker left behind is an orphan now
+                self.check_browsers()
+                self.write_status()
+                if code is None:
+                    continue
+                delay = self.restart_delay()
+                print(f"{self.worker} exited with code {code}, restarting in {delay:.0f}s")
+                time.sleep(delay)
+                self.restarts += 1
+                self.start_worker()
+        except KeyboardInterrupt:
+            print("Stopping")
+            self.shutdown()
+            return 1
+
+    def shutdown(self) -> None:
+        """
+        Stops the worker and kills the browsers it leaves behind.
+        """
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.check_browsers()
+        self.write_status()
+
+
+def print_status(as_json: bool) -> None:
+    try:
+        with open(get_settings().supervisor_status_file, 'r') as f:
+            status = json.load(f)
+    except (OSError, ValueError):
+        print("No supervisor status found, is supervisor.py running?")
+        return
+    if as_json:
+        print(json.dumps(status, indent=4))
+        return
+    age = time.time() - status["updated_at"]
+    state = "running" if pid_alive(status["pid"]) else "not running"
+    print(f"Supervisor {status['pid']} {state}, updated {age:.0f}s ago")
+    if status["worker_pid"]:
+        uptime = (time.time() - status["worker_started_at"]) / 60
+        memory = f", {status['worker_rss_mb']} MB" if status["worker_rss_mb"] is not None else ""
+        print(f"Worker {status['worker']} pid {status['worker_pid']}, up {uptime:.1f} min{memory}")
+    else:
+        print(f"Worker {status['worker']} not running")
+    killed = ", ".join(f"{count} {reason}" for reason, count in status["killed"].items()) or "none"
+    print(f"Restarts: {status['restarts']}, browsers killed: {killed}")
+    limits = status["limits"]
+    print(f"Browsers: {len(status['browsers'])} of at most {limits['browsers']}, limit {limits['rss_mb']:g} MB")
+    for browser in status["browsers"]:
+        memory = f"{browser['rss_mb']} MB" if browser["rss_mb"] is not None else "memory unknown"
+        age = (time.time() - browser["started_at"]) / 60
+        print(
+            f"  chromedriver {browser['driver_pid']} (worker {browser['owner']}): "
+            f"{browser['processes']} processes, {memory}, {age:.1f} min old"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the rescheduler and keep its browsers in check")
+    parser.add_argument("command", nargs="?", choices=["run", "status"], default="run")
+    parser.add_argument("--worker", default="reschedule.py", help="script to supervise")
+    parser.add_argument("--json", action="store_true", help="print the status as JSON")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        print_status(args.json)
+        return
+    sys.exit(Supervisor(args.worker).run())
+
+
+if __name__ == "__main__":
+    main()
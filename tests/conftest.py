@@ -0,0 +1,15 @@
+import os
+import sys
+import json
+import tempfile
+
+# The modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import settings  # noqa: E402
+
+# Some modules read settings.json when they are imported; give them one of their own, without metrics
+TEST_SETTINGS = os.path.join(tempfile.mkdtemp(prefix="rescheduler-tests-"), "settings.json")
+with open(TEST_SETTINGS, 'w') as f:
+    json.dump({"LATEST_ACCEPTABLE_DATE": "2099-12-31", "METRICS_ENABLED": False}, f)
+settings.watcher.path = TEST_SETTINGS
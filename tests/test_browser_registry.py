@@ -0,0 +1,26 @@
+import threading
+from types import SimpleNamespace
+
+from browser_registry import read_registry, register_browser, remove_entries
+
+
+def fake_driver(pid: int):
+    return SimpleNamespace(service=SimpleNamespace(
+        process=SimpleNamespace(pid=pid), service_url=f"http://localhost:{pid}"
+    ))
+
+
+def test_concurrent_updates_keep_every_entry(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    threads = [
+        threading.Thread(target=lambda pid=pid: [register_browser(fake_driver(pid)) for _ in range(20)])
+        for pid in range(900000, 900008)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(read_registry()) == [str(pid) for pid in range(900000, 900008)]
+
+    remove_entries([900000, 900001])
+    assert len(read_registry()) == 6
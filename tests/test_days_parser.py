@@ -0,0 +1,77 @@
+from datetime import date
+
+import pytest
+
+from days_parser import DaysParseError, DaysParser, first_acceptable_date
+
+DAYS_BODY = b'[{"date":"2025-03-02","business_day":true},{"date":"2025-01-15","business_day":true}]'
+
+
+class WindowSettings:
+    def __init__(self, earliest, latest):
+        self.earliest_acceptable_date = earliest
+        self.latest_acceptable_date = latest
+
+
+def test_first_response_is_parsed_and_sorted():
+    parser = DaysParser()
+    assert parser.request_headers() == {}
+    dates, changed = parser.parse(200, DAYS_BODY, 'W/"abc"')
+    assert dates == ["2025-01-15", "2025-03-02"]
+    assert changed
+
+
+def test_not_modified_reuses_last_dates():
+    parser = DaysParser()
+    parser.parse(200, DAYS_BODY, 'W/"abc"')
+    assert parser.request_headers() == {"If-None-Match": 'W/"abc"'}
+    dates, changed = parser.parse(304, b"", 'W/"abc"')
+    assert dates == ["2025-01-15", "2025-03-02"]
+    assert not changed
+
+
+def test_same_body_is_not_parsed_again():
+    parser = DaysParser()
+    first, _ = parser.parse(200, DAYS_BODY)
+    dates, changed = parser.parse(200, DAYS_BODY, 'W/"new"')
+    assert dates is first
+    assert not changed
+    assert parser.etag == 'W/"new"'
+
+
+def test_changed_body_is_parsed():
+    parser = DaysParser()
+    parser.parse(200, DAYS_BODY)
+    dates, changed = parser.parse(200, b'[{"date":"2025-02-01","business_day":true}]')
+    assert dates == ["2025-02-01"]
+    assert changed
+
+
+def test_empty_list():
+    assert DaysParser().parse(200, b"[]") == ([], True)
+
+
+def test_error_body_is_rejected():
+    with pytest.raises(DaysParseError):
+        DaysParser().parse(200, b'{"error":"You need to sign in or sign up before continuing."}')
+
+
+def test_truncated_body_is_rejected():
+    parser = DaysParser()
+    parser.parse(200, DAYS_BODY)
+    with pytest.raises(DaysParseError):
+        parser.parse(200, DAYS_BODY[:60])
+    assert parser.dates == ["2025-01-15", "2025-03-02"]
+
+
+def test_html_error_page_with_a_date_is_rejected():
+    body = b'<html><body><p>System is busy, try again later</p><p>"date": "2025-01-15"</p></body></html>'
+    with pytest.raises(DaysParseError):
+        DaysParser().parse(200, body)
+
+
+def test_first_acceptable_date():
+    dates = ["2025-01-15", "2025-03-02", "2025-06-30"]
+    assert first_acceptable_date(dates, WindowSettings(date(2025, 2, 1), date(2025, 4, 1))) == date(2025, 3, 2)
+    assert first_acceptable_date(dates, WindowSettings(None, date(2025, 1, 1))) is None
+    assert first_acceptable_date(dates, WindowSettings(date(2025, 4, 1), date(2025, 5, 1))) is None
@@ -0,0 +1,23 @@
+import json
+
+from metrics import Metrics
+
+
+def test_disabled_metrics_create_nothing(tmp_path):
+    metrics = Metrics(directory=str(tmp_path / "metrics"), enabled=False)
+    metrics.incr("polls_total")
+    metrics.event("session_limit", reason="max_time")
+    metrics.flush()
+    assert not (tmp_path / "metrics").exists()
+
+
+def test_events_are_appended_to_one_rotating_file(tmp_path):
+    metrics = Metrics(directory=str(tmp_path / "metrics"), enabled=True)
+    metrics.max_bytes = 1000
+    metrics.backup_count = 2
+    for number in range(100):
+        metrics.event("tick", number=number)
+    files = sorted(path.name for path in (tmp_path / "metrics").iterdir())
+    assert files == ["events.jsonl", "events.jsonl.1", "events.jsonl.2"]
+    last = (tmp_path / "metrics" / "events.jsonl").read_text().splitlines()[-1]
+    assert json.loads(last)["number"] == 99
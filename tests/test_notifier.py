@@ -0,0 +1,89 @@
+import time
+
+import pytest
+
+from notifier import Notifier, SmtpChannel
+from stand_in_server import SmtpSink
+
+
+class FlakyChannel:
+    """
+    A channel that fails its first sends, then records what it was sent.
+    """
+    name = "webhook"
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.sent = []
+
+    def send(self, slots):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("webhook unreachable")
+        self.sent.append(list(slots))
+
+
+@pytest.fixture
+def sink():
+    sink = SmtpSink(verbose=False).start()
+    yield sink
+    sink.stop()
+
+
+def smtp_channel(sink: SmtpSink) -> SmtpChannel:
+    return SmtpChannel("localhost", sink.port, "bot@localhost", ["you@localhost"], starttls=False)
+
+
+def wait_for_messages(sink: SmtpSink, count: int, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while len(sink.messages) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_slot_is_sent_once_within_the_dedup_ttl(sink):
+    notifier = Notifier(channels=[smtp_channel(sink)], batch_window=0, dedup_ttl=600)
+    assert notifier.notify("Toronto", "2025-01-02")
+    wait_for_messages(sink, 1)
+    assert not notifier.notify("Toronto", "2025-01-02")
+    notifier.stop()
+    assert len(sink.messages) == 1
+    assert "Toronto: 2025-01-02" in sink.messages[0]["data"]
+
+
+def test_slot_is_sent_again_after_the_dedup_ttl_and_old_entries_are_dropped(sink):
+    notifier = Notifier(channels=[smtp_channel(sink)], batch_window=0, dedup_ttl=0.05)
+    notifier.deliver_batch([notifier.claim("Toronto", "2025-01-02")])
+    time.sleep(0.1)
+    notifier.deliver_batch([notifier.claim("Ottawa", "2025-01-03")])
+    assert list(notifier.sent) == [("Ottawa", "2025-01-03")]
+    notifier.deliver_batch([notifier.claim("Toronto", "2025-01-02")])
+    assert len(sink.messages) == 3
+
+
+def test_slots_found_together_are_batched_into_one_message(sink):
+    notifier = Notifier(channels=[smtp_channel(sink)], batch_window=1, dedup_ttl=600)
+    assert notifier.notify("Toronto", "2025-01-02")
+    assert notifier.notify("Vancouver", "2025-01-05")
+    wait_for_messages(sink, 1)
+    notifier.stop()
+    assert len(sink.messages) == 1
+    assert "Toronto: 2025-01-02" in sink.messages[0]["data"]
+    assert "Vancouver: 2025-01-05" in sink.messages[0]["data"]
+
+
+def test_failed_channel_is_retried_without_repeating_the_others(sink):
+    flaky = FlakyChannel(failures=1)
+    notifier = Notifier(channels=[smtp_channel(sink), flaky], dedup_ttl=600, max_attempts=1)
+
+    notifier.deliver_batch([notifier.claim("Toronto", "2025-01-02")])
+    assert len(sink.messages) == 1
+    assert flaky.sent == []
+
+    # Detected again: only the channel that failed sends it
+    claim = notifier.claim("Toronto", "2025-01-02")
+    assert claim == (("Toronto", "2025-01-02"), ("webhook",))
+    notifier.deliver_batch([claim])
+    assert len(sink.messages) == 1
+    assert flaky.sent == [[("Toronto", "2025-01-02")]]
+
+    assert notifier.claim("Toronto", "2025-01-02") is None
@@ -0,0 +1,87 @@
+from datetime import date
+
+import pytest
+
+from facilities import FACILITY_IDS
+from payment_parser import parse_payment_date, parse_payment_page
+
+# Shaped like the payment page of the AIS site, with a second table outside the layout
+# table that must be ignored
+PAYMENT_PAGE = """
+<html><body>
+<div class="card">
+  <h3>Consular Appointment</h3>
+  <table class="for-layout">
+    <tr>
+      <td class="text-right">Toronto</td>
+      <td class="text-right">
+        02 January, 2025
+      </td>
+    </tr>
+    <tr>
+      <td class="text-right">Ottawa</td>
+      <td class="text-right">No Appointments Available</td>
+    </tr>
+    <tr>
+      <td class="text-right">Winnipeg</td>
+      <td class="text-right">15 March, 2025</td>
+    </tr>
+  </table>
+  <table class="fees"><tr><td>Fee</td><td>185 USD</td></tr></table>
+</div>
+</body></html>
+"""
+
+
+# A location cell holding a table of its own, whose cells are not locations or dates
+NESTED_TABLE_PAGE = """
+<table class="for-layout">
+  <tr>
+    <td class="text-right">
+      Toronto
+      <table class="address"><tr><td>225 Simcoe St</td><td>M5G 1S4</td></tr></table>
+    </td>
+    <td class="text-right">02 January, 2025</td>
+  </tr>
+  <tr>
+    <td class="text-right">Ottawa</td>
+    <td class="text-right">No Appointments Available</td>
+  </tr>
+</table>
+<table><tr><td>Fee</td><td>185 USD</td></tr></table>
+"""
+
+
+def test_parse_payment_page_pairs_locations_with_dates():
+    assert parse_payment_page(PAYMENT_PAGE) == [
+        ("Toronto", "02 January, 2025"),
+        ("Ottawa", "No Appointments Available"),
+        ("Winnipeg", "15 March, 2025"),
+    ]
+
+
+def test_table_nested_in_a_location_cell_is_ignored():
+    assert parse_payment_page(NESTED_TABLE_PAGE) == [
+        ("Toronto", "02 January, 2025"),
+        ("Ottawa", "No Appointments Available"),
+    ]
+
+
+def test_unknown_city_is_parsed_but_has_no_facility():
+    cities = [city for city, _ in parse_payment_page(PAYMENT_PAGE)]
+    assert "Winnipeg" in cities
+    assert "Winnipeg" not in FACILITY_IDS
+
+
+def test_parse_payment_page_without_layout_table():
+    assert parse_payment_page("<html><body><p>System is busy</p></body></html>") == []
+
+
+def test_parse_payment_date():
+    assert parse_payment_date("02 January, 2025") == date(2025, 1, 2)
+    assert parse_payment_date("No Appointments Available") is None
+
+
+def test_parse_payment_date_rejects_unknown_text():
+    with pytest.raises(ValueError):
+        parse_payment_date("Closed")
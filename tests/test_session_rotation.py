@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+import session_rotation
+from session_rotation import SessionRotator
+from settings import Settings
+
+
+class FakeSession:
+    """
+    Stands in for AisSession; sign ins succeed at once and are counted.
+    """
+    logins = []
+
+    def __init__(self):
+        self.closed = False
+
+    def resume(self):
+        return False
+
+    def login(self):
+        FakeSession.logins.append(time.monotonic())
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def rotation(monkeypatch):
+    def configure(**values):
+        current = Settings({
+            "LATEST_ACCEPTABLE_DATE": "2099-12-31", "METRICS_ENABLED": False,
+            "DATE_REQUEST_MAX_TIME": 3600, "DATE_REQUEST_DELAY": 1, **values,
+        })
+        monkeypatch.setattr(session_rotation, "get_settings", lambda: current)
+    FakeSession.logins = []
+    monkeypatch.setattr(session_rotation, "AisSession", FakeSession)
+    return configure
+
+
+def poll(rotator: SessionRotator):
+    session, tracker = rotator.current()
+    if session is not None:
+        assert tracker.retries <= tracker.max_retries, "polled a session past its limits"
+        tracker.retry()
+    return session
+
+
+def test_replacement_signs_in_ahead_and_takes_over_without_a_pause(rotation):
+    rotation(DATE_REQUEST_MAX_RETRY=10, ROTATION_LEAD_TIME=2, MIN_RELOGIN_INTERVAL=0)
+    rotator = SessionRotator()
+    assert rotator.start()
+    first = rotator.session
+    sessions = [poll(rotator) for _ in range(11)]
+    assert len(FakeSession.logins) == 2
+    assert set(sessions) == {first}
+    # The old session had requests left when the replacement was signed in
+    deadline = time.monotonic() + 2
+    while rotator.standby is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert poll(rotator) is not first
+    assert first.closed
+    assert not rotator.paused
+    rotator.close()
+
+
+def test_exhausted_session_is_not_polled_while_relogin_is_held_back(rotation):
+    rotation(DATE_REQUEST_MAX_RETRY=3, ROTATION_LEAD_TIME=0, MIN_RELOGIN_INTERVAL=1)
+    rotator = SessionRotator()
+    assert rotator.start()
+    first = rotator.session
+    for _ in range(4):
+        assert poll(rotator) is first
+    started = time.monotonic()
+    assert poll(rotator) is not first
+    # Waited for MIN_RELOGIN_INTERVAL instead of polling on
+    assert time.monotonic() - started > 0.5
+    assert FakeSession.logins[1] - FakeSession.logins[0] >= 1
+    assert not rotator.paused
+    rotator.close()
+
+
+def test_close_stops_waiting_for_the_replacement(rotation):
+    rotation(DATE_REQUEST_MAX_RETRY=1, ROTATION_LEAD_TIME=0, MIN_RELOGIN_INTERVAL=600)
+    rotator = SessionRotator()
+    assert rotator.start()
+    poll(rotator)
+    poll(rotator)
+    threading.Timer(0.2, rotator.close).start()
+    assert rotator.current() == (None, None)
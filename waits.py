@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+from metrics import metrics
+from settings import get_settings
+
+if TYPE_CHECKING:
+    from selenium.webdriver.remote.webdriver import WebDriver
+
+PAGE_READY_SCRIPT = (
+    "return document.readyState === 'complete'"
+    " && (typeof jQuery === 'undefined' || jQuery.active === 0);"
+)
+
+
+def wait_for_page_ready(driver: WebDriver, timeout: int | None = None) -> None:
+    """
+    Waits until the document has loaded and no jQuery ajax request is in flight.
+
+    Parameters:
+    - driver (WebDriver): A Selenium WebDriver instance controlling the browser.
+    - timeout (int | None): Upper bound in seconds, PAGE_READY_TIMEOUT by default.
+
+    Raises:
+    - TimeoutException: If the page is not ready within the timeout.
+    """
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    if timeout is None:
+        timeout = get_settings().page_ready_timeout
+    WebDriverWait(driver, timeout).until(lambda d: d.execute_script(PAGE_READY_SCRIPT))
+
+
+def wait_for_select_options(driver: WebDriver, locator: tuple, timeout: int | None = None):
+    """
+    Waits until a select element has at least one option with a value, e.g. the
+    appointment time select after a date was picked.
+
+    Parameters:
+    - driver (WebDriver): A Selenium WebDriver instance controlling the browser.
+    - locator (tuple): (By, value) of the select element.
+    - timeout (int | None): Upper bound in seconds, TIME_SLOT_TIMEOUT by default.
+
+    Returns:
+    - WebElement: The populated select element.
+
+    Raises:
+    - TimeoutException: If no option appears within the timeout.
+    """
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    if timeout is None:
+        timeout = get_settings().time_slot_timeout
+
+    def populated(d):
+        element = d.find_element(*locator)
+        for option in element.find_elements("tag name", "option"):
+            if option.get_attribute("value"):
+                return element
+        return False
+
+    return WebDriverWait(driver, timeout).until(populated)
+
+
+@contextmanager
+def timed_step(name: str):
+    """
+    Prints how long the wrapped step took and records it as a "step" span.
+
+    Parameters:
+    - name (str): Step name shown in the output.
+    """
+    start = time.perf_counter()
+    try:
+        with metrics.span("step", step=name):
+            yield
+    finally:
+        print(f"[timing] {name}: {time.perf_counter() - start:.2f}s")